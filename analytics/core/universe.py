@@ -1,6 +1,21 @@
 from __future__ import annotations
 import MDAnalysis as mda
-from analytics.metadynamics.free_energy import FreeEnergySpace
+import numpy as np
+import pandas as pd
+from analytics.metadynamics.free_energy import FreeEnergySpace, FreeEnergyLine, FreeEnergySurface
+from analytics.laws_and_constants import Kb
+
+
+def _log_sum_exp(values: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    Function to get the log of the sum of the exponentials of some values without overflowing
+    :param values: the values
+    :param axis: the axis to sum over
+    :return: the log of the sum
+    """
+    top = np.max(values, axis=axis, keepdims=True)
+    top = np.where(np.isfinite(top), top, 0)
+    return np.squeeze(np.log(np.exp(values - top).sum(axis=axis, keepdims=True)) + top, axis=axis)
 
 
 class Universe:
@@ -30,3 +45,206 @@ class Universe:
             self._mdu = mda.Universe(tpr_file, xtc_file)
         else:
             self._mdu = None
+
+        # the spaces and the free energies of the states from the last time the mbar equations were solved for each
+        # energy column, to start the next solve for the same spaces from
+        self._state_free_energies = {}
+        self._mbar_iterations = None
+
+    def _get_frames(self, cvs: list[str], energy_column: str = None, conditions: str | list[str] = None
+                    ) -> pd.DataFrame:
+        """
+        Function to get the frames of all the trajectories of all the free energy spaces, with the space each frame
+        came from as its state
+        :param cvs: the cvs to get
+        :param energy_column: the column with the potential energy of each frame
+        :param conditions: conditions that will be applied to the frames
+        :return: data frame with the frames
+        """
+        if not self._fes:
+            raise ValueError("There are no free energy spaces in this universe")
+
+        columns = cvs + ([] if energy_column is None else [energy_column])
+        frames, states = [], []
+        for state, space in enumerate(self._fes):
+            if not space.trajectories:
+                raise ValueError("Every free energy space needs trajectories to combine them")
+            for t in space.trajectories.values():
+                for chunk in t.iter_chunks(t.get_columns(columns, conditions)):
+                    frames.append(chunk)
+                    states.append(np.full(chunk.shape[0], state))
+
+        frames = pd.concat(frames, ignore_index=True)
+        frames['state'] = np.concatenate(states)
+        return frames.loc[frames['weight'] > 0].reset_index(drop=True)
+
+    def _get_reduced_potentials(self, frames: pd.DataFrame, temperatures: list[float],
+                                energy_column: str = None) -> np.ndarray:
+        """
+        Function to get the reduced potential of every frame at some temperatures
+        :param frames: the frames
+        :param temperatures: the temperatures
+        :param energy_column: the column with the potential energy of each frame
+        :return: array with a row for each temperature and a column for each frame
+        """
+        if energy_column is None:
+            if len(set(temperatures + [s.temperature for s in self._fes])) > 1:
+                raise ValueError("The potential energy column is needed to combine or reweight between temperatures")
+            return np.zeros((len(temperatures), frames.shape[0]))
+
+        return frames[energy_column].to_numpy()[None, :] / (Kb * np.array(temperatures)[:, None])
+
+    @staticmethod
+    def _get_sample_log_weights(frames: pd.DataFrame, n_states: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to scale the reweighting weights of the frames of each state so they add up to the effective number
+        of frames of that state, which is how much the state is trusted in the combined estimate
+        :param frames: the frames, with their weight and state
+        :param n_states: the number of states
+        :return: the log of the scaled weight of each frame, and the log of the effective number of frames of each state
+        """
+        state = frames['state'].to_numpy()
+        log_weight = np.log(frames['weight'].to_numpy())
+        log_total = np.array([_log_sum_exp(log_weight[state == k]) for k in range(0, n_states)])
+        log_total_squared = np.array([_log_sum_exp(2 * log_weight[state == k]) for k in range(0, n_states)])
+        log_n_effective = 2 * log_total - log_total_squared
+
+        return log_weight - log_total[state] + log_n_effective[state], log_n_effective
+
+    @staticmethod
+    def _solve_mbar(log_weight: np.ndarray, log_n: np.ndarray, reduced_potential: np.ndarray,
+                    free_energies: np.ndarray = None, tolerance: float = 1e-10, max_iterations: int = 200
+                    ) -> tuple[np.ndarray, int]:
+        """
+        Function to solve the mbar equations for the dimensionless free energies of the states, with weighted frames.
+        Newton steps are taken on the convex mbar objective, all in log space and vectorised over the frames, with the
+        step halved until the objective goes down.
+        :param log_weight: the log of the scaled weight of each frame
+        :param log_n: the log of the effective number of frames of each state
+        :param reduced_potential: the reduced potential of each frame in each state, with a row for each state
+        :param free_energies: the free energies to start from
+        :param tolerance: the largest change in the free energies to stop at
+        :param max_iterations: the largest number of newton steps to take
+        :return: the free energies relative to the first state, and the number of steps taken
+        """
+        weight = np.exp(log_weight)
+        f = np.zeros(log_n.shape[0]) if free_energies is None else free_energies - free_energies[0]
+
+        def objective(f: np.ndarray) -> tuple[float, np.ndarray]:
+            log_denominator = _log_sum_exp(log_n[:, None] + f[:, None] - reduced_potential)
+            return weight @ log_denominator - np.exp(log_n) @ f, log_denominator
+
+        value, log_denominator = objective(f)
+        for iteration in range(0, max_iterations):
+            probability = np.exp(log_n[:, None] + f[:, None] - reduced_potential - log_denominator[None, :])
+            gradient = probability @ weight - np.exp(log_n)
+            hessian = np.diag(probability @ weight) - (probability * weight) @ probability.T
+            step = np.zeros(f.shape[0])
+            step[1:] = -np.linalg.lstsq(hessian[1:, 1:], gradient[1:], rcond=None)[0]
+            if np.abs(step).max() < tolerance:
+                return f, iteration
+
+            scale = 1
+            new_value, new_log_denominator = objective(f + step)
+            while new_value > value and scale > 1e-6:
+                scale /= 2
+                new_value, new_log_denominator = objective(f + scale * step)
+            f, value, log_denominator = f + scale * step, new_value, new_log_denominator
+
+        return f, max_iterations
+
+    def get_state_free_energies(self, energy_column: str = None, tolerance: float = 1e-10,
+                                max_iterations: int = 200) -> np.ndarray:
+        """
+        Function to get the dimensionless free energies (-log Z) of the free energy spaces of the universe relative to
+        the first one, by solving the mbar equations with the reweighted frames of every space. The solution is kept,
+        and used to start the next solve for the same spaces, for example after the trajectories are refreshed.
+        :param energy_column: the column with the potential energy of each frame, needed when the spaces have
+        different temperatures
+        :param tolerance: the largest change in the free energies to stop at
+        :param max_iterations: the largest number of newton steps to take
+        :return: the free energy of each space
+        """
+        frames = self._get_frames([], energy_column)
+        return self._solve_states(frames, energy_column, tolerance, max_iterations)[0]
+
+    def _solve_states(self, frames: pd.DataFrame, energy_column: str = None, tolerance: float = 1e-10,
+                      max_iterations: int = 200) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Function to solve the mbar equations for some frames, starting from the last solution for the same spaces
+        :param frames: the frames of all the spaces
+        :param energy_column: the column with the potential energy of each frame
+        :param tolerance: the largest change in the free energies to stop at
+        :param max_iterations: the largest number of newton steps to take
+        :return: the free energies of the states, the log of the scaled frame weights and the log of the mbar
+        denominator of each frame
+        """
+        temperatures = [s.temperature for s in self._fes]
+        reduced_potential = self._get_reduced_potentials(frames, temperatures, energy_column)
+        log_weight, log_n = self._get_sample_log_weights(frames, len(self._fes))
+
+        spaces, last_free_energies = self._state_free_energies.get(energy_column, ([], None))
+        same_spaces = len(spaces) == len(self._fes) and all(a is b for a, b in zip(spaces, self._fes))
+        free_energies, self._mbar_iterations = self._solve_mbar(log_weight, log_n, reduced_potential,
+                                                                last_free_energies if same_spaces else None,
+                                                                tolerance, max_iterations)
+        self._state_free_energies[energy_column] = (list(self._fes), free_energies)
+        log_denominator = _log_sum_exp(log_n[:, None] + free_energies[:, None] - reduced_potential)
+
+        return free_energies, log_weight, log_denominator
+
+    def _get_combined_data(self, cvs: list[str], temperature: float, energy_column: str = None,
+                           conditions: str | list[str] = None) -> pd.DataFrame:
+        """
+        Function to get the frames of all the spaces with their mbar weight at a temperature
+        :param cvs: the cvs to get
+        :param temperature: the temperature to get the weights at
+        :param energy_column: the column with the potential energy of each frame
+        :param conditions: conditions that will be applied to the frames
+        :return: data frame with the frames and their weights
+        """
+        frames = self._get_frames(cvs, energy_column, conditions)
+        _, log_weight, log_denominator = self._solve_states(frames, energy_column)
+        target_potential = self._get_reduced_potentials(frames, [temperature], energy_column)[0]
+        log_combined = log_weight - target_potential - log_denominator
+
+        return frames.assign(weight=np.exp(log_combined - log_combined.max()))
+
+    def get_combined_line(self, cv: str, bins: int | list[int | float] = 200, temperature: float = None,
+                          energy_column: str = None, conditions: str | list[str] = None) -> FreeEnergyLine:
+        """
+        Function to get one free energy line from the trajectories of all the free energy spaces, combined with mbar
+        :param cv: the cv in which to get the line
+        :param bins: number of bins, or a list with the bin boundaries
+        :param temperature: temperature to get the line at, defaults to that of the first space
+        :param energy_column: the column with the potential energy of each frame, needed when the spaces have
+        different temperatures
+        :param conditions: some query style conditions to put on the histogram
+        :return: a free energy line
+        """
+        temperature = self._fes[0].temperature if temperature is None and self._fes else temperature
+        data = (FreeEnergySpace
+                ._reweight_traj_data(self._get_combined_data([cv], temperature, energy_column, conditions), cv, bins,
+                                     temperature=temperature, conditions=conditions)
+                .filter([cv, 'energy', 'population'])
+                )
+
+        return FreeEnergyLine(data, temperature=temperature)
+
+    def get_combined_surface(self, cvs: list[str, str], bins: list[int, int], temperature: float = None,
+                             energy_column: str = None, conditions: str | list[str] = None) -> FreeEnergySurface:
+        """
+        Function to get one free energy surface from the trajectories of all the free energy spaces, combined with mbar
+        :param cvs: list with the two cvs. The first will go on the x-axis, the second on the y-axis
+        :param bins: list with two integers for the number of bins in each CV
+        :param temperature: temperature to get the surface at, defaults to that of the first space
+        :param energy_column: the column with the potential energy of each frame, needed when the spaces have
+        different temperatures
+        :param conditions: conditions to apply to the reweighting
+        :return: a free energy surface
+        """
+        temperature = self._fes[0].temperature if temperature is None and self._fes else temperature
+        data = FreeEnergySpace._reweight_traj_data(self._get_combined_data(cvs, temperature, energy_column, conditions),
+                                                   cvs, bins, temperature=temperature, conditions=conditions)
+
+        return FreeEnergySurface(data, temperature=temperature)
@@ -1,30 +1,609 @@
 from __future__ import annotations
 import pandas as pd
 import numpy as np
+import bz2
+import gzip
+import io
+import lzma
+import mmap
 import os
+import re
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
 import plotly.graph_objects as go
 import plotly.express as px
 from pandas import DataFrame
+from scipy.interpolate import RectBivariateSpline
+from scipy.spatial import cKDTree
 from visualisation.themes import custom_dark_template
 from analytics.laws_and_constants import boltzmann_energy_to_population, Kb, boltzmann_population_to_energy
 pd.set_option('mode.chained_assignment', None)
 
 
+def _open_zstd(file: str, mode: str = 'rb'):
+    """
+    Function to open a zstd compressed file as a stream. zstandard is an optional dependency, so it is only imported
+    when a zstd file is read
+    :param file: the compressed file
+    :param mode: mode to open the file in, only 'rb' is supported
+    :return: the decompressed stream
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"{file} is zstd compressed, install zstandard to read it") from None
+
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(file, mode), closefd=True))
+
+
+_compression_openers = {b'\x1f\x8b': gzip.open, b'BZh': bz2.open, b'\xfd7zXZ\x00': lzma.open,
+                        b'\x28\xb5\x2f\xfd': _open_zstd}
+
+
+def _get_opener(file: str):
+    """
+    Function to work out from its first bytes whether a file is compressed, and so how to open it
+    :param file: the file
+    :return: the function to open the compressed file with, or None if the file is not compressed
+    """
+    with open(file, 'rb') as f:
+        start = f.read(6)
+
+    for magic, opener in _compression_openers.items():
+        if start.startswith(magic):
+            return opener
+
+    return None
+
+
+def _open_plumed_file(file: str):
+    """
+    Function to open a plumed file that may be gzip, bz2, xz or zstd compressed. Compressed files are decompressed as
+    they are read, nothing is written to disk.
+    :param file: the file
+    :return: binary stream of the file contents
+    """
+    opener = _get_opener(file)
+    return open(file, 'rb') if opener is None else opener(file, 'rb')
+
+
+def _read_fields(file: str) -> list[str]:
+    """
+    Function to read the column names from the FIELDS header of a plumed file
+    :param file: file to read
+    :return: list of column names
+    """
+    with _open_plumed_file(file) as col_file:
+        col_names = col_file.readline().decode().strip().split(" ")[2:]
+    return col_names
+
+
+def _read_sets(file: str) -> dict[str, float | str]:
+    """
+    Function to read the SET lines from the header of a plumed file
+    :param file: file to read
+    :return: dictionary with the value of each SET line, as a float if it is a number
+    """
+    sets = {}
+    with _open_plumed_file(file) as f:
+        for line in f:
+            if not line.startswith(b'#!'):
+                break
+            words = line.decode().split()
+            if words[1] == 'SET':
+                try:
+                    sets[words[2]] = float(words[3])
+                except ValueError:
+                    sets[words[2]] = words[3]
+
+    return sets
+
+
+def _get_line_end(file: str, size: int) -> int:
+    """
+    Function to get the byte offset just after the last complete line in the first size bytes of a file
+    :param file: the file
+    :param size: number of bytes of the file to look at
+    :return: the byte offset. For a compressed file, which is a finished run, this is the size.
+    """
+    if _get_opener(file) is not None:
+        return size
+
+    with open(file, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            position = start
+
+    return 0
+
+
+def _has_partial_row(file: str, offset: int, size: int) -> bool:
+    """
+    Function to check if there is a row of data after the last complete line of a file, which is either the last row
+    of a finished file without a trailing newline, or a line plumed is still writing
+    :param file: the file
+    :param offset: the byte offset just after the last complete line
+    :param size: the size of the file when it was read
+    :return: True if there is a row after the last complete line
+    """
+    if offset >= size:
+        return False
+
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        tail = f.read(size - offset).strip()
+
+    return len(tail) > 0 and not tail.startswith(b'#')
+
+
+def _read_last_fields(file: str, end: int) -> list[str]:
+    """
+    Function to read the column names from the last FIELDS header before a byte offset of a plumed file. When a run is
+    restarted plumed writes a new header partway through the file.
+    :param file: the uncompressed plumed file
+    :param end: byte offset to look for the header before
+    :return: list of column names
+    """
+    with open(file, 'rb') as f:
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            header = f.read(position - start + 9).rfind(b'\n#! FIELDS', 0, position - start + 9)
+            if header != -1:
+                f.seek(start + header + 1)
+                return f.readline().decode().strip().split(" ")[2:]
+            position = start
+
+    return _read_fields(file)
+
+
+def _parse_segments(text: bytes | mmap.mmap, names: list[str] = None) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Function to parse the text of a plumed file in one pass. Each FIELDS header starts a new segment, which is parsed
+    with the column names of its header, and the segments are put together matching the columns by name. Columns that
+    are not in every segment are NaN where they are missing.
+    :param text: the text of the file
+    :param names: column names for any rows before the first header
+    :return: the rows of the file, and the column names of the last segment
+    """
+    headers = [0] if text[:9] == b'#! FIELDS' else []
+    position = text.find(b'\n#! FIELDS')
+    while position != -1:
+        headers.append(position + 1)
+        position = text.find(b'\n#! FIELDS', position + 1)
+
+    starts = [0] + [h for h in headers if h > 0]
+    segments = []
+    for start, stop in zip(starts, starts[1:] + [len(text)]):
+        if start in headers:
+            names = bytes(text[start:text.find(b'\n', start)]).decode().strip().split(" ")[2:]
+        segment = text if len(starts) == 1 else text[start:stop]
+        segment = segment if isinstance(segment, mmap.mmap) else io.BytesIO(segment)
+        segments.append(pd.read_table(segment, sep='\s+', comment="#", names=names, dtype=np.float64))
+
+    data = segments[0] if len(segments) == 1 else pd.concat(segments, ignore_index=True)
+    return data, names
+
+
+def _read_rows(file: str, size: int = None) -> pd.DataFrame:
+    """
+    Function to read the rows of a plumed file, which may be compressed and may have been restarted
+    :param file: the plumed file
+    :param size: number of bytes of an uncompressed file to read, so that anything plumed appends after the size was
+    measured is left for the next read. None to read the whole file.
+    :return: the rows of the file
+    """
+    uncompressed = _get_opener(file) is None
+    size = os.path.getsize(file) if size is None and uncompressed else size
+    if uncompressed and size > 0:
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as text:
+            return _parse_segments(text)[0]
+
+    with _open_plumed_file(file) as f:
+        text = f.read(size) if uncompressed else f.read()
+
+    return _parse_segments(text)[0]
+
+
+def _read_appended_rows(file: str, names: list[str] | None, offset: int) -> tuple[pd.DataFrame, int, list[str]]:
+    """
+    Function to read the complete rows that have been written to a plumed file after a byte offset. A partly written
+    last line is left for the next read.
+    :param file: the plumed file
+    :param names: the column names of the rows after the offset, None to read them from the last header before it
+    :param offset: the byte offset to read from
+    :return: the new rows, the byte offset to read from next time and the column names of the rows after that
+    """
+    if os.path.getsize(file) < offset:
+        raise ValueError(f"{file} is shorter than when it was last read, it has been overwritten!")
+
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        text = f.read()
+
+    end = text.rfind(b'\n') + 1
+    if end == 0:
+        return pd.DataFrame(), offset, names
+
+    names = _read_last_fields(file, offset) if names is None else names
+    data, names = _parse_segments(text[:end], names)
+    return data, offset + end, names
+
+
+def _sum_kernels(points: np.ndarray, centers: np.ndarray, sigmas: np.ndarray, heights: np.ndarray, cutoff: float,
+                 batch_size: int = 256) -> np.ndarray:
+    """
+    Function to sum truncated gaussian kernels, h(exp(-d^2/2) - exp(-cutoff^2/2)) for d < cutoff where d is the
+    distance in sigmas, at some points. The points are put in order of the cells of a coarse grid, so that each batch
+    of points is close together and is only compared with the kernels whose cutoff reaches the box around the batch.
+    :param points: the points, one row per point with a column for each cv
+    :param centers: the kernel centers, one row per kernel
+    :param sigmas: the kernel sigmas, one row per kernel
+    :param heights: the kernel heights
+    :param cutoff: the distance in sigmas at which the kernels are cut off
+    :param batch_size: number of points in each batch
+    :return: the sum of the kernels at each point
+    """
+    val_at_cutoff = np.exp(-0.5 * cutoff**2)
+    reach = cutoff * sigmas
+    cells = np.floor((points - points.min(axis=0)) / np.median(reach, axis=0)).astype(np.int64)
+    order = np.lexsort(cells.T[::-1])
+    total = np.zeros(points.shape[0])
+
+    for start in range(0, points.shape[0], batch_size):
+        batch = points[order[start:start + batch_size]]
+        near = ((centers + reach >= batch.min(axis=0)) & (centers - reach <= batch.max(axis=0))).all(axis=1)
+        near = np.nonzero(near)[0]
+        norm2 = (((batch[:, None, :] - centers[None, near, :]) / sigmas[None, near, :])**2).sum(axis=2)
+        values = np.where(norm2 < cutoff**2, np.exp(-0.5 * norm2) - val_at_cutoff, 0)
+        total[order[start:start + batch_size]] = values @ heights[near]
+
+    return total
+
+
+def _sum_kernels_on_grid(axes: list[np.ndarray], centers: np.ndarray, sigmas: np.ndarray, heights: np.ndarray,
+                         cutoff: float, batch_elements: int = 2**21) -> np.ndarray:
+    """
+    Function to sum truncated gaussian kernels, as in _sum_kernels, on a grid. Each kernel is only evaluated on the box
+    of grid points within the cutoff of its center, and kernels with boxes of a similar size are evaluated together in
+    batches.
+    :param axes: the grid points along each cv
+    :param centers: the kernel centers, one row per kernel
+    :param sigmas: the kernel sigmas, one row per kernel
+    :param heights: the kernel heights
+    :param cutoff: the distance in sigmas at which the kernels are cut off
+    :param batch_elements: roughly the number of kernel values worked out in each batch
+    :return: the sum of the kernels at each grid point, as an array with a dimension for each cv
+    """
+    val_at_cutoff = np.exp(-0.5 * cutoff**2)
+    shape = [a.shape[0] for a in axes]
+    strides = [int(np.prod(shape[i + 1:])) for i in range(len(shape))]
+    starts = np.stack([np.searchsorted(a, centers[:, i] - cutoff * sigmas[:, i]) for i, a in enumerate(axes)], axis=1)
+    widths = np.stack([np.searchsorted(a, centers[:, i] + cutoff * sigmas[:, i], side='right')
+                       for i, a in enumerate(axes)], axis=1) - starts
+    volumes = widths.prod(axis=1)
+    order = np.argsort(volumes, kind='stable')
+    order = order[volumes[order] > 0]
+    total = np.zeros(int(np.prod(shape)))
+
+    first = 0
+    while first < order.shape[0]:
+        last = min(order.shape[0], first + max(1, batch_elements // volumes[order[first]]))
+        while last - first > 1 and (last - first) * volumes[order[last - 1]] > batch_elements:
+            last = first + (last - first) // 2
+        batch = order[first:last]
+        norm2, index = 0, 0
+        for i, a in enumerate(axes):
+            # the points along this cv in the box of each kernel, padded to the widest box in the batch
+            offsets = np.arange(widths[batch, i].max())
+            points = starts[batch, i, None] + offsets
+            inside = offsets < widths[batch, i, None]
+            points = np.where(inside, points, 0)
+            dist2 = np.where(inside, ((a[points] - centers[batch, i, None]) / sigmas[batch, i, None])**2, np.inf)
+            view = [batch.shape[0]] + [1] * len(axes)
+            view[i + 1] = offsets.shape[0]
+            norm2 = norm2 + dist2.reshape(view)
+            index = index + (points * strides[i]).reshape(view)
+        values = np.where(norm2 < cutoff**2, np.exp(-0.5 * norm2) - val_at_cutoff, 0)
+        values = values * heights[batch].reshape([-1] + [1] * len(axes))
+        index, values = np.broadcast_arrays(index, values)
+        total += np.bincount(index.ravel(), weights=values.ravel(), minlength=total.shape[0])
+        first = last
+
+    return total.reshape(shape)
+
+
+def _get_bin_index(values: np.ndarray, edges: list[np.ndarray]) -> np.ndarray:
+    """
+    Function to get the flat index of the histogram bin that each frame falls in, following the numpy histogram
+    convention that the last bin includes its right edge
+    :param values: the cv values, with one row per frame and a column for each cv
+    :param edges: the bin edges for each cv
+    :return: the flat bin index of each frame, with -1 for the frames outside the bins
+    """
+    index = np.zeros(values.shape[0], dtype=np.int64)
+    inside = np.ones(values.shape[0], dtype=bool)
+    for i, e in enumerate(edges):
+        cv_index = np.searchsorted(e, values[:, i], side='right') - 1
+        cv_index[values[:, i] == e[-1]] = len(e) - 2
+        inside &= (cv_index >= 0) & (cv_index < len(e) - 1)
+        index = index * (len(e) - 1) + cv_index
+
+    return np.where(inside, index, -1)
+
+
+def _linear_binning(values: np.ndarray, weights: np.ndarray, axes: list[np.ndarray]) -> np.ndarray:
+    """
+    Function to spread the weight of each frame over the corners of the grid cell it is in, in proportion to how close
+    it is to each corner
+    :param values: the cv values, with one row per frame and a column for each cv
+    :param weights: the weight of each frame
+    :param axes: the evenly spaced grid points along each cv
+    :return: the binned weights, with a dimension for each cv
+    """
+    shape = [a.shape[0] for a in axes]
+    lower, fraction = [], []
+    for i, a in enumerate(axes):
+        position = np.clip((values[:, i] - a[0]) / (a[1] - a[0]), 0, a.shape[0] - 1)
+        cell = np.minimum(np.floor(position).astype(np.int64), a.shape[0] - 2)
+        lower.append(cell)
+        fraction.append(position - cell)
+
+    counts = np.zeros(int(np.prod(shape)))
+    for corner in np.ndindex(*[2] * len(axes)):
+        index, corner_weights = 0, weights
+        for i, c in enumerate(corner):
+            index = index * shape[i] + lower[i] + c
+            corner_weights = corner_weights * (fraction[i] if c else 1 - fraction[i])
+        counts += np.bincount(index, weights=corner_weights, minlength=counts.shape[0])
+
+    return counts.reshape(shape)
+
+
+def _gaussian_smooth(counts: np.ndarray, bandwidth: list[float]) -> np.ndarray:
+    """
+    Function to convolve binned weights with a gaussian kernel using FFTs. The kernel is cut off at four bandwidths,
+    and the grid is padded so the convolution does not wrap around.
+    :param counts: the binned weights, with a dimension for each cv
+    :param bandwidth: the bandwidth of the kernel along each cv, in grid spacings
+    :return: the smoothed weights, with the same shape as counts
+    """
+    reach = [int(min(n - 1, np.ceil(4 * h))) for n, h in zip(counts.shape, bandwidth)]
+    kernel = 1
+    for i, (r, h) in enumerate(zip(reach, bandwidth)):
+        view = [1] * counts.ndim
+        view[i] = -1
+        kernel = kernel * np.exp(-0.5 * (np.arange(-r, r + 1) / h)**2).reshape(view)
+
+    padded = [n + 2 * r for n, r in zip(counts.shape, reach)]
+    smoothed = np.fft.irfftn(np.fft.rfftn(counts, padded) * np.fft.rfftn(kernel, padded), padded)
+    return smoothed[tuple(slice(r, r + n) for n, r in zip(counts.shape, reach))]
+
+
+def _compile_conditions(conditions: str | list[str] = None) -> str | None:
+    """
+    Function to join a list of query style conditions into one expression, so they can be evaluated in one go
+    :param conditions: the conditions
+    :return: the expression, or None if there are no conditions
+    """
+    if not conditions:
+        return None
+    if type(conditions) == str:
+        return conditions
+    return " and ".join(f"({c})" for c in conditions)
+
+
+def _get_condition_mask(data: pd.DataFrame, conditions: str | list[str] = None) -> np.ndarray:
+    """
+    Function to get which rows of a data frame pass some query style conditions. The conditions are evaluated as one
+    expression over the columns, with numexpr when it is installed, and the data frame is not copied.
+    :param data: data frame with the columns in the conditions
+    :param conditions: conditions to discard rows
+    :return: boolean array that is True for the rows that are kept
+    """
+    expression = _compile_conditions(conditions)
+    if expression is None:
+        return np.ones(data.shape[0], dtype=bool)
+
+    return np.asarray(data.eval(expression), dtype=bool)
+
+
+def _bootstrap_fractions(block_counts: np.ndarray, n_bootstrap: int, seed: np.random.SeedSequence | int = None
+                         ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to resample the blocks of a weighted histogram with Poisson weights, for a bootstrap estimate of its
+    error. All the resamples are made at once as a (resample x block) weight matrix times the block counts.
+    :param block_counts: the weighted counts of each block, with one row per block and a column for each bin
+    :param n_bootstrap: number of resamples
+    :param seed: seed for the random resampling
+    :return: the sum and the sum of squares over the resamples of the fraction of the weight in each bin
+    """
+    resamples = np.random.default_rng(seed).poisson(1, size=(n_bootstrap, block_counts.shape[0])) @ block_counts
+    fractions = resamples / resamples.sum(axis=1, keepdims=True)
+    return fractions.sum(axis=0), (fractions**2).sum(axis=0)
+
+
+class QuantileSketch:
+    """
+    Class for a mergeable streaming sketch of the quantiles of some values, in the style of the KLL sketch. The values
+    are kept in levels, where each value in level h stands for 2**h of the original values. When a level is over its
+    capacity it is sorted and every other value, starting at random from the first or second, is moved up a level.
+    Until the first compaction every value is kept, and the quantiles are exact.
+    """
+
+    def __init__(self, capacity: int = 2**16, seed: int = 0):
+        """
+        init for the sketch
+        :param capacity: the number of values to keep in the top level. Lower levels keep 2/3 as many as the level
+        above them, so the sketch holds at most about three times this many values
+        :param seed: seed for the random choice of which values to move up a level, fixed so the quantiles are
+        reproducible
+        """
+        self.capacity = capacity
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self) -> bool:
+        """
+        Whether every value added to the sketch is still in it
+        :return: True if the quantiles are exact
+        """
+        return len(self._levels) == 1
+
+    def _get_level_capacity(self, level: int) -> int:
+        """
+        Function to get the capacity of a level, which shrinks geometrically going down from the top level
+        :param level: the level
+        :return: the capacity
+        """
+        return max(8, int(self.capacity * (2 / 3)**(len(self._levels) - 1 - level)))
+
+    def _compress(self):
+        """
+        Function to compact the levels that are over their capacity, from the bottom level up
+        """
+        level = 0
+        while level < len(self._levels):
+            values = self._levels[level]
+            if values.shape[0] > self._get_level_capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                values = np.sort(values)
+                n_paired = values.shape[0] - values.shape[0] % 2
+                self._levels[level] = values[n_paired:]
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1],
+                                                          values[self._rng.integers(2):n_paired:2]])
+            level += 1
+
+    def update(self, values: np.ndarray) -> QuantileSketch:
+        """
+        Function to add some values to the sketch. Nans are left out.
+        :param values: the values
+        :return: self
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.shape[0] == 0:
+            return self
+
+        self.n += values.shape[0]
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+
+        return self
+
+    def merge(self, other: QuantileSketch) -> QuantileSketch:
+        """
+        Function to merge another sketch into this one. The other sketch is left as it is.
+        :param other: the other sketch
+        :return: self
+        """
+        for level, values in enumerate(other._levels):
+            if level == len(self._levels):
+                self._levels.append(np.empty(0))
+            self._levels[level] = np.concatenate([self._levels[level], values])
+
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self._compress()
+
+        return self
+
+    def get_quantiles(self, quantiles: float | np.ndarray) -> np.ndarray:
+        """
+        Function to get some quantiles of the values. When the sketch is exact they are interpolated linearly in the
+        same way as np.quantile, otherwise from the weighted values of the levels, with the min and max kept exactly.
+        :param quantiles: the quantiles to get, between 0 and 1
+        :return: the values at the quantiles
+        """
+        if self.n == 0:
+            raise ValueError("There are no values in the sketch")
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        if self.exact:
+            return np.quantile(self._levels[0], quantiles)
+
+        values = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(v.shape[0], 2.0**level) for level, v in enumerate(self._levels)])
+        order = np.argsort(values)
+        values, weights = values[order], weights[order]
+        positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+
+        return np.interp(quantiles, np.concatenate([[0], positions, [1]]),
+                         np.concatenate([[self.min], values, [self.max]]))
+
+
 class MetaTrajectory:
     """
     Class to handle colvar files, which here are thought of as a metadynamics trajectory in CV space.
     """
-    def __init__(self, colvar_file: str, temperature: float = 298, metadata: dict = None):
+    _column_names = {'metad.bias': 'bias', 'metad.rct': 'reweight_factor', 'metad.rbias': 'reweight_bias',
+                     'opes.bias': 'reweight_bias', 'opes.rct': 'reweight_factor', 'opes.zed': 'zed',
+                     'opes.neff': 'neff', 'opes.nker': 'nker'}
+    _bin_index_cache_size = 32
+    _condition_mask_cache_size = 32
+    _quantile_sketch_capacity = 2**16
+
+    def __init__(self, colvar_file: str, temperature: float = 298, metadata: dict = None, cache: bool = False,
+                 lazy: bool = False, chunksize: int = 100000):
+        """
+        init file for the metadynamics trajectory
+        :param colvar_file: path to the colvar file
+        :param temperature: temperature of the trajectory
+        :param metadata: any metadata to do with this trajectory
+        :param cache: keep a binary copy of the parsed colvar file next to it, so later reads skip the text parsing
+        :param lazy: only read the header now, and stream the columns that are needed from the file when they are asked
+        for. Useful for colvar files that are too big to hold in memory. Restarted colvar files are streamed with the
+        columns of their first header.
+        :param chunksize: number of rows in each chunk when streaming the file
+        """
+        self._file = colvar_file
+        self._cache = cache
+        self.lazy = lazy
+        self.chunksize = chunksize
+        self.temperature = temperature
+        self._max_reweight_bias = None
+        self._bin_index_cache = OrderedDict()
+        self._condition_mask_cache = OrderedDict()
+        self._quantile_sketches = {}
+
+        if lazy:
+            self._fields = _read_fields(colvar_file)
+            self._opes = True if 'opes.bias' in self._fields else False
+            self._data = None
+            columns = [self._column_names.get(f, f) for f in self._fields] + ['weight']
+        else:
+            # every row up to the size measured here is read, so rows plumed appends while the file is parsed are left
+            # for refresh, and a row without a trailing newline is read again when the file is refreshed
+            size = os.path.getsize(colvar_file)
+            data, self._opes = self._read_file(colvar_file, cache=cache, size=size)
+            self._offset = _get_line_end(colvar_file, size)
+            self._partial_row = _has_partial_row(colvar_file, self._offset, size)
+            self._data = data.pipe(self._get_weights, temperature=temperature)
+            # the fields of the rows plumed appends are only needed to refresh, so are read then
+            self._fields = None
+            self._max_weight = np.exp(data['reweight_bias'].max()/(Kb * temperature))
+            columns = self._data.columns.to_list()
 
-        data, self._opes = self._read_file(colvar_file)
-        self._data = data.pipe(self._get_weights, temperature=temperature)
         self.walker = int(colvar_file.split("/")[-1].split(".")[-1])
-        self.cvs = (self._data.drop(columns=['time', 'bias', 'reweight_factor', 'reweight_bias', 'weight', 'zed',
-                                             'neff', 'nker'], errors='ignore')
-                    .columns
-                    .to_list()
-                    )
-        self.temperature = temperature
+        self.cvs = [c for c in columns if c not in ['time', 'bias', 'reweight_factor', 'reweight_bias', 'weight',
+                                                    'zed', 'neff', 'nker']]
+        self._columns = columns
         self._metadata = metadata
 
     @property
@@ -32,27 +611,84 @@ class MetaTrajectory:
         return self._opes
 
     @staticmethod
-    def _read_file(file: str):
+    def _read_file(file: str, cache: bool = False, size: int = None):
         """
         Function to read in colvar _data, replacement for pl.read_as_pandas
         :param file: file to read in
+        :param cache: read from/write to the binary sidecar of the file instead of parsing the text every time
+        :param size: number of bytes of the file to read, None to read the whole file
         :return: _data in that file in pandas format
         """
-        col_file = open(file)
-        col_names = col_file.readline().strip().split(" ")[2:]
-        col_file.close()
-        opes = True if 'opes.bias' in col_names else False
+        cache_file = MetaTrajectory._get_cache_file(file, size) if cache else None
+        colvar = MetaTrajectory._read_cache(cache_file) if cache else None
+
+        if colvar is None:
+            colvar = _read_rows(file, size)
+            if cache:
+                MetaTrajectory._write_cache(cache_file, colvar)
+
+        opes = True if 'opes.bias' in colvar.columns else False
 
         # TODO: Check that opes.bias is the right bias to use for reweighting!
-        colvar = (pd.read_table(file, sep='\s+', comment="#", names=col_names, dtype=np.float64)
-                  .rename(columns={'metad.bias': 'bias', 'metad.rct': 'reweight_factor', 'metad.rbias':
-                                   'reweight_bias', 'opes.bias': 'reweight_bias', 'opes.rct': 'reweight_factor',
-                                   'opes.zed': 'zed', 'opes.neff': 'neff', 'opes.nker': 'nker'})
+        colvar = (colvar
+                  .rename(columns=MetaTrajectory._column_names)
                   .assign(time=lambda x: x['time'] / 1000)
                   )
 
         return colvar, opes
 
+    @staticmethod
+    def _get_cache_file(file: str, size: int = None) -> str:
+        """
+        Function to get the path of the binary sidecar of a colvar file. The sidecar is keyed on the path, size and
+        modification time of the colvar file, so when plumed appends to the file the old sidecar no longer matches.
+        :param file: the colvar file
+        :param size: the number of bytes of the file that are read, None for the size of the file
+        :return: path to the sidecar
+        """
+        stat = os.stat(file)
+        size = stat.st_size if size is None else size
+        directory, name = os.path.split(os.path.abspath(file))
+        return os.path.join(directory, f".{name}.{size}-{stat.st_mtime_ns}.cache.npy")
+
+    @staticmethod
+    def _read_cache(cache_file: str) -> pd.DataFrame | None:
+        """
+        Function to read the columns of a colvar file from its sidecar. The whole sidecar is read in one go, and
+        nothing is parsed.
+        :param cache_file: path to the sidecar
+        :return: the raw colvar data, or None if there is no up-to-date sidecar
+        """
+        if not os.path.isfile(cache_file):
+            return None
+
+        records = np.load(cache_file)
+        return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+    @staticmethod
+    def _write_cache(cache_file: str, data: pd.DataFrame):
+        """
+        Function to write the raw colvar data to a sidecar as a structured numpy array, removing any stale sidecars of
+        the same colvar file. Failing to write the sidecar is not an error, the data is just parsed again next time.
+        :param cache_file: path to the sidecar
+        :param data: the raw colvar data
+        :return:
+        """
+        directory, name = os.path.split(cache_file)
+        stem = name.rsplit(".", 3)[0]
+        try:
+            for f in os.listdir(directory):
+                key = f[len(stem) + 1:-len(".cache.npy")]
+                if (f.startswith(stem + ".") and f.endswith(".cache.npy") and f != name
+                        and key.replace("-", "", 1).isdigit()):
+                    os.remove(os.path.join(directory, f))
+            temp_file = cache_file + ".tmp"
+            with open(temp_file, "wb") as f:
+                np.save(f, data.to_records(index=False))
+            os.replace(temp_file, cache_file)
+        except OSError:
+            pass
+
     @staticmethod
     def _get_weights(data: pd.DataFrame, temperature: float = 298, y_col: str = 'reweight_bias',
                      y_col_out: str = 'weight') -> pd.DataFrame:
@@ -73,14 +709,246 @@ class MetaTrajectory:
 
         return data
 
-    def get_data(self, with_metadata: bool = False, time_resolution: int = None):
+    def _iter_raw_chunks(self, fields: list[str]):
+        """
+        Generator over the raw colvar file in chunks, reading only the fields asked for. The sidecar is used instead of
+        the text if the trajectory is cached and the sidecar is up-to-date. It is memory mapped, so only the rows of
+        the chunk being read are loaded, and those fields of them are copied into the chunk.
+        :param fields: the plumed names of the columns to read
+        :return: data frames with the chunks
+        """
+        cache_file = self._get_cache_file(self._file) if self._cache else None
+
+        if cache_file is not None and os.path.isfile(cache_file):
+            records = np.load(cache_file, mmap_mode='r')
+            for start in range(0, records.shape[0], self.chunksize):
+                yield pd.DataFrame({f: np.asarray(records[f][start:start + self.chunksize]) for f in fields})
+        else:
+            with _open_plumed_file(self._file) as f:
+                for chunk in pd.read_table(f, sep='\s+', comment="#", names=self._fields, usecols=fields,
+                                           dtype=np.float64, chunksize=self.chunksize):
+                    yield chunk
+
+    def _get_max_reweight_bias(self) -> float:
+        """
+        Function to get the largest reweight bias in the trajectory, which is needed to normalise the weights. When the
+        trajectory is lazy only the reweight bias column is streamed, and the result is kept.
+        :return: the max reweight bias
+        """
+        if self._max_reweight_bias is None:
+            field = [f for f in self._fields if self._column_names.get(f) == 'reweight_bias'][0]
+            self._max_reweight_bias = max(chunk[field].max() for chunk in self._iter_raw_chunks([field]))
+
+        return self._max_reweight_bias
+
+    def refresh(self):
+        """
+        Function to read in the rows plumed has appended to the colvar file since it was last read. Only the new rows
+        are parsed, and the weights of the old rows are rescaled if a new row has a larger reweight bias. Lazy
+        trajectories always stream the whole file, so only their cached max reweight bias is dropped.
+        :return: self
+        """
+        if self.lazy:
+            self._max_reweight_bias = None
+            self._quantile_sketches.clear()
+            return self
+
+        new_data, self._offset, self._fields = _read_appended_rows(self._file, self._fields, self._offset)
+        if new_data.shape[0] == 0:
+            return self
+
+        if self._partial_row:
+            # the last row read before had no newline, and has been read again now that it is complete
+            self._data = self._data.iloc[:-1]
+            self._quantile_sketches.clear()
+            self._partial_row = False
+
+        new_data = (new_data
+                    .rename(columns=self._column_names)
+                    .assign(time=lambda x: x['time'] / 1000)
+                    )
+        new_weights = np.exp(new_data['reweight_bias']/(Kb * self.temperature))
+        max_weight = max(self._max_weight, new_weights.max())
+        if max_weight > self._max_weight:
+            self._data['weight'] = self._data['weight'] * (self._max_weight / max_weight)
+        new_data['weight'] = new_weights / max_weight
+
+        self._max_weight = max_weight
+        self._data = pd.concat([self._data, new_data], ignore_index=True)
+        self._bin_index_cache.clear()
+        self._condition_mask_cache.clear()
+        for cv, sketch in self._quantile_sketches.items():
+            if cv in new_data.columns:
+                sketch.update(new_data[cv].to_numpy())
+        new_columns = [c for c in self._data.columns if c not in self._columns]
+        if new_columns:
+            # a restart has added columns
+            self._columns = self._columns + new_columns
+            self.cvs = self.cvs + [c for c in new_columns
+                                   if c not in ['bias', 'reweight_factor', 'zed', 'neff', 'nker']]
+
+        return self
+
+    def set_reweight_bias(self, bias: np.ndarray, reweight_factor: float):
+        """
+        Function to replace the bias of the trajectory, for example with the final bias of the run, and work out the
+        reweight bias and the weights from it
+        :param bias: the bias at each frame of the trajectory
+        :param reweight_factor: the c(t) to take away from the bias
+        :return: self
+        """
+        if self.lazy:
+            raise ValueError("The bias of a lazy trajectory can't be set, load it instead")
+
+        self._data = (self._data
+                      .assign(bias=bias, reweight_factor=reweight_factor)
+                      .assign(reweight_bias=lambda x: x['bias'] - x['reweight_factor'])
+                      .pipe(self._get_weights, temperature=self.temperature)
+                      )
+        self._max_weight = np.exp(self._data['reweight_bias'].max()/(Kb * self.temperature))
+        self._columns = self._data.columns.to_list()
+        self._condition_mask_cache.clear()
+
+        return self
+
+    def get_bin_index(self, cvs: list[str], edges: list[np.ndarray]) -> np.ndarray:
+        """
+        Function to get the flat index of the histogram bin each frame falls in. The index tables of the most recently
+        used cvs and bin edges are kept, and dropped when new rows are read in.
+        :param cvs: the cvs being binned
+        :param edges: the bin edges for each cv
+        :return: read only array with the flat bin index of each frame, with -1 for the frames outside the bins
+        """
+        if self.lazy:
+            raise ValueError("Bin indices are only kept for loaded trajectories")
+
+        edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        key = (tuple(cvs), tuple(e.tobytes() for e in edges))
+        if key in self._bin_index_cache:
+            self._bin_index_cache.move_to_end(key)
+            return self._bin_index_cache[key]
+
+        index = _get_bin_index(self._data[cvs].to_numpy(), edges)
+        index.setflags(write=False)
+        self._bin_index_cache[key] = index
+        if len(self._bin_index_cache) > self._bin_index_cache_size:
+            self._bin_index_cache.popitem(last=False)
+
+        return index
+
+    def get_condition_mask(self, conditions: str | list[str] = None) -> np.ndarray:
+        """
+        Function to get which frames pass some query style conditions. The conditions are compiled into one expression
+        and the masks of the most recently used conditions are kept, and dropped when the data changes.
+        :param conditions: conditions to discard frames
+        :return: read only boolean array that is True for the frames that are kept
+        """
+        if self.lazy:
+            raise ValueError("Condition masks are only kept for loaded trajectories")
+
+        key = _compile_conditions(conditions)
+        if key in self._condition_mask_cache:
+            self._condition_mask_cache.move_to_end(key)
+            return self._condition_mask_cache[key]
+
+        mask = _get_condition_mask(self._data, conditions)
+        mask.setflags(write=False)
+        self._condition_mask_cache[key] = mask
+        if len(self._condition_mask_cache) > self._condition_mask_cache_size:
+            self._condition_mask_cache.popitem(last=False)
+
+        return mask
+
+    def get_quantile_sketch(self, cv: str) -> QuantileSketch:
+        """
+        Function to get a quantile sketch of the values of a cv over the trajectory. The sketch is kept, and the new
+        rows are added to it when the trajectory is refreshed. Lazy trajectories are streamed chunk by chunk.
+        :param cv: the cv
+        :return: the sketch, which should not be changed
+        """
+        if cv not in self._quantile_sketches:
+            sketch = QuantileSketch(self._quantile_sketch_capacity)
+            if self.lazy:
+                for chunk in self.iter_chunks([cv]):
+                    sketch.update(chunk[cv].to_numpy())
+            else:
+                sketch.update(self.get_column(cv))
+            self._quantile_sketches[cv] = sketch
+
+        return self._quantile_sketches[cv]
+
+    def get_column(self, column: str) -> np.ndarray:
+        """
+        Function to get the values of one column of a loaded trajectory without copying them
+        :param column: the column to get
+        :return: read only array with the values
+        """
+        if self.lazy:
+            raise ValueError("Columns can only be got from loaded trajectories, use iter_chunks instead")
+
+        values = self._data[column].to_numpy()
+        values.flags.writeable = False
+        return values
+
+    def get_columns(self, cvs: str | list[str] = None, conditions: str | list[str] = None) -> list[str]:
+        """
+        Function to get the columns needed to reweight over some cvs with some query style conditions.
+        :param cvs: the cvs to reweight over
+        :param conditions: conditions that will be applied to the data
+        :return: list of columns
+        """
+        cvs = [] if cvs is None else [cvs] if type(cvs) == str else list(cvs)
+        conditions = [] if conditions is None else [conditions] if type(conditions) == str else conditions
+        names = {n for c in conditions for n in re.findall(r'[A-Za-z_][\w.]*', c)}
+        conditions_columns = [c for c in self._columns if c in names and c not in cvs]
+        return ['time'] + [c for c in cvs if c != 'time'] + ['weight'] + conditions_columns
+
+    def iter_chunks(self, columns: list[str] = None, chunksize: int = None):
+        """
+        Generator over the trajectory data in chunks of rows. When the trajectory is lazy, only the columns asked for
+        are read from the file, and only one chunk is held in memory at a time.
+        :param columns: the columns to get, None for all of them
+        :param chunksize: the number of rows in each chunk, defaults to the chunksize of the trajectory
+        :return: data frames with the chunks
+        """
+        chunksize = self.chunksize if chunksize is None else chunksize
+        columns = self._columns if columns is None else columns
+
+        if not self.lazy:
+            # the columns are picked out of each chunk, so only one chunk is copied at a time
+            for start in range(0, self._data.shape[0], chunksize):
+                yield self._data.iloc[start:start + chunksize][columns]
+            return
+
+        if chunksize != self.chunksize:
+            raise ValueError("Lazy trajectories are streamed in chunks of the trajectory chunksize")
+
+        fields = [f for f in self._fields if self._column_names.get(f, f) in columns
+                  or ('weight' in columns and self._column_names.get(f) == 'reweight_bias')]
+        max_weight = np.exp(self._get_max_reweight_bias()/(Kb * self.temperature)) if 'weight' in columns else None
+
+        for chunk in self._iter_raw_chunks(fields):
+            chunk = chunk.rename(columns=self._column_names)
+            if 'time' in chunk.columns:
+                chunk['time'] = chunk['time'] / 1000
+            if max_weight is not None:
+                chunk['weight'] = np.exp(chunk['reweight_bias']/(Kb * self.temperature)) / max_weight
+            yield chunk[columns]
+
+    def get_data(self, with_metadata: bool = False, time_resolution: int = None, columns: list[str] = None):
         """
         function to get the _data from a free energy shape
         :param with_metadata: print the data with the metadata?
         :param time_resolution: reduce the size of the data frame by reducing the time resolution
+        :param columns: only get these columns
         :return:
         """
-        data = self._data.copy()
+        if self.lazy:
+            data = pd.concat(list(self.iter_chunks(columns)), ignore_index=True)
+        elif columns is not None:
+            data = self._data[columns].copy()
+        else:
+            data = self._data.copy()
 
         if with_metadata:
             data['temperature'] = self.temperature
@@ -102,6 +970,391 @@ class MetaTrajectory:
         return data
 
 
+class HillsFile:
+    """
+    Class to handle a single hills/kernels file. The file is parsed once, and all the attributes of the simulation
+    that wrote it are worked out from that one read.
+    """
+    def __init__(self, hills_file: str):
+        """
+        init file for the hills file
+        :param hills_file: path to the hills file
+        """
+        self.file = hills_file
+        # every hill up to the size measured here is read, so hills plumed appends while the file is parsed are left
+        # for refresh, and a hill without a trailing newline is read again when the file is refreshed
+        size = os.path.getsize(hills_file)
+        self._hills, self.sigmas, self.biasfactor = self._read_file(hills_file, size)
+        self._offset = _get_line_end(hills_file, size)
+        self._partial_row = _has_partial_row(hills_file, self._offset, size)
+        self._fields = None
+        self._set_time_attributes()
+        self.cvs = (self._hills
+                    .drop(columns=['time', 'height', 'walker', 'logweight'], errors='ignore')
+                    .columns
+                    .to_list()
+                    )
+        self.opes = False if 'logweight' not in self._hills.columns.to_list() else True
+
+    def _set_time_attributes(self):
+        """
+        Function to work out the walker and time attributes from all the hills
+        :return:
+        """
+        self._n_last = (self._hills['time'] == self._hills['time'].iloc[-1]).sum()
+        self.n_walker = self._hills[self._hills['time'] == min(self._hills['time'])].shape[0]
+        self.n_timesteps = self._hills[['time']].drop_duplicates().shape[0]
+        self.max_time = self._hills['time'].max()
+        self.dt = self.max_time/self.n_timesteps
+
+    @staticmethod
+    def _read_file(file: str, size: int = None):
+        """
+        Function to read in _hills _data
+        :param file: file to read in
+        :param size: number of bytes of the file to read, None to read the whole file
+        :return: _data in that file in pandas format, the sigmas and the bias factor (None if not well-tempered)
+        """
+        data = _read_rows(file, size)
+        sigmas = [col for col in data.columns if col.split("_")[0] == 'sigma']
+        sigmas = {s.split("_")[1]: data.loc[0, s] for s in sigmas}
+        biasfactor = data.loc[0, 'biasf'] if 'biasf' in data.columns else None
+
+        data = (data
+                .loc[:, ~data.columns.str.startswith('sigma')]
+                .drop(columns=['biasf'], errors='ignore')
+                .assign(time=lambda x: x['time'] / 1000)
+                .assign(walker=lambda x: x.groupby('time').cumcount())
+                )
+
+        return data, sigmas, biasfactor
+
+    def refresh(self) -> pd.DataFrame:
+        """
+        Function to read in the hills plumed has appended to the file since it was last read. The walker numbers and
+        the time attributes are updated from the new hills only.
+        :return: the new hills
+        """
+        new_hills, self._offset, self._fields = _read_appended_rows(self.file, self._fields, self._offset)
+        if new_hills.shape[0] == 0:
+            return self._hills.iloc[0:0]
+
+        if self._partial_row:
+            # the last hill read before had no newline, and has been read again now that it is complete
+            self._hills = self._hills.iloc[:-1]
+            self._set_time_attributes()
+            self._partial_row = False
+
+        last_time = self._hills['time'].iloc[-1]
+        new_hills = (new_hills
+                     .loc[:, ~new_hills.columns.str.startswith('sigma')]
+                     .drop(columns=['biasf'], errors='ignore')
+                     .assign(time=lambda x: x['time'] / 1000)
+                     .assign(walker=lambda x: x.groupby('time').cumcount())
+                     )
+
+        # hills at the last time already read belong to the same deposition, so carry on their walker numbers
+        continuing = new_hills['time'] == last_time
+        new_hills.loc[continuing, 'walker'] += self._n_last
+        if self._hills['time'].iloc[0] == last_time:
+            self.n_walker += continuing.sum()
+
+        new_last_time = new_hills['time'].iloc[-1]
+        self._n_last = ((new_hills['time'] == new_last_time).sum()
+                        + (self._n_last if new_last_time == last_time else 0))
+        self.n_timesteps += new_hills['time'].nunique() - (1 if continuing.any() else 0)
+        self.max_time = max(self.max_time, new_hills['time'].max())
+        self.dt = self.max_time/self.n_timesteps
+        self._hills = pd.concat([self._hills, new_hills], ignore_index=True)
+
+        return new_hills
+
+    def get_data(self):
+        """
+        function to get the _hills data from the file
+        :return:
+        """
+        return self._hills.copy()
+
+
+class OpesKernels:
+    """
+    Class to handle the Kernels.data file written by OPES_METAD. The kernels are compressed in the same way as OPES
+    does during the run, and the OPES bias and free energy can then be worked out anywhere in CV space.
+    """
+
+    def __init__(self, kernels_file: str, temperature: float = 298):
+        """
+        init file for the opes kernels
+        :param kernels_file: path to the Kernels.data file
+        :param temperature: temperature of the simulation
+        """
+        self.file = kernels_file
+        self.temperature = temperature
+        kernels, sets = self._read_file(kernels_file)
+        self.cvs = [c for c in kernels.columns if c not in ['time', 'height', 'logweight'] and 'sigma_' not in c]
+        self.biasfactor = sets['biasfactor']
+        self.epsilon = sets['epsilon']
+        self.kernel_cutoff = sets['kernel_cutoff']
+        self.compression_threshold = sets.get('compression_threshold', 0)
+        self.max_time = kernels['time'].max()
+
+        self._bias_prefactor = 1 - 1 / self.biasfactor
+        # the opes normalisation starts at epsilon^(1-1/gamma) rather than 0
+        self._norm = self.epsilon**self._bias_prefactor + np.exp(kernels['logweight']).sum()
+        sigmas = kernels[[f'sigma_{c}' for c in self.cvs]].to_numpy()
+        self._centers, self._sigmas, self._heights = self._compress(kernels[self.cvs].to_numpy(), sigmas,
+                                                                    kernels['height'].to_numpy(),
+                                                                    self.compression_threshold)
+        self.n_kernels = self._heights.shape[0]
+        self.zed = self._sum_kernels(self._centers).sum() / self._norm / self.n_kernels
+
+    def _sum_kernels(self, points: np.ndarray) -> np.ndarray:
+        """
+        Function to sum the compressed kernels at some points
+        :param points: the points, one row per point with a column for each cv
+        :return: the sum of the kernels at each point
+        """
+        return _sum_kernels(points, self._centers, self._sigmas, self._heights, self.kernel_cutoff)
+
+    @staticmethod
+    def _read_file(file: str):
+        """
+        Function to read in the kernels and the SET lines of the header
+        :param file: file to read in
+        :return: the kernels in pandas format, and the dictionary of SET values
+        """
+        kernels = (_read_rows(file)
+                   .assign(time=lambda x: x['time'] / 1000)
+                   )
+        return kernels, _read_sets(file)
+
+    @staticmethod
+    def _compress(centers: np.ndarray, sigmas: np.ndarray, heights: np.ndarray, threshold: float):
+        """
+        Function to merge the kernels in the order they were deposited, the same way OPES_METAD does. A new kernel is
+        merged into the nearest kernel within the compression threshold, and the merged kernel is then merged again
+        for as long as it is within the threshold of another kernel.
+        :param centers: the kernel centers, one row per kernel
+        :param sigmas: the kernel sigmas, one row per kernel
+        :param heights: the kernel heights
+        :param threshold: the compression threshold, 0 to keep every kernel
+        :return: the centers, sigmas and heights of the compressed kernels
+        """
+        if not threshold:
+            return centers, sigmas, heights
+
+        c, s, h = np.empty_like(centers), np.empty_like(sigmas), np.empty_like(heights)
+        n = 0
+
+        def merge(taker, center, sigma, height):
+            total = h[taker] + height
+            new_center = (h[taker] * c[taker] + height * center) / total
+            s[taker] = np.sqrt((h[taker] * (s[taker]**2 + c[taker]**2) + height * (sigma**2 + center**2)) / total
+                               - new_center**2)
+            c[taker], h[taker] = new_center, total
+
+        for center, sigma, height in zip(centers, sigmas, heights):
+            norm2 = (((c[:n] - center) / s[:n])**2).sum(axis=1)
+            taker = np.argmin(norm2) if n > 0 else None
+            if taker is None or norm2[taker] > threshold**2:
+                c[n], s[n], h[n] = center, sigma, height
+                n += 1
+                continue
+
+            merge(taker, center, sigma, height)
+            giver = taker
+            while n > 1:
+                norm2 = (((c[:n] - c[giver]) / s[:n])**2).sum(axis=1)
+                norm2[giver] = np.inf
+                taker = np.argmin(norm2)
+                if norm2[taker] > threshold**2:
+                    break
+                merge(taker, c[giver].copy(), s[giver].copy(), h[giver])
+                c[giver:n - 1], s[giver:n - 1], h[giver:n - 1] = c[giver + 1:n], s[giver + 1:n], h[giver + 1:n]
+                n -= 1
+                giver = taker - 1 if taker > giver else taker
+
+        return c[:n], s[:n], h[:n]
+
+    def _to_bias(self, kernel_sum: np.ndarray) -> np.ndarray:
+        """
+        Function to turn the sum of the kernels into the opes bias
+        :param kernel_sum: the sum of the kernels
+        :return: the bias
+        """
+        probability = kernel_sum / self._norm
+        return Kb * self.temperature * self._bias_prefactor * np.log(probability / self.zed + self.epsilon)
+
+    def get_bias(self, points: pd.DataFrame) -> np.ndarray:
+        """
+        Function to get the opes bias at some points, as it is at the end of the kernels file
+        :param points: data frame with a column for each cv
+        :return: the bias at each point
+        """
+        return self._to_bias(self._sum_kernels(points[self.cvs].to_numpy(dtype=np.float64)))
+
+    def get_fes(self, bins: int | list[int] = 100, ranges: dict[str, tuple[float, float]] = None) -> pd.DataFrame:
+        """
+        Function to get the free energy estimated by opes, -V/(1-1/gamma), on a grid over all the cvs of the kernels
+        :param bins: number of grid points for each cv, or a list with the number for each cv
+        :param ranges: the (min, max) of the grid for any of the cvs, by default the range of the kernel centers
+        :return: data frame with the grid points, the bias and the energy, with the minimum energy set to 0
+        """
+        bins = bins if type(bins) == list else [bins] * len(self.cvs)
+        ranges = {} if ranges is None else ranges
+        axes = [np.linspace(*ranges.get(c, (self._centers[:, i].min(), self._centers[:, i].max())), b)
+                for i, (c, b) in enumerate(zip(self.cvs, bins))]
+        grid = pd.DataFrame({c: g.ravel() for c, g in zip(self.cvs, np.meshgrid(*axes, indexing='ij'))})
+
+        fes = (grid
+               .assign(bias=self._to_bias(_sum_kernels_on_grid(axes, self._centers, self._sigmas, self._heights,
+                                                               self.kernel_cutoff)).ravel())
+               .assign(energy=lambda x: -x['bias'] / self._bias_prefactor)
+               .assign(energy=lambda x: x['energy'] - x['energy'].min())
+               )
+        return fes
+
+
+class NearestNeighbourIndex:
+    """
+    Class to find the nearest of a set of points to many query points at once. If the points lie on a regular grid, as
+    they do on the grids plumed writes, the nearest point is found with index arithmetic along each axis, otherwise
+    with a KD-tree.
+    """
+
+    def __init__(self, points: np.ndarray):
+        """
+        init for the index
+        :param points: array with a row for each point and a column for each dimension
+        """
+        self.points = np.asarray(points, dtype=np.float64)
+        if self.points.ndim != 2 or self.points.shape[0] == 0:
+            raise ValueError("The points need to be a non empty array with a row for each point")
+
+        self._axes = None
+        self._lookup = None
+        self._tree = None
+
+        axes = [np.unique(self.points[:, i]) for i in range(0, self.points.shape[1])]
+        if np.prod([float(a.shape[0]) for a in axes]) == self.points.shape[0]:
+            cells = tuple(np.searchsorted(a, self.points[:, i]) for i, a in enumerate(axes))
+            lookup = np.full([a.shape[0] for a in axes], -1, dtype=np.int64)
+            lookup[cells] = np.arange(0, self.points.shape[0])
+            if (lookup >= 0).all():
+                self._axes, self._lookup = axes, lookup
+
+        if self._lookup is None:
+            self._tree = cKDTree(self.points)
+
+    @property
+    def regular(self) -> bool:
+        """
+        Whether the points are on a regular grid
+        :return: True if the nearest points are found with index arithmetic
+        """
+        return self._lookup is not None
+
+    @staticmethod
+    def _get_nearest_on_axis(axis: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Function to get the position of the nearest value on a sorted grid axis to some values
+        :param axis: the sorted values of the axis
+        :param values: the values to look up
+        :return: the position on the axis of the nearest value to each value
+        """
+        if axis.shape[0] == 1:
+            return np.zeros(values.shape[0], dtype=np.int64)
+
+        spacing = np.diff(axis)
+        if np.allclose(spacing, spacing[0]):
+            return np.clip(np.rint((values - axis[0]) / spacing[0]), 0, axis.shape[0] - 1).astype(np.int64)
+
+        upper = np.clip(np.searchsorted(axis, values), 1, axis.shape[0] - 1)
+        return np.where(values - axis[upper - 1] <= axis[upper] - values, upper - 1, upper)
+
+    def query(self, points: np.ndarray) -> np.ndarray:
+        """
+        Function to get the nearest point to each of some query points
+        :param points: array with a row for each query point and a column for each dimension
+        :return: the position of the nearest point to each query point
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if points.shape[1] != self.points.shape[1]:
+            raise ValueError("The query points need the same dimension as the index")
+
+        if self._lookup is not None:
+            return self._lookup[tuple(self._get_nearest_on_axis(a, points[:, i]) for i, a in enumerate(self._axes))]
+
+        return self._tree.query(points)[1]
+
+
+class FreeEnergyTimeSeries(Mapping):
+    """
+    Class to hold the history of a free energy shape, with the shape at each time stamp on a shared grid. The values of
+    each column are one (time stamps x grid points) float array, so operations over all the time stamps are broadcast
+    rather than looped over. Indexing with a time stamp gives the data frame of the shape at that time.
+    """
+
+    def __init__(self, data: dict[int | float, pd.DataFrame], cvs: list[str]):
+        """
+        init for the time series
+        :param data: dict with the data frame of the shape at each time stamp, all on the same grid
+        :param cvs: the cvs of the grid
+        """
+        time_stamps = sorted(data)
+        first = data[time_stamps[0]]
+        for time_stamp in time_stamps[1:]:
+            frame = data[time_stamp]
+            if (frame.shape != first.shape or frame.columns.to_list() != first.columns.to_list()
+                    or not np.allclose(frame[cvs].to_numpy(), first[cvs].to_numpy(), equal_nan=True)):
+                raise ValueError("The data at every time stamp needs the same columns and grid")
+
+        self.cvs = cvs
+        self.time_stamps = np.array(time_stamps)
+        self.grid = first[cvs].copy()
+        self.columns = [c for c in first.columns if c not in cvs]
+        self._column_order = first.columns.to_list()
+        self._values = np.stack([np.stack([data[t][c].to_numpy(dtype=np.float64) for t in time_stamps])
+                                 for c in self.columns])
+
+    def __getitem__(self, time_stamp: int | float) -> pd.DataFrame:
+        position = np.flatnonzero(self.time_stamps == time_stamp)
+        if position.shape[0] == 0:
+            raise KeyError(time_stamp)
+
+        values = pd.DataFrame(self._values[:, position[0], :].T, index=self.grid.index, columns=self.columns)
+        return pd.concat([self.grid, values], axis=1)[self._column_order]
+
+    def __iter__(self):
+        return iter(self.time_stamps.tolist())
+
+    def __len__(self) -> int:
+        return self.time_stamps.shape[0]
+
+    def get_values(self, column: str) -> np.ndarray:
+        """
+        Function to get the values of a column at every time stamp. Changing them changes the time series.
+        :param column: the column
+        :return: array with a row for each time stamp and a column for each grid point
+        """
+        return self._values[self.columns.index(column)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Function to get the shape at every time stamp in one long data frame
+        :return: data frame with the time stamp as a column
+        """
+        n_timestamps = self.time_stamps.shape[0]
+        data = pd.DataFrame({c: np.tile(self.grid[c].to_numpy(), n_timestamps) for c in self.cvs}
+                            | {c: self.get_values(c).ravel() for c in self.columns},
+                            index=np.tile(self.grid.index.to_numpy(), n_timestamps))
+
+        return (data[self._column_order]
+                .assign(timestamp=np.repeat(self.time_stamps, self.grid.shape[0]))
+                )
+
+
 class FreeEnergyShape:
 
     def __init__(self, data: pd.DataFrame | dict[int | float], temperature: float = 298, dimension: int = None,
@@ -123,8 +1376,8 @@ class FreeEnergyShape:
             for _, value in data.items():
                 if {'energy'}.issubset(value.columns) is False:
                     raise ValueError("make sure there is an energy column in each dataframe in your dict")
-            self._time_data = data
-            self._data = data[max(data)].copy()
+            self._time_data = FreeEnergyTimeSeries(data, data[max(data)].columns.values.tolist()[:dimension])
+            self._data = self._time_data[max(self._time_data)]
         else:
             raise ValueError("fes_file must be a pd.Dataframe or a list[pd.Dataframe]")
 
@@ -132,16 +1385,18 @@ class FreeEnergyShape:
         self.cvs = self._data.columns.values.tolist()[:dimension]
         self.dimension = dimension
         self._metadata = metadata
+        self._nearest_neighbour_index = None
 
     @property
     def metadata(self):
         return self._metadata
 
     @classmethod
-    def from_plumed(cls, file: str | list[str], **kwargs):
+    def from_plumed(cls, file: str | list[str], executor: Executor = None, **kwargs):
         """
         alternate constructor to build the fes from a plumed file
         :param file: the file or list of files to make the plumed fes from. if list then it will make the time _data
+        :param executor: thread or process pool to read a list of files in, rather than one after another
         :return: fes object
         """
         if type(file) == str:
@@ -149,7 +1404,8 @@ class FreeEnergyShape:
         elif type(file) == list:
             individual_files = [f.split("/")[-1] for f in file]
             time_stamps = [int(''.join(x for x in f if x.isdigit())) for f in individual_files]
-            data_frames = [cls._read_file(f) for f in file]
+            read = map if executor is None else executor.map
+            data_frames = list(read(cls._read_file, file))
             data = {time_stamps[i]: data_frames[i] for i in range(0, len(file))}
         else:
             raise ValueError("")
@@ -166,21 +1422,57 @@ class FreeEnergyShape:
         :param val_col: column from which to get the return
         :return: value
         """
-        new_cols = []
-        data = data.copy()
+        closest_value = data[val_col].to_numpy()[FreeEnergyShape._get_nearest_index(data, ref_coordinate)]
+        return closest_value
 
-        for key, value in ref_coordinate.items():
-            new_col = key + "_distance"
-            new_cols.append(new_col)
-            data[new_col] = (data[key].abs() - value)**2
+    def _get_nearest_neighbour_index(self) -> NearestNeighbourIndex:
+        """
+        Function to get the nearest neighbour index of the points of the shape. The index is built on first use, and
+        built again if the data of the shape is replaced.
+        :return: the index
+        """
+        if self._nearest_neighbour_index is None or self._nearest_neighbour_index[0] is not self._data:
+            self._nearest_neighbour_index = (self._data, NearestNeighbourIndex(self._data[self.cvs].to_numpy()))
 
-        data["total_distance"] = 0
-        for c in new_cols:
-            data["total_distance"] = data["total_distance"] + data[c]
+        return self._nearest_neighbour_index[1]
 
-        sorted_data = data.sort_values('total_distance').reset_index(drop=True)
-        closest_value = sorted_data.loc[0, val_col]
-        return closest_value
+    def get_nearest_values(self, points: np.ndarray | pd.DataFrame | dict[str, np.ndarray],
+                           val_col: str | list[str] = 'energy') -> np.ndarray:
+        """
+        Function to get the values of the shape at the nearest point of the shape to each of many query points in one
+        call
+        :param points: array with a row for each point and a column for each cv, or a data frame or dict with the cvs
+        :param val_col: column or columns from which to get the values
+        :return: array with the value at each point, with a column for each val_col if a list is given
+        """
+        return self._data[val_col].to_numpy()[self._get_nearest_neighbour_index().query(self._get_points(points))]
+
+    def _get_points(self, points: np.ndarray | pd.DataFrame | dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Function to get some query points as an array
+        :param points: array or nested list with a row for each point and a column for each cv, or a data frame or dict
+        with the cvs
+        :return: array with a row for each point and a column for each cv
+        """
+        if isinstance(points, (pd.DataFrame, dict)):
+            points = np.column_stack([np.atleast_1d(np.asarray(points[c], dtype=np.float64)) for c in self.cvs])
+
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if points.shape[1] != len(self.cvs):
+            raise ValueError("The points need a column for each cv of the shape")
+
+        return points
+
+    @staticmethod
+    def _get_nearest_index(data: pd.DataFrame, ref_coordinate: dict[str, float | int]) -> int:
+        """
+        Function to get the position of the row of a dataframe closest to a point using a pythagorean distance
+        :param data: _data
+        :param ref_coordinate: dict with the column as the key and the value as the value
+        :return: position of the row
+        """
+        distance = sum((data[key].to_numpy() - value)**2 for key, value in ref_coordinate.items())
+        return int(np.argmin(distance))
 
     @staticmethod
     def _get_mean_in_range(data: pd.DataFrame, ref_col, val_col, area: tuple[int | float, int | float]):
@@ -215,16 +1507,17 @@ class FreeEnergyShape:
             adjust_value = self.get_nearest_value(self._data, datum, 'energy')
             self._data['energy'] = self._data['energy'] - adjust_value
             if self._time_data is not None:
-                for _, v in self._time_data.items():
-                    adjust_value = self.get_nearest_value(v, datum, 'energy')
-                    v['energy'] = v['energy'] - adjust_value
+                energy = self._time_data.get_values('energy')
+                with np.errstate(invalid='ignore'):
+                    energy -= energy[:, self._get_nearest_index(self._time_data.grid, datum)].copy()[:, None]
         elif type(datum[self.cvs[0]]) == tuple:
             adjust_value = self._get_mean_in_range(self._data, self.cvs[0], 'energy', datum[self.cvs[0]])
             self._data['energy'] = self._data['energy'] - adjust_value
             if self._time_data is not None:
-                for _, v in self._time_data.items():
-                    adjust_value = self._get_mean_in_range(v, self.cvs[0], 'energy', datum[self.cvs[0]])
-                    v['energy'] = v['energy'] - adjust_value
+                energy = self._time_data.get_values('energy')
+                in_range = self._time_data.grid[self.cvs[0]].between(*sorted(datum[self.cvs[0]])).to_numpy()
+                with np.errstate(invalid='ignore'):
+                    energy -= energy[:, in_range].mean(axis=1)[:, None]
         else:
             raise ValueError("Enter either a float or a tuple!")
 
@@ -242,11 +1535,7 @@ class FreeEnergyShape:
         :return:
         """
         if with_timedata:
-            data = []
-            for ts, d in self._time_data.items():
-                d['timestamp'] = ts
-                data.append(d)
-            data = pd.concat(data)
+            data = self._time_data.to_frame()
         else:
             data = self._data.copy()
 
@@ -286,11 +1575,9 @@ class FreeEnergyLine(FreeEnergyShape):
         :param temperature: temperature of system
         :return: _data in that file in pandas format
         """
-        col_file = open(file)
-        col_names = col_file.readline().strip().split(" ")[2:]
+        col_names = _read_fields(file)
         cv = col_names[0]
-        col_file.close()
-        data = pd.read_table(file, sep='\s+', comment="#", names=col_names, dtype=np.float64)
+        data = _read_rows(file)
         if "file.free" in col_names:
             data = data.rename(columns={'file.free': 'energy', 'der_'+cv: 'delta_e'})
         else:
@@ -311,30 +1598,22 @@ class FreeEnergyLine(FreeEnergyShape):
         :param with_metadata: whether to return _data with the line _metadata
         :return: pandas dataframe with the _data
         """
-        time_data = []
-
-        for key, df in self._time_data.items():
+        if self._time_data is None:
+            raise ValueError("You need time _data to use this function")
 
-            if type(region_1) == int or type(region_1) == float:
-                value_1 = df.loc[(df[self.cvs[0]] - region_1).abs().argsort()[:1], 'energy'].values[0]
-            elif type(region_1) == tuple:
-                value_1 = df.loc[df[self.cvs[0]].between(min(region_1), max(region_1)), 'energy'].values.mean()
-            else:
-                raise ValueError("Use either a number or tuple of two numbers")
-
-            if (type(region_2) == int or type(region_2) == float) and region_2 is not None:
-                value_2 = df.loc[(df[self.cvs[0]] - region_2).abs().argsort()[:1], 'energy'].values[0]
-            elif type(region_2) == tuple and region_2 is not None:
-                value_2 = df.loc[df[self.cvs[0]].between(min(region_2), max(region_2)), 'energy'].values.mean()
-            elif region_2 is None:
-                value_2 = 0
-            else:
-                raise ValueError("Use either a number or tuple of two numbers")
+        x = self._time_data.grid[self.cvs[0]]
+        energy = self._time_data.get_values('energy')
 
-            difference = value_2 - value_1
-            time_data.append(pd.DataFrame({'time_stamp': [key], 'energy_difference': [difference]}))
+        def get_energy(region: float | int | tuple[float | int, float | int]) -> np.ndarray:
+            if type(region) == int or type(region) == float:
+                return energy[:, int(np.argmin((x - region).abs().to_numpy()))]
+            elif type(region) == tuple:
+                return energy[:, x.between(min(region), max(region)).to_numpy()].mean(axis=1)
+            raise ValueError("Use either a number or tuple of two numbers")
 
-        time_data = pd.concat(time_data).sort_values('time_stamp')
+        value_2 = 0 if region_2 is None else get_energy(region_2)
+        time_data = pd.DataFrame({'time_stamp': self._time_data.time_stamps,
+                                  'energy_difference': value_2 - get_energy(region_1)})
 
         if with_metadata:
             time_data['temperature'] = self.temperature
@@ -355,25 +1634,34 @@ class FreeEnergyLine(FreeEnergyShape):
         if self._time_data is None:
             raise ValueError("You need time _data to use this function")
 
-        data = []
-        min_timestamp = max(self._time_data) - n_timestamps
-        for key, value in self._time_data.items():
-            new_data = value.copy()
-            new_data['timestamp'] = key
-            data.append(new_data)
-
-        data = (pd.concat(data)
-                .query('timestamp > @min_timestamp')
-                .assign(bin=lambda x: pd.cut(x[self.cvs[0]], bins))
-                )
-
-        binned_data = pd.DataFrame({
-            self.cvs[0]: data.groupby('bin', observed=True).mean()[self.cvs[0]],
-            'energy': data.groupby('bin', observed=True).mean()['energy'],
-            'energy_err': data.groupby('bin', observed=True).std()['energy'],
-            'population': data.groupby('bin', observed=True).mean()['population'],
-            'population_err': data.groupby('bin', observed=True).std()['population']/np.sqrt(n_timestamps)
-        }).dropna()
+        # the grid is shared by every time stamp, so each grid point is binned once
+        recent = self._time_data.time_stamps > max(self._time_data) - n_timestamps
+        x = self._time_data.grid[self.cvs[0]]
+        cut = pd.cut(x, bins)
+        codes = cut.cat.codes.to_numpy()
+        n_bins = len(cut.cat.categories)
+        in_bin = codes >= 0
+        grid_count = np.bincount(codes[in_bin], minlength=n_bins)
+        count = grid_count * recent.sum()
+        time_codes = np.tile(codes[in_bin], recent.sum())
+
+        def get_stats(column: str) -> tuple[np.ndarray, np.ndarray]:
+            values = self._time_data.get_values(column)[recent][:, in_bin]
+            mean = np.bincount(time_codes, weights=values.ravel(), minlength=n_bins) / count
+            deviation = values - mean[codes[in_bin]][None, :]
+            return mean, np.sqrt(np.bincount(time_codes, weights=(deviation**2).ravel(), minlength=n_bins)
+                                 / (count - 1))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            energy, energy_err = get_stats('energy')
+            population, population_err = get_stats('population')
+            binned_data = pd.DataFrame({
+                self.cvs[0]: np.bincount(codes[in_bin], weights=x.to_numpy()[in_bin], minlength=n_bins) / grid_count,
+                'energy': energy,
+                'energy_err': energy_err,
+                'population': population,
+                'population_err': population_err/np.sqrt(n_timestamps)
+            }, index=pd.CategoricalIndex(cut.cat.categories, name='bin')).dropna()
 
         self._data = binned_data
 
@@ -381,12 +1669,67 @@ class FreeEnergyLine(FreeEnergyShape):
 
 
 class FreeEnergySurface(FreeEnergyShape):
+    _spline_orders = {'linear': 1, 'cubic': 3}
 
     def __init__(self, data: pd.DataFrame | dict[int | float, pd.DataFrame], temperature: float = 298,
                  metadata: dict = None):
 
+        self._long_data = None
+        self._grid = None
+        self._gradient = None
+        self._splines = {}
         super().__init__(data, temperature, dimension=2, metadata=metadata)
 
+    @property
+    def _data(self) -> pd.DataFrame:
+        """
+        The surface in long form, with a row for each grid point. When the surface has only been changed on its grid,
+        the long form is built from the grid the first time it is asked for.
+        """
+        if self._long_data is None:
+            x, y, values = self._grid
+            self._long_data = pd.DataFrame({self.cvs[0]: np.tile(x, y.shape[0]), self.cvs[1]: np.repeat(y, x.shape[0])}
+                                           | {c: v.ravel(order='F') for c, v in values.items()})
+        return self._long_data
+
+    @_data.setter
+    def _data(self, data: pd.DataFrame):
+        self._long_data = data
+        self._clear_grid()
+
+    def _clear_grid(self):
+        """
+        Function to drop the grid view of the surface and everything worked out from it
+        """
+        self._grid = None
+        self._gradient = None
+        self._splines.clear()
+
+    def get_grid(self) -> tuple[np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """
+        Function to get the surface on its grid, pivoting the long form only the first time after the data changes.
+        The arrays are shared with the surface, so copy them before changing them.
+        :return: the values of the first cv, the values of the second cv, and dict with the energy matrix, which has a
+        row for each value of the first cv and a column for each value of the second
+        """
+        if self._grid is None:
+            grid = self._long_data.pivot(index=self.cvs[0], columns=self.cvs[1], values='energy')
+            self._grid = (grid.index.to_numpy(), grid.columns.to_numpy(), {'energy': grid.to_numpy(dtype=np.float64)})
+
+        return self._grid
+
+    def get_gradient(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to get the gradient of the energy on the grid, worked out with finite differences on first use. The
+        arrays are shared with the surface, so copy them before changing them.
+        :return: the derivatives of the energy along the first and second cv, on the grid
+        """
+        if self._gradient is None:
+            x, y, values = self.get_grid()
+            self._gradient = tuple(np.gradient(values['energy'], x.astype(np.float64), y.astype(np.float64)))
+
+        return self._gradient
+
     @staticmethod
     def _read_file(file: str, temperature: float = 298):
         """
@@ -396,12 +1739,10 @@ class FreeEnergySurface(FreeEnergyShape):
         :param temperature: temperature of system
         :return: _data in that file in pandas format
         """
-        col_file = open(file)
-        col_names = col_file.readline().strip().split(" ")[2:]
-        col_file.close()
+        col_names = _read_fields(file)
         drop_cols = [c for c in col_names if 'der_' in c]
 
-        data = (pd.read_table(file, sep='\s+', comment="#", names=col_names, dtype=np.float64)
+        data = (_read_rows(file)
                 .drop(columns=drop_cols)
                 .rename(columns={'file.free': 'energy'})
                 .pipe(boltzmann_energy_to_population, temperature=temperature, x_col=col_names[0])
@@ -417,62 +1758,300 @@ class FreeEnergySurface(FreeEnergyShape):
         :return:
         """
         if symmetry_rule == 'y=x':
-            x = self._data.pivot(index=[self.cvs[0]], columns=[self.cvs[1]], values=['energy']).index.to_list()
-            y = [i[1] for i in self._data.pivot(index=self.cvs[0], columns=self.cvs[1], values=['energy']).columns.to_list()]
-            v = self._data.pivot(index=self.cvs[0], columns=self.cvs[1], values=['energy']).to_numpy()
+            x, y, values = self.get_grid()
+            v = values['energy']
             v_sym = (v + v.T)/2
             err = np.absolute(v - v_sym)
 
-            data = (pd
-                    .DataFrame(v_sym, index=x, columns=y)
-                    .reset_index()
-                    .rename(columns={'index': self.cvs[0]})
-                    .melt(id_vars=self.cvs[0], var_name=self.cvs[1], value_name='energy')
-                    )
+            # only the grid is kept, the long form is built when it is asked for
+            self._clear_grid()
+            self._long_data = None
+            self._grid = (x, y, {'energy': v_sym, 'symmetry_error': err})
+        else:
+            raise ValueError("That symmetry hasn't been built in yet.")
+
+        return self
+
+    def get_mean_force(self) -> pd.DataFrame:
+        """
+        Function to get the mean force from the free energy surface
+        :return: Dataframe of the mean force
+        """
+        cv1 = self.cvs[0]
+        cv2 = self.cvs[1]
+        x, y, _ = self.get_grid()
+        gradient = self.get_gradient()
+
+        force = pd.DataFrame({
+            cv1: np.tile(x, y.shape[0]),
+            cv2: np.repeat(y, x.shape[0]),
+            f'{cv1}_grad': -gradient[0].ravel(order='F'),
+            f'{cv2}_grad': -gradient[1].ravel(order='F')
+        })
+
+        return force
+
+    def set_datum(self, datum: dict[str, float | int | tuple[float | int, float | int]]):
+        """
+        Function to shift the fes surface to set a new datum point, dropping the grid view of the old energies
+        :param datum: either the point on the fes to set as the datum, or a range of the fes to set as the datum
+        :return: self
+        """
+        super().set_datum(datum)
+        self._clear_grid()
+
+        return self
+
+    def _get_spline(self, method: str = 'linear') -> RectBivariateSpline:
+        """
+        Function to get the interpolating spline of the energy over the grid of the surface. The spline coefficients
+        are worked out on first use and kept until the data of the surface changes. Grid points with no
+        population, which have an infinite energy, are set to the highest finite energy so the surface is flat there.
+        :param method: 'linear' or 'cubic'
+        :return: the spline
+        """
+        if method not in self._spline_orders:
+            raise ValueError("method needs to be 'linear' or 'cubic'")
+
+        if method not in self._splines:
+            x, y, values = self.get_grid()
+            energy = values['energy']
+            if np.isnan(energy).any():
+                raise ValueError("The surface needs an energy at every point of a rectangular grid to interpolate it")
+            if not np.isfinite(energy).any():
+                raise ValueError("The surface has no finite energies to interpolate")
+            energy = np.where(np.isfinite(energy), energy, energy[np.isfinite(energy)].max())
+
+            order = self._spline_orders[method]
+            if min(energy.shape) <= order:
+                raise ValueError(f"The grid needs more than {order} points along each cv for {method} interpolation")
+            self._splines[method] = RectBivariateSpline(x.astype(np.float64), y.astype(np.float64), energy, kx=order,
+                                                        ky=order)
+
+        return self._splines[method]
+
+    def _get_grid_points(self, points: np.ndarray | pd.DataFrame | dict[str, np.ndarray],
+                         spline: RectBivariateSpline) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to get the coordinates of some points along each cv, with points outside the grid moved onto its edge
+        :param points: array with a row for each point and a column for each cv, or a data frame or dict with the cvs
+        :param spline: the spline of the surface
+        :return: the coordinates along the first and second cv
+        """
+        points = self._get_points(points)
+        x_min, x_max, y_min, y_max = spline.get_knots()[0][[0, -1]].tolist() + spline.get_knots()[1][[0, -1]].tolist()
+        return np.clip(points[:, 0], x_min, x_max), np.clip(points[:, 1], y_min, y_max)
+
+    def evaluate(self, points: np.ndarray | pd.DataFrame | dict[str, np.ndarray], method: str = 'linear'
+                 ) -> np.ndarray:
+        """
+        Function to get the energy of the surface at many points at once, interpolated from the grid
+        :param points: (N, 2) array with the value of each cv at each point, or a data frame or dict with the cvs
+        :param method: 'linear' for bilinear interpolation, or 'cubic' for a bicubic spline
+        :return: the energy at each point
+        """
+        spline = self._get_spline(method)
+        return spline.ev(*self._get_grid_points(points, spline))
+
+    def evaluate_gradient(self, points: np.ndarray | pd.DataFrame | dict[str, np.ndarray], method: str = 'linear'
+                          ) -> np.ndarray:
+        """
+        Function to get the gradient of the energy of the surface at many points at once, from the same spline as
+        evaluate. The mean force is minus the gradient.
+        :param points: (N, 2) array with the value of each cv at each point, or a data frame or dict with the cvs
+        :param method: 'linear' for bilinear interpolation, or 'cubic' for a bicubic spline
+        :return: (N, 2) array with the derivative of the energy along each cv at each point
+        """
+        spline = self._get_spline(method)
+        x, y = self._get_grid_points(points, spline)
+        return np.column_stack([spline.ev(x, y, dx=1), spline.ev(x, y, dy=1)])
+
+
+class HistogramAccumulator:
+    """
+    Class to build up a weighted histogram of some cvs from trajectories, or chunks of them, one at a time, so the
+    trajectories are never concatenated. The counts are split into time blocks, so the histogram up to each of some
+    time stamps can be got from their cumulative sum.
+    """
+
+    def __init__(self, cvs: list[str], edges: list[np.ndarray], time_stamps: np.ndarray = None):
+        """
+        init for the accumulator
+        :param cvs: the cvs of the histogram
+        :param edges: the bin edges for each cv
+        :param time_stamps: the time stamps closing each time block, None for a single block
+        """
+        self.cvs = list(cvs)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.shape = [len(e) - 1 for e in self.edges]
+        self.time_stamps = np.array([np.inf]) if time_stamps is None else np.asarray(time_stamps, dtype=np.float64)
+        self.counts = np.zeros([self.time_stamps.shape[0]] + self.shape)
+
+    def add_index(self, index: np.ndarray, weights: np.ndarray, times: np.ndarray) -> HistogramAccumulator:
+        """
+        Function to add frames to the histogram by the flat index of their bin. The frames are put in the block of the
+        first time stamp at or after their time, and all the blocks are counted with a single bincount.
+        :param index: the flat bin index of each frame, with -1 for the frames to leave out
+        :param weights: the weight of each frame
+        :param times: the time of each frame
+        :return: self
+        """
+        n_bins = int(np.prod(self.shape))
+        blocks = np.searchsorted(self.time_stamps, times, side='left')
+        keep = (index >= 0) & (blocks < self.time_stamps.shape[0])
+        counts = np.bincount(blocks[keep] * n_bins + index[keep], weights=weights[keep],
+                             minlength=self.time_stamps.shape[0] * n_bins)
+        self.counts += counts.reshape(self.counts.shape)
+
+        return self
+
+    def add_chunk(self, chunk: pd.DataFrame, conditions: str | list[str] = None) -> HistogramAccumulator:
+        """
+        Function to add a chunk of a trajectory to the histogram
+        :param chunk: data frame with the cvs, the time, the weight and the columns in the conditions
+        :param conditions: some query style conditions to put on the frames
+        :return: self
+        """
+        index = np.where(_get_condition_mask(chunk, conditions), _get_bin_index(chunk[self.cvs].to_numpy(), self.edges),
+                         -1)
+        return self.add_index(index, chunk['weight'].to_numpy(), chunk['time'].to_numpy())
+
+    def add_trajectory(self, trajectory: MetaTrajectory, conditions: str | list[str] = None) -> HistogramAccumulator:
+        """
+        Function to add a trajectory to the histogram. A loaded trajectory is added from its bin index table and
+        condition mask without copying its data, and a lazy one is streamed chunk by chunk.
+        :param trajectory: the trajectory
+        :param conditions: some query style conditions to put on the frames
+        :return: self
+        """
+        if trajectory.lazy:
+            for chunk in trajectory.iter_chunks(trajectory.get_columns(self.cvs, conditions)):
+                self.add_chunk(chunk, conditions)
+            return self
 
-            err = (pd
-                   .DataFrame(err, index=x, columns=y)
-                   .reset_index()
-                   .rename(columns={'index': self.cvs[0]})
-                   .melt(id_vars=self.cvs[0], var_name=self.cvs[1], value_name='symmetry_error')
-                   )
+        index = np.where(trajectory.get_condition_mask(conditions), trajectory.get_bin_index(self.cvs, self.edges), -1)
+        return self.add_index(index, trajectory.get_column('weight'), trajectory.get_column('time'))
 
-            self._data = data.merge(err)
-        else:
-            raise ValueError("That symmetry hasn't been built in yet.")
 
-        return self
+class FreeEnergyHistogram:
+    """
+    Class to hold a reweighted histogram over any number of cvs. Only the occupied bins are kept, as the log of their
+    weight keyed by the flat index of the bin, so free energy lines and surfaces in any of the cvs can be projected out
+    without going back to the trajectories.
+    """
 
-    def get_mean_force(self) -> pd.DataFrame:
-        """
-        Function to get the mean force from the free energy surface
-        :return: Dataframe of the mean force
-        """
-        cv1 = self.cvs[0]
-        cv2 = self.cvs[1]
-        x = self._data.pivot(index=[cv1], columns=[cv2], values=['energy']).index.to_list()
-        y = [i[1] for i in self._data.pivot(index=[cv1], columns=[cv2], values=['energy']).columns.to_list()]
-        v = self._data.pivot(index=[cv1], columns=[cv2], values=['energy']).to_numpy()
+    def __init__(self, cvs: list[str], edges: list[np.ndarray], index: np.ndarray, log_weight: np.ndarray,
+                 temperature: float = 298, metadata: dict = None):
+        """
+        init for the histogram
+        :param cvs: the cvs of the histogram
+        :param edges: the bin edges for each cv
+        :param index: the flat index of each occupied bin, with the last cv changing fastest
+        :param log_weight: the log of the weight in each occupied bin
+        :param temperature: temperature of the trajectories
+        :param metadata: any metadata to do with the histogram
+        """
+        self.cvs = list(cvs)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.shape = tuple(len(e) - 1 for e in self.edges)
+        self._index = np.asarray(index, dtype=np.int64)
+        self._log_weight = np.asarray(log_weight, dtype=np.float64)
+        self.temperature = temperature
+        self._metadata = metadata
+
+    @property
+    def n_occupied(self) -> int:
+        return self._index.shape[0]
 
-        force = [-f for f in np.gradient(v, x, y)]
+    @property
+    def metadata(self):
+        return self._metadata
 
-        grad1 = (pd
-                 .DataFrame(force[0], index=x, columns=y)
-                 .reset_index()
-                 .rename(columns={'index': cv1})
-                 .melt(id_vars=[cv1], var_name=cv2, value_name=f'{cv1}_grad')
-                 )
+    @staticmethod
+    def _log_sum_exp(keys: np.ndarray, log_weight: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to add up the weights that share a key, working with the logs of the weights so small weights are
+        not lost
+        :param keys: the key of each weight
+        :param log_weight: the log of each weight
+        :return: the unique keys and the log of the total weight of each
+        """
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        top = np.full(unique_keys.shape[0], -np.inf)
+        np.maximum.at(top, inverse, log_weight)
+        total = np.bincount(inverse, weights=np.exp(log_weight - top[inverse]), minlength=unique_keys.shape[0])
+        return unique_keys, np.log(total) + top
+
+    def get_projection(self, cvs: str | list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to marginalise the histogram onto some of its cvs
+        :param cvs: the cv(s) to keep
+        :return: the flat index of the occupied bins of the projection, and the log of their weight
+        """
+        cvs = [cvs] if type(cvs) == str else cvs
+        axes = [self.cvs.index(c) for c in cvs]
+        bin_index = np.unravel_index(self._index, self.shape)
+        keys = np.ravel_multi_index([bin_index[a] for a in axes], [self.shape[a] for a in axes])
+        return self._log_sum_exp(keys, self._log_weight)
+
+    def _get_dense_density(self, cvs: list[str]) -> np.ndarray:
+        """
+        Function to get the normalised density of a projection of the histogram on its full grid
+        :param cvs: the cvs of the projection
+        :return: the density, with a dimension for each cv
+        """
+        keys, log_weight = self.get_projection(cvs)
+        shape = [self.shape[self.cvs.index(c)] for c in cvs]
+        density = np.zeros(int(np.prod(shape)))
+        density[keys] = np.exp(log_weight - log_weight.max())
+        density = density.reshape(shape) / density.sum()
+        for i, c in enumerate(cvs):
+            view = [1] * len(cvs)
+            view[i] = -1
+            density = density / np.diff(self.edges[self.cvs.index(c)]).reshape(view)
+
+        return density
+
+    def get_line(self, cv: str) -> FreeEnergyLine:
+        """
+        Function to get the free energy line of one of the cvs of the histogram
+        :param cv: the cv of the line
+        :return: a free energy line
+        """
+        edges = self.edges[self.cvs.index(cv)]
+        data = (FreeEnergySpace
+                ._histogram_to_data((self._get_dense_density([cv]), edges), cv, edges, self.temperature)
+                .filter([cv, 'energy', 'population'])
+                )
+        return FreeEnergyLine(data, temperature=self.temperature, metadata=self._metadata)
 
-        grad2 = (pd
-                 .DataFrame(force[1], index=x, columns=y)
-                 .reset_index()
-                 .rename(columns={'index': cv1})
-                 .melt(id_vars=[cv1], var_name=cv2, value_name=f'{cv2}_grad')
-                 )
+    def get_surface(self, cvs: list[str, str]) -> FreeEnergySurface:
+        """
+        Function to get the free energy surface of two of the cvs of the histogram
+        :param cvs: list with the two cvs. The first will go on the x-axis, the second on the y-axis
+        :return: a free energy surface
+        """
+        edges = [self.edges[self.cvs.index(c)] for c in cvs]
+        data = FreeEnergySpace._histogram_to_data((self._get_dense_density(cvs), *edges), cvs, edges, self.temperature)
+        return FreeEnergySurface(data, temperature=self.temperature, metadata=self._metadata)
 
-        force = grad1.merge(grad2)
+    def get_data(self) -> pd.DataFrame:
+        """
+        Function to get the occupied bins of the histogram, with the center of each bin, the log of its weight, its
+        population as a density and its energy
+        :return: data frame with one row per occupied bin
+        """
+        bin_index = np.unravel_index(self._index, self.shape)
+        centers = {c: ((e[1:] + e[:-1]) / 2)[i] for c, e, i in zip(self.cvs, self.edges, bin_index)}
+        volume = np.prod([np.diff(e)[i] for e, i in zip(self.edges, bin_index)], axis=0)
+        log_population = self._log_weight - self._log_sum_exp(np.zeros(self.n_occupied), self._log_weight)[1]
+        data = (pd.DataFrame(centers)
+                .assign(log_weight=self._log_weight)
+                .assign(population=np.exp(log_population) / volume)
+                .assign(energy=-Kb * self.temperature * (log_population - np.log(volume)))
+                )
 
-        return force
+        return data
 
 
 class FreeEnergySpace:
@@ -493,6 +2072,8 @@ class FreeEnergySpace:
         self.cvs = []
         self._opes = None
         self._biasexchange = None
+        self._hills_files = []
+        self._opes_kernels = None
         self.temperature = temperature
         self.lines = {}
         self.surfaces = []
@@ -500,33 +2081,31 @@ class FreeEnergySpace:
         self._metadata = metadata
 
         if hills_file is not None and type(hills_file) == str:
+            self._hills_files = [HillsFile(hills_file)]
             self._hills, self.sigmas, self.n_walker, self.n_timesteps, self.max_time, self.dt, self.cvs, \
-                self_opes, self._biasexchange = self.get_hills_attributes(hills_file)
+                self._opes, self._biasexchange = self.get_hills_attributes(self._hills_files[0])
         elif hills_file is not None and type(hills_file) == list:
+            with ThreadPoolExecutor(max_workers=len(hills_file)) as executor:
+                self._hills_files = list(executor.map(HillsFile, hills_file))
             self._hills, self.sigmas, self.n_walker, self.n_timesteps, self.max_time, self.dt, self.cvs, \
-                self_opes, self._biasexchange = self.get_bias_exchange_hills_attributes(hills_file)
-
-        # if hills_file is not None and type(hills_file) == list:
+                self._opes, self._biasexchange = self.get_bias_exchange_hills_attributes(self._hills_files)
 
-    def get_bias_exchange_hills_attributes(self, hills_files: list[str]):
+    def get_bias_exchange_hills_attributes(self, hills_files: list[str | HillsFile]):
         """
-        Function to get attributes from a hills file if its a bias-exchange simulation
-        :param hills_files: hills file paths as a list
+        Function to get attributes from a hills file if its a bias-exchange simulation. Each hills file is parsed once,
+        so already read hills files are used as they are.
+        :param hills_files: hills file paths or already read hills files as a list
         :return:
         """
-        hills_list = [self.get_hills_attributes(h)[0] for h in hills_files]
-        sigma_list = [self.get_hills_attributes(h)[1] for h in hills_files]
-        n_timestep_list = [self.get_hills_attributes(h)[3] for h in hills_files]
-        max_time_list = [self.get_hills_attributes(h)[4] for h in hills_files]
-        dt_list = [self.get_hills_attributes(h)[5] for h in hills_files]
-        opes_list = [self.get_hills_attributes(h)[7] for h in hills_files]
-        cvs = [self.get_hills_attributes(h)[6][0] for h in hills_files]
-        sigmas = {k: v for d in sigma_list for k, v in d.items()}
+        hills_list = [HillsFile(h) if type(h) == str else h for h in hills_files]
+
+        cvs = [h.cvs[0] for h in hills_list]
+        sigmas = {k: v for h in hills_list for k, v in h.sigmas.items()}
         n_walker = len(hills_files)
         biasexchange = True
 
         hills = (pd
-                 .concat([(hills_list[i]
+                 .concat([(hills_list[i]._hills
                            .rename(columns={cvs[i]: 'value'})
                            .assign(variable=cvs[i])
                            .drop(columns=["walker"])
@@ -534,84 +2113,135 @@ class FreeEnergySpace:
                  .sort_values(["time", "variable"])
                  )
 
-        if len(set(n_timestep_list)) == 1 and len(set(max_time_list)) == 1 and len(set(dt_list)) == 1:
-            n_timesteps = n_timestep_list[0]
-            max_time = max_time_list[0]
-            dt = dt_list[0]
+        if (len(set(h.n_timesteps for h in hills_list)) == 1 and len(set(h.max_time for h in hills_list)) == 1
+                and len(set(h.dt for h in hills_list)) == 1):
+            n_timesteps = hills_list[0].n_timesteps
+            max_time = hills_list[0].max_time
+            dt = hills_list[0].dt
         else:
             raise ValueError("Check the time increments of your HILLS files")
 
-        if len(set(opes_list)) == 1:
-            opes = opes_list[0]
+        if len(set(h.opes for h in hills_list)) == 1:
+            opes = hills_list[0].opes
         else:
             raise ValueError("Check the opes status of your hills files")
 
         return hills, sigmas, n_walker, n_timesteps, max_time, dt, cvs, opes, biasexchange
 
-    def get_hills_attributes(self, hills_file: str):
+    def get_hills_attributes(self, hills_file: str | HillsFile):
         """
         Function to get attributes from a hills file
-        :param hills_file: hills file path
+        :param hills_file: hills file path, or an already read hills file
         :return:
         """
-        hills, sigmas = self._read_file(hills_file)
-        n_walker = hills[hills['time'] == min(hills['time'])].shape[0]
-        n_timesteps = hills[['time']].drop_duplicates().shape[0]
-        max_time = hills['time'].max()
-        dt = max_time/n_timesteps
-        cvs = (hills
-               .drop(columns=['time', 'height', 'walker', 'logweight'], errors='ignore')
-               .columns
-               .to_list()
-               )
-        opes = False if 'logweight' not in hills.columns.to_list() else True
+        hills = HillsFile(hills_file) if type(hills_file) == str else hills_file
         bias_exchange = False
-        return hills, sigmas, n_walker, n_timesteps, max_time, dt, cvs, opes, bias_exchange
+        return hills._hills, hills.sigmas, hills.n_walker, hills.n_timesteps, hills.max_time, hills.dt, hills.cvs, \
+            hills.opes, bias_exchange
+
+    def refresh(self):
+        """
+        Function to read in what plumed has appended to the hills and colvar files of the space since they were last
+        read. Only the new rows are parsed, and the walker and time attributes are updated from them. For bias-exchange
+        the time attributes are those of the replica that is furthest behind.
+        :return: self
+        """
+        if self._hills is not None and not self._biasexchange:
+            hills_file = self._hills_files[0]
+            hills_file.refresh()
+            self._hills = hills_file._hills
+            self.n_walker, self.n_timesteps, self.max_time, self.dt = \
+                hills_file.n_walker, hills_file.n_timesteps, hills_file.max_time, hills_file.dt
+
+        elif self._hills is not None:
+            new_hills = pd.concat([(h.refresh()
+                                    .rename(columns={h.cvs[0]: 'value'})
+                                    .assign(variable=h.cvs[0])
+                                    .drop(columns=["walker"])
+                                    ) for h in self._hills_files])
+
+            if new_hills.shape[0] > 0:
+                new_min = new_hills['time'].min()
+                tail = (pd
+                        .concat([self._hills[self._hills['time'] >= new_min], new_hills])
+                        .sort_values(["time", "variable"])
+                        )
+                self._hills = pd.concat([self._hills[self._hills['time'] < new_min], tail])
+
+            self.n_timesteps = min(h.n_timesteps for h in self._hills_files)
+            self.max_time = min(h.max_time for h in self._hills_files)
+            self.dt = self.max_time/self.n_timesteps
+
+        for t in self.trajectories.values():
+            t.refresh()
+
+        self._opes_kernels = None
+
+        return self
 
     @property
     def metadata(self):
         return self._metadata
 
     @classmethod
-    def from_standard_directory(cls, standard_dir, colvar_string_matcher: str = "COLVAR_REWEIGHT.", **kwargs):
+    def from_standard_directory(cls, standard_dir, colvar_string_matcher: str = "COLVAR_REWEIGHT.", cache: bool = False,
+                                lazy: bool = False, workers: int = None, processes: bool = False, **kwargs):
         """
         alternate constructor to make a free energy space from a standard metadynamics directory. In this directory,
         the free energy lines and surfaces are held in folders called FES_* . The reweight data is held in COLVAR files
         called COLVAR_REWEIGHT.* .
         :param standard_dir: The directory with the plumed/gromacs files
         :param colvar_string_matcher: the string that matches to the colvar files names
+        :param cache: cache the parsed colvar files as binary sidecars, see MetaTrajectory
+        :param lazy: stream the colvar files when they are needed rather than loading them, see MetaTrajectory
+        :param workers: number of workers to read the files with at the same time. None reads them one after another
+        :param processes: use a pool of processes rather than threads for the workers
         :return: a populated FreeEnergySpace
         """
         temperature = kwargs['temperature'] if 'temperature' in kwargs.keys() else 298
 
         space = cls(**kwargs)
-
-        for f in os.scandir(standard_dir):
-            if (f.is_dir() and f.path.split("/")[-1].split("_")[0] == "FES"
-                    and len(f.path.split("/")[-1].split("_")) == 2):
-                path = f.path + "/"
-                print(f"Adding a free energy line from files in {path}")
-                files = [path + d for d in os.listdir(path)]
-                files = files[0] if len(files) == 1 else files
-                line = FreeEnergyLine.from_plumed(files, temperature=temperature)
-                space.add_line(line)
-
-        for f in os.scandir(standard_dir):
-            if (f.is_dir() and f.path.split("/")[-1].split("_")[0] == "FES"
-                    and len(f.path.split("/")[-1].split("_")) == 3):
-                path = f.path + "/"
-                print(f"Adding a free energy surface from files in {path}")
-                files = [path + d for d in os.listdir(path)]
-                files = files[0] if len(files) == 1 else files
-                surface = FreeEnergySurface.from_plumed(files, temperature=temperature)
-                space.add_surface(surface)
-
-        for f in [standard_dir + "/" + f for f in os.listdir(standard_dir)
-                  if colvar_string_matcher in f and 'bck' not in f]:
-            file = f.split("/")[-1]
-            print(f"Adding {file} as a metaD trajectory")
-            traj = MetaTrajectory(f, temperature=temperature)
-            space.add_metad_trajectory(traj)
+        load_trajectory = partial(MetaTrajectory, temperature=temperature, cache=cache, lazy=lazy)
+        colvar_files = [standard_dir + "/" + f for f in os.listdir(standard_dir)
+                        if colvar_string_matcher in f and 'bck' not in f]
+
+        executor = None
+        if workers is not None:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            executor = pool(max_workers=workers)
+
+        try:
+            # the colvar files are the biggest, so they start loading first while the fes files are read
+            trajectories = [executor.submit(load_trajectory, f) for f in colvar_files] if executor is not None else None
+
+            for f in os.scandir(standard_dir):
+                if (f.is_dir() and f.path.split("/")[-1].split("_")[0] == "FES"
+                        and len(f.path.split("/")[-1].split("_")) == 2):
+                    path = f.path + "/"
+                    print(f"Adding a free energy line from files in {path}")
+                    files = [path + d for d in os.listdir(path)]
+                    files = files[0] if len(files) == 1 else files
+                    line = FreeEnergyLine.from_plumed(files, executor=executor, temperature=temperature)
+                    space.add_line(line)
+
+            for f in os.scandir(standard_dir):
+                if (f.is_dir() and f.path.split("/")[-1].split("_")[0] == "FES"
+                        and len(f.path.split("/")[-1].split("_")) == 3):
+                    path = f.path + "/"
+                    print(f"Adding a free energy surface from files in {path}")
+                    files = [path + d for d in os.listdir(path)]
+                    files = files[0] if len(files) == 1 else files
+                    surface = FreeEnergySurface.from_plumed(files, executor=executor, temperature=temperature)
+                    space.add_surface(surface)
+
+            for i, f in enumerate(colvar_files):
+                file = f.split("/")[-1]
+                print(f"Adding {file} as a metaD trajectory")
+                traj = load_trajectory(f) if trajectories is None else trajectories[i].result()
+                space.add_metad_trajectory(traj)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         return space
 
@@ -622,29 +2252,6 @@ class FreeEnergySpace:
         else:
             return None
 
-    @staticmethod
-    def _read_file(file: str):
-        """
-        Function to read in _hills _data
-        :param file: file to read in
-        :return: _data in that file in pandas format
-        """
-        col_file = open(file)
-        col_names = col_file.readline().strip().split(" ")[2:]
-        col_file.close()
-        sigmas = [col for col in col_names if col.split("_")[0] == 'sigma']
-        data = pd.read_table(file, sep='\s+', comment="#", names=col_names, dtype=np.float64)
-        sigmas = {s.split("_")[1]: data.loc[0, s] for s in sigmas}
-
-        data = (data
-                .loc[:, ~data.columns.str.startswith('sigma')]
-                .drop(columns=['biasf'], errors='ignore')
-                .assign(time=lambda x: x['time'] / 1000)
-                .assign(walker=lambda x: x.groupby('time').cumcount())
-                )
-
-        return data, sigmas
-
     def add_metad_trajectory(self, meta_trajectory: MetaTrajectory):
         """
         function to add a metad trajectory to the landscape
@@ -847,30 +2454,214 @@ class FreeEnergySpace:
 
         return figure
 
+    def get_opes_kernels(self) -> OpesKernels:
+        """
+        Function to get the opes kernels of the space, from the Kernels.data file it was made with. The kernels are only
+        read the first time they are needed.
+        :return: the opes kernels
+        """
+        if self._opes_kernels is None:
+            if self._hills is None or not self._opes or self._biasexchange:
+                raise ValueError("This space was not made from an opes kernels file!")
+            self._opes_kernels = OpesKernels(self._hills_files[0].file, temperature=self.temperature)
+
+        return self._opes_kernels
+
+    def get_opes_fes(self, bins: int | list[int] = 100,
+                     ranges: dict[str, tuple[float, float]] = None) -> FreeEnergyLine | FreeEnergySurface:
+        """
+        Function to get the free energy estimated by the opes bias at the end of the kernels file, without having to
+        run plumed on it
+        :param bins: number of grid points for each cv, or a list with the number for each cv
+        :param ranges: the (min, max) of the grid for any of the cvs, by default the range of the kernel centers
+        :return: a free energy line for one cv, or a free energy surface for two
+        """
+        kernels = self.get_opes_kernels()
+        fes_data = (kernels
+                    .get_fes(bins=bins, ranges=ranges)
+                    .drop(columns=['bias'])
+                    .pipe(boltzmann_energy_to_population, temperature=self.temperature, x_col=kernels.cvs[0])
+                    )
+
+        if len(kernels.cvs) == 1:
+            return FreeEnergyLine(fes_data, temperature=self.temperature, metadata=self._metadata)
+        elif len(kernels.cvs) == 2:
+            return FreeEnergySurface(fes_data, temperature=self.temperature, metadata=self._metadata)
+        else:
+            raise ValueError("Only opes fes with one or two cvs can be made into a line or surface")
+
+    def get_fes_from_hills(self, cvs: str | list[str], bins: int | list[int] = 201,
+                           ranges: dict[str, tuple[float, float]] = None, stride: int = None,
+                           chunksize: int = 2000) -> FreeEnergyLine | FreeEnergySurface:
+        """
+        Function to sum the hills into the free energy, like plumed sum_hills but without running plumed. The hills
+        are added in the order they were deposited, in chunks so that the memory used is bounded, and a snapshot of
+        the free energy is taken every stride hills. If the hills have cvs that are not asked for, they are integrated
+        out.
+        :param cvs: the cv for a line, or the two cvs for a surface
+        :param bins: number of grid points for each cv of the hills, or a list with the number for each cv
+        :param ranges: the (min, max) of the grid for any of the cvs, by default the range of the hill centers plus
+        the sum_hills margin
+        :param stride: number of hills between the snapshots in the time data, None for just the final free energy
+        :param chunksize: number of hills to add at once
+        :return: a free energy line or surface, with the snapshots as time data numbered from 0
+        """
+        cvs = [cvs] if type(cvs) == str else list(cvs)
+        if self._hills is None or self._opes:
+            raise ValueError("This space does not have a metadynamics hills file!")
+        hills_files = [h for h in self._hills_files if set(cvs).issubset(h.cvs)]
+        if not hills_files:
+            raise ValueError("None of the hills files of this space have those cvs")
+
+        hills_file = hills_files[0]
+        hills = hills_file.get_data()
+        hills_cvs = hills_file.cvs
+        centers = hills[hills_cvs].to_numpy()
+        heights = hills['height'].to_numpy()
+        sigmas = np.tile([hills_file.sigmas[c] for c in hills_cvs], (centers.shape[0], 1))
+
+        # sum_hills puts sqrt(2 * 6.25) sigmas of grid around the hill centers
+        bins = bins if type(bins) == list else [bins] * len(hills_cvs)
+        ranges = {} if ranges is None else ranges
+        margin = np.sqrt(2 * 6.25) * sigmas[0]
+        axes = [np.linspace(*ranges.get(c, (centers[:, i].min() - margin[i], centers[:, i].max() + margin[i])), b)
+                for i, (c, b) in enumerate(zip(hills_cvs, bins))]
+
+        kt = Kb * self.temperature
+        integrate = tuple(i for i, c in enumerate(hills_cvs) if c not in cvs)
+        kept = [c for c in hills_cvs if c in cvs]
+        stride = heights.shape[0] if stride is None else stride
+        bias = np.zeros([a.shape[0] for a in axes])
+        fes_data = {}
+
+        for number, start in enumerate(range(0, heights.shape[0], stride)):
+            end = min(start + stride, heights.shape[0])
+            for first in range(start, end, chunksize):
+                last = min(first + chunksize, end)
+                # the sum_hills files match untruncated hills, which 6.25 sigmas is far enough out to give
+                bias += _sum_kernels_on_grid(axes, centers[first:last], sigmas[first:last], heights[first:last],
+                                             cutoff=6.25)
+
+            energy = -bias
+            if integrate:
+                shift = energy.min()
+                energy = shift - kt * np.log(np.exp(-(energy - shift) / kt).sum(axis=integrate))
+            energy = np.moveaxis(energy, [kept.index(c) for c in cvs], range(len(cvs)))
+
+            # the grid is laid out like the sum_hills output, with the first cv changing fastest
+            grid = np.meshgrid(*[axes[hills_cvs.index(c)] for c in cvs], indexing='ij')
+            fes_data[number] = (pd
+                                .DataFrame({**{c: g.ravel(order='F') for c, g in zip(cvs, grid)},
+                                            'energy': energy.ravel(order='F')})
+                                .assign(energy=lambda x: x['energy'] - x['energy'].min())
+                                .pipe(boltzmann_energy_to_population, temperature=self.temperature, x_col=cvs[0])
+                                )
+
+        fes_data = fes_data if len(fes_data) > 1 else fes_data[0]
+        if len(cvs) == 1:
+            return FreeEnergyLine(fes_data, temperature=self.temperature, metadata=self._metadata)
+        elif len(cvs) == 2:
+            return FreeEnergySurface(fes_data, temperature=self.temperature, metadata=self._metadata)
+        else:
+            raise ValueError("Only one or two cvs can be made into a line or surface")
+
+    def _get_bias_kernels(self):
+        """
+        Function to get the hills as the kernels of the bias that metad applied. Well-tempered hills files have the
+        heights scaled by gamma/(gamma-1), and metad stretches the gaussians so that they go to 0 at their cutoff.
+        :return: the cvs, centers, sigmas and heights of the kernels, and the cutoff in sigmas
+        """
+        if self._hills is None or self._opes or self._biasexchange:
+            raise ValueError("This space does not have a single metadynamics hills file!")
+
+        hills_file = self._hills_files[0]
+        hills = hills_file.get_data()
+        biasfactor = hills_file.biasfactor
+        scale = 1 if biasfactor is None else (biasfactor - 1) / biasfactor
+        centers = hills[hills_file.cvs].to_numpy()
+        sigmas = np.tile([hills_file.sigmas[c] for c in hills_file.cvs], (centers.shape[0], 1))
+        heights = hills['height'].to_numpy() * scale / (1 - np.exp(-6.25))
+
+        return hills_file.cvs, centers, sigmas, heights, np.sqrt(2 * 6.25)
+
+    def get_bias_from_hills(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Function to get the bias of all the hills at some points, as plumed driver does when it restarts from the hills
+        file
+        :param data: data frame with a column for each cv of the hills
+        :return: the bias at each point
+        """
+        cvs, centers, sigmas, heights, cutoff = self._get_bias_kernels()
+        return _sum_kernels(data[cvs].to_numpy(dtype=np.float64), centers, sigmas, heights, cutoff)
+
+    def get_reweight_factor_from_hills(self, ranges: dict[str, tuple[float, float]] = None,
+                                       bins: dict[str, int] = None) -> float:
+        """
+        Function to get c(t) for the bias of all the hills, worked out on a grid the same way as CALC_RCT
+        :param ranges: the GRID_MIN and GRID_MAX of metad for any of the cvs, by default the range of the hill centers
+        plus the sum_hills margin
+        :param bins: the GRID_BIN of metad for any of the cvs, by default the plumed default of a fifth of a sigma
+        :return: the reweight factor
+        """
+        cvs, centers, sigmas, heights, cutoff = self._get_bias_kernels()
+        biasfactor = self._hills_files[0].biasfactor
+        if biasfactor is None or biasfactor <= 1:
+            raise ValueError("c(t) can only be worked out for well-tempered metadynamics with a bias factor above 1")
+
+        ranges = {} if ranges is None else ranges
+        bins = {} if bins is None else bins
+        margin = cutoff * sigmas[0]
+        ranges = [ranges.get(c, (centers[:, i].min() - margin[i], centers[:, i].max() + margin[i]))
+                  for i, c in enumerate(cvs)]
+        bins = [bins.get(c, int(np.ceil((r[1] - r[0]) / (0.2 * sigmas[0, i]))))
+                for i, (c, r) in enumerate(zip(cvs, ranges))]
+        axes = [np.linspace(r[0], r[1], b + 1) for r, b in zip(ranges, bins)]
+
+        bias = _sum_kernels_on_grid(axes, centers, sigmas, heights, cutoff)
+        kt = Kb * self.temperature
+        shifted = bias - bias.max()
+        return kt * np.log(np.exp(biasfactor / (biasfactor - 1) / kt * shifted).sum()
+                           / np.exp(1 / (biasfactor - 1) / kt * shifted).sum()) + bias.max()
+
+    def reweight_from_hills(self, ranges: dict[str, tuple[float, float]] = None, bins: dict[str, int] = None):
+        """
+        Function to set the bias of every trajectory to the bias of all the hills, with its c(t), so that trajectories
+        can be read straight from the colvar files of the run rather than from files rerun with plumed driver
+        :param ranges: the GRID_MIN and GRID_MAX of metad for any of the cvs, see get_reweight_factor_from_hills
+        :param bins: the GRID_BIN of metad for any of the cvs, see get_reweight_factor_from_hills
+        :return: self
+        """
+        reweight_factor = self.get_reweight_factor_from_hills(ranges=ranges, bins=bins)
+        for t in self.trajectories.values():
+            t.set_reweight_bias(self.get_bias_from_hills(t.get_data()), reweight_factor)
+
+        return self
+
     @staticmethod
-    def _reweight_traj_data(data: pd.DataFrame, cv: str | list[str], bins: int | list[int | float] = 200,
-                            temperature: float = 298, conditions: str | list[str] = None):
+    def _filter_data(data: pd.DataFrame, conditions: str | list[str] = None) -> pd.DataFrame:
         """
-        Function to reweight a _data frame using weights. Can do both one dimensional binning and two-dimensional
-        binning
-        :param data: _data frame to reweight
-        :param cv: the collective variable you are reweighting over
+        Function to filter a data frame with some query style conditions
+        :param data: _data frame to filter
+        :param conditions: conditions to discard frames
+        :return: filtered data frame
+        """
+        if conditions:
+            data = data[_get_condition_mask(data, conditions)]
+
+        return data
+
+    @staticmethod
+    def _histogram_to_data(histogram: tuple, cv: str | list[str], bins: int | list[int | float] = 200,
+                           temperature: float = 298) -> pd.DataFrame:
+        """
+        Function to turn a weighted density histogram into a reweighted dataframe with the population and the energy
+        :param histogram: the densities and the bin edges, in the form returned by np.histogram or np.histogram2d
+        :param cv: the collective variable(s) of the histogram
         :param bins: number of bins, or a list of bin boundaries
         :param temperature: temperature to get the population
-        :param conditions: conditions for the reweighting to discard frames
         :return: reweighted dataframe
         """
-
-        # filter the data if there is a condition
-        if conditions:
-            if type(conditions) == str:
-                data = data.query(conditions)
-            elif type(conditions) == list:
-                for c in conditions:
-                    data = data.query(c)
-
         if type(cv) == str:
-            histogram = np.histogram(a=data[cv], bins=bins, weights=data['weight'], density=True)
             x_points = [(histogram[1][i] + histogram[1][i + 1]) / 2 for i in range(0, len(histogram[1]) - 1)]
             if type(bins) == list:
                 x_widths = [(histogram[1][i+1] - histogram[1][i]) for i in range(0, len(histogram[1]) - 1)]
@@ -883,8 +2674,7 @@ class FreeEnergySpace:
                 cv: x_points
             }).pipe(boltzmann_population_to_energy, temperature=temperature)
 
-        elif type(cv) == list and len(cv) == 2:
-            histogram = np.histogram2d(x=data[cv[0]], y=data[cv[1]], bins=bins, weights=data['weight'], density=True)
+        else:
             x_points = [(histogram[1][i] + histogram[1][i + 1]) / 2 for i in range(0, len(histogram[1]) - 1)]
             y_points = [(histogram[2][i] + histogram[2][i + 1]) / 2 for i in range(0, len(histogram[2]) - 1)]
             reweighted_data = (pd.DataFrame(histogram[0], index=x_points, columns=y_points)
@@ -892,27 +2682,337 @@ class FreeEnergySpace:
                                .reset_index(names=cv[0])
                                .pipe(boltzmann_population_to_energy, temperature=temperature)
                                )
+
+        return reweighted_data
+
+    @staticmethod
+    def _reweight_traj_data(data: pd.DataFrame, cv: str | list[str], bins: int | list[int | float] = 200,
+                            temperature: float = 298, conditions: str | list[str] = None):
+        """
+        Function to reweight a _data frame using weights. Can do both one dimensional binning and two-dimensional
+        binning
+        :param data: _data frame to reweight
+        :param cv: the collective variable you are reweighting over
+        :param bins: number of bins, or a list of bin boundaries
+        :param temperature: temperature to get the population
+        :param conditions: conditions for the reweighting to discard frames
+        :return: reweighted dataframe
+        """
+
+        # filter the data if there is a condition
+        data = FreeEnergySpace._filter_data(data, conditions)
+
+        if type(cv) == str:
+            histogram = np.histogram(a=data[cv], bins=bins, weights=data['weight'], density=True)
+        elif type(cv) == list and len(cv) == 2:
+            histogram = np.histogram2d(x=data[cv[0]], y=data[cv[1]], bins=bins, weights=data['weight'], density=True)
         else:
             raise ValueError('Reweighting only supports one or two CVs at the moment')
 
-        return reweighted_data
+        return FreeEnergySpace._histogram_to_data(histogram, cv, bins, temperature)
+
+    @staticmethod
+    def _get_bin_specs(cvs: list[str], bins: int | list[int | float]) -> list:
+        """
+        Function to split a bins argument into one bin specification per cv, following the numpy histogram conventions
+        :param cvs: the cvs being binned
+        :param bins: number of bins, or a list of bin boundaries, or a list with one of these per cv
+        :return: list with the bin specification for each cv
+        """
+        if len(cvs) == 1:
+            return [bins]
+        elif type(bins) != int and len(bins) == len(cvs):
+            return list(bins)
+        else:
+            return [bins for _ in cvs]
+
+    @staticmethod
+    def _get_time_stamps(max_time: float, n_timestamps: int = None) -> np.ndarray:
+        """
+        Function to get the time stamps that split a trajectory into time blocks for time resolved reweighting
+        :param max_time: the time of the last frame
+        :param n_timestamps: number of time stamps, or None to put every frame in a single block
+        :return: the time stamps, each being the last time included in its block
+        """
+        if n_timestamps is None:
+            return np.array([np.inf])
+        return np.array([(i + 1) * max_time / n_timestamps for i in range(0, n_timestamps)])
+
+    @staticmethod
+    def _time_block_counts_to_data(counts: np.ndarray, edges: list[np.ndarray], cv: str | list[str],
+                                   bins: int | list[int | float] = 200, temperature: float = 298
+                                   ) -> dict[int, pd.DataFrame]:
+        """
+        Function to turn the counts of each time block into reweighted data up to each time stamp, using the cumulative
+        sum of the counts over the blocks
+        :param counts: the counts, with a leading dimension for the time blocks
+        :param edges: the bin edges for each cv
+        :param cv: the collective variable(s) of the histogram
+        :param bins: number of bins, or a list of bin boundaries
+        :param temperature: temperature to get the population
+        :return: dictionary with the reweighted data up to each time stamp, numbered from 1
+        """
+        fes_data = {}
+        for i, c in enumerate(np.cumsum(counts, axis=0)):
+            if len(edges) == 1:
+                histogram = (c / np.diff(edges[0]) / c.sum(), edges[0])
+            else:
+                histogram = (c / np.diff(edges[0])[:, None] / np.diff(edges[1])[None, :] / c.sum(), *edges)
+            fes_data[i + 1] = FreeEnergySpace._histogram_to_data(histogram, cv, bins, temperature)
+
+        return fes_data
+
+    @staticmethod
+    def _get_ranges(traj_list: list, cvs: list[str], conditions: str | list[str] = None
+                    ) -> tuple[np.ndarray | None, np.ndarray | None, float]:
+        """
+        Function to get the range of some cvs over the frames of a list of trajectories that pass some conditions, and
+        the time of the last frame. Lazy trajectories are streamed chunk by chunk.
+        :param traj_list: list of trajectories.
+        :param cvs: the cvs to get the range of.
+        :param conditions: some query style conditions to put on the frames.
+        :return: the min and max of each cv, which are None if no frames pass the conditions, and the max time
+        """
+        def get_frames():
+            for t in traj_list:
+                if t.lazy:
+                    for chunk in t.iter_chunks(t.get_columns(cvs, conditions)):
+                        mask = _get_condition_mask(chunk, conditions)
+                        yield chunk[cvs].to_numpy()[mask], chunk['time'].max()
+                else:
+                    mask = t.get_condition_mask(conditions)
+                    yield np.stack([t.get_column(c)[mask] for c in cvs], axis=1), t.get_column('time').max()
+
+        mins, maxs, max_time = None, None, None
+        for values, time in get_frames():
+            max_time = time if max_time is None else max(max_time, time)
+            if values.shape[0] == 0:
+                continue
+            mins = np.nanmin(values, axis=0) if mins is None else np.minimum(mins, np.nanmin(values, axis=0))
+            maxs = np.nanmax(values, axis=0) if maxs is None else np.maximum(maxs, np.nanmax(values, axis=0))
+
+        return mins, maxs, max_time
+
+    @staticmethod
+    def _get_edges(cvs: list[str], bins: int | list[int | float], mins: np.ndarray = None,
+                   maxs: np.ndarray = None) -> list[np.ndarray]:
+        """
+        Function to get the bin edges for each cv, following the numpy histogram conventions. If the bins are given as
+        integers, the bins cover the range of the cv.
+        :param cvs: the cvs to bin.
+        :param bins: number of bins, or a list of bin boundaries, or a list with one of these for each cv.
+        :param mins: the min of each cv, needed when the bins are integers.
+        :param maxs: the max of each cv, needed when the bins are integers.
+        :return: the bin edges for each cv
+        """
+        edges = []
+        for i, spec in enumerate(FreeEnergySpace._get_bin_specs(cvs, bins)):
+            if type(spec) == int:
+                cv_range = [0, 1] if mins is None else [mins[i], maxs[i]]
+                edges.append(np.histogram_bin_edges(np.array(cv_range, dtype=np.float64), bins=spec))
+            else:
+                edges.append(np.asarray(spec, dtype=np.float64))
+
+        return edges
+
+    @staticmethod
+    def _get_quantile_edges(traj_list: list, cv: str, n_bins: int, executor: Executor = None) -> np.ndarray:
+        """
+        Function to get bin edges with an equal number of frames in each bin, by merging the quantile sketches of the
+        trajectories. The edges are the same as pd.qcut on all the frames while there are fewer frames than the
+        capacity of the sketches.
+        :param traj_list: list of trajectories.
+        :param cv: the cv to bin.
+        :param n_bins: the number of bins.
+        :param executor: thread pool to get the sketches of the trajectories in, rather than one after another.
+        :return: the bin edges
+        """
+        sketches = (map(MetaTrajectory.get_quantile_sketch, traj_list, repeat(cv)) if executor is None
+                    else executor.map(MetaTrajectory.get_quantile_sketch, traj_list, repeat(cv)))
+        sketch = QuantileSketch(MetaTrajectory._quantile_sketch_capacity)
+        for s in sketches:
+            sketch.merge(s)
+
+        return sketch.get_quantiles(np.linspace(0, 1, n_bins + 1))
+
+    @staticmethod
+    def _get_cut_edges(mins: np.ndarray, maxs: np.ndarray, n_bins: list[int]) -> list[np.ndarray]:
+        """
+        Function to get evenly spaced bin edges over the range of each cv in the same way as pd.cut, which widens the
+        first bin by 0.1% of the range so the smallest value is inside it
+        :param mins: the min of each cv
+        :param maxs: the max of each cv
+        :param n_bins: the number of bins for each cv
+        :return: the bin edges for each cv
+        """
+        edges = []
+        for low, high, n in zip(mins, maxs, n_bins):
+            if low == high:
+                low, high = (low - 0.001 * abs(low), high + 0.001 * abs(high)) if low != 0 else (-0.001, 0.001)
+                edges.append(np.linspace(low, high, n + 1))
+            else:
+                e = np.linspace(low, high, n + 1)
+                e[0] -= (high - low) * 0.001
+                edges.append(e)
+
+        return edges
+
+    @staticmethod
+    def _get_trajectory_counts(traj_list: list, cvs: list[str], bins: int | list[int | float] = 200,
+                               conditions: str | list[str] = None, n_timestamps: int = None
+                               ) -> tuple[list[HistogramAccumulator], list[np.ndarray]]:
+        """
+        Function to get the weighted histogram counts in each time block of each of a list of trajectories, streaming
+        each trajectory into its own accumulator. If the bins are given as integers, the bins cover the range of the
+        frames that pass the conditions, which is found with a first pass over the trajectories.
+        :param traj_list: list of trajectories to count.
+        :param cvs: the cvs to bin.
+        :param bins: number of bins, or a list of bin boundaries.
+        :param conditions: some query style conditions to put on the histogram.
+        :param n_timestamps: number of time stamps splitting the trajectories into blocks, or None for one block.
+        :return: the accumulator of each trajectory, and the bin edges
+        """
+        mins, maxs, max_time = None, None, None
+        if n_timestamps is not None or any(type(b) == int for b in FreeEnergySpace._get_bin_specs(cvs, bins)):
+            mins, maxs, max_time = FreeEnergySpace._get_ranges(traj_list, cvs, conditions)
+
+        edges = FreeEnergySpace._get_edges(cvs, bins, mins, maxs)
+        time_stamps = FreeEnergySpace._get_time_stamps(max_time, n_timestamps)
+        accumulators = [HistogramAccumulator(cvs, edges, time_stamps).add_trajectory(t, conditions) for t in traj_list]
+
+        return accumulators, edges
+
+    @staticmethod
+    def _reweight_traj_stream(traj_list: list, cv: str | list[str], bins: int | list[int | float] = 200,
+                              temperature: float = 298, conditions: str | list[str] = None, n_timestamps: int = None
+                              ) -> (pd.DataFrame | dict[pd.DataFrame]):
+        """
+        Function to reweight a list of trajectories by streaming them one at a time into a running histogram, so the
+        trajectories are never concatenated. Loaded trajectories are counted from their bin index tables and condition
+        masks, and lazy trajectories chunk by chunk, so only one chunk is held in memory at a time. The same bin edges
+        are used for every time stamp.
+        :param traj_list: list of trajectories to reweight.
+        :param cv: the cv(s) in which to get the reweight.
+        :param bins: number of bins, or a list of bin boundaries.
+        :param temperature: temperature to get the population.
+        :param conditions: some query style conditions to put on the histogram.
+        :param n_timestamps: number of time stamps to have in the _time_data.
+        :return: reweighted trajectory data.
+        """
+        cvs = [cv] if type(cv) == str else cv
+        if len(cvs) > 2:
+            raise ValueError('Reweighting only supports one or two CVs at the moment')
+
+        accumulators, edges = FreeEnergySpace._get_trajectory_counts(traj_list, cvs, bins, conditions, n_timestamps)
+        counts = sum(a.counts for a in accumulators)
+        fes_data = FreeEnergySpace._time_block_counts_to_data(counts, edges, cv, bins, temperature)
+        return fes_data[1] if n_timestamps is None else fes_data
 
-    def get_reweighted_surface(self, cvs: list[str, str], bins: list[int, int], conditions: str | list[str] = None):
+    @staticmethod
+    def _reweight_traj_kde(traj_list: list, cv: str | list[str], bins: int | list[int] = 200, temperature: float = 298,
+                           conditions: str | list[str] = None, bandwidth: float | list[float] = None) -> pd.DataFrame:
+        """
+        Function to get the reweighted density of a list of trajectories with a weighted gaussian kernel density
+        estimate on an evenly spaced grid. The frames are linearly binned onto the grid and then convolved with the
+        kernel using FFTs, so the cost goes with the number of frames plus the grid size, rather than their product.
+        :param traj_list: list of trajectories to reweight.
+        :param cv: the cv(s) in which to get the reweight.
+        :param bins: number of grid points, or a list with the number for each cv.
+        :param temperature: temperature to get the population.
+        :param conditions: some query style conditions to put on the frames.
+        :param bandwidth: the bandwidth of the kernel along each cv. Defaults to Scott's rule with the effective
+        number of frames of the weights.
+        :return: reweighted data, with the density on the grid as the population
+        """
+        cvs = [cv] if type(cv) == str else cv
+        specs = FreeEnergySpace._get_bin_specs(cvs, bins)
+        if any(type(b) != int for b in specs):
+            raise ValueError("The kde method needs the number of grid points for each cv, not bin boundaries")
+        if any(b < 2 for b in specs):
+            raise ValueError("The kde method needs at least 2 grid points for each cv")
+        bandwidth = None if bandwidth is None else FreeEnergySpace._get_bin_specs(cvs, bandwidth)
+
+        def get_frames():
+            for t in traj_list:
+                if t.lazy:
+                    for chunk in t.iter_chunks(t.get_columns(cvs, conditions)):
+                        mask = _get_condition_mask(chunk, conditions)
+                        yield chunk[cvs].to_numpy()[mask], chunk['weight'].to_numpy()[mask]
+                else:
+                    mask = t.get_condition_mask(conditions)
+                    yield np.stack([t.get_column(c)[mask] for c in cvs], axis=1), t.get_column('weight')[mask]
+
+        # first pass to get the range of the grid and the weighted moments for the bandwidth
+        mins, maxs = None, None
+        weight_sum, weight_sum_sq, first_moment, second_moment = 0, 0, 0, 0
+        for values, weights in get_frames():
+            if values.shape[0] == 0:
+                continue
+            mins = values.min(axis=0) if mins is None else np.minimum(mins, values.min(axis=0))
+            maxs = values.max(axis=0) if maxs is None else np.maximum(maxs, values.max(axis=0))
+            weight_sum += weights.sum()
+            weight_sum_sq += (weights**2).sum()
+            first_moment = first_moment + weights @ values
+            second_moment = second_moment + weights @ values**2
+        if mins is None:
+            raise ValueError("no frames pass the conditions")
+        if np.any(maxs <= mins):
+            raise ValueError("The kde method needs every cv to take more than one value to make a grid")
+
+        axes = [np.linspace(mins[i], maxs[i], specs[i]) for i in range(0, len(cvs))]
+        if bandwidth is None:
+            n_eff = weight_sum**2 / weight_sum_sq
+            std = np.sqrt(np.maximum(second_moment / weight_sum - (first_moment / weight_sum)**2, 0))
+            bandwidth = std * n_eff**(-1 / (len(cvs) + 4))
+
+        # second pass to bin the frames onto the grid
+        counts = sum(_linear_binning(values, weights, axes) for values, weights in get_frames())
+        spacing = [a[1] - a[0] for a in axes]
+        density = np.maximum(_gaussian_smooth(counts, [h / d for h, d in zip(bandwidth, spacing)]), 0)
+        density = density / density.sum() / np.prod(spacing)
+
+        if len(cvs) == 1:
+            data = pd.DataFrame({cvs[0]: axes[0], 'population': density})
+        else:
+            data = (pd.DataFrame(density, index=axes[0], columns=axes[1])
+                    .melt(var_name=cvs[1], value_name='population', ignore_index=False)
+                    .reset_index(names=cvs[0])
+                    )
+
+        return data.pipe(boltzmann_population_to_energy, temperature=temperature)
+
+    def get_reweighted_surface(self, cvs: list[str, str], bins: list[int, int], conditions: str | list[str] = None,
+                               n_timestamps: int = None, method: str = 'histogram',
+                               bandwidth: float | list[float] = None):
         """
         Function to get a reweighted surface
         :param cvs: list with the two cvs. The first will go on the x-axis, the second on the y-axis
-        :param bins: list with two integers for the number of bins in each CV
+        :param bins: list with two integers for the number of bins in each CV, or grid points when using the kde
         :param conditions: conditions to apply to the reweighting
+        :param n_timestamps: number of time stamps to have in the _time_data
+        :param method: 'histogram' for weighted histograms, or 'kde' for a smooth weighted kernel density estimate
+        :param bandwidth: the bandwidth of the kde along each cv, defaults to Scott's rule
         :return: a free energy surface
         """
-        data = []
+        if n_timestamps is not None and type(n_timestamps) != int:
+            raise ValueError("n_timestamps needs to be None or integer!")
+        if method not in ['histogram', 'kde']:
+            raise ValueError("method needs to be 'histogram' or 'kde'")
+        if method == 'kde' and n_timestamps is not None:
+            raise ValueError("Time stamps are only supported with the histogram method")
+        traj_list = []
         for w, t in self.trajectories.items():
             if cvs[0] in t.cvs and cvs[1] in t.cvs:
-                data.append(t.get_data())
-        if not data:
+                traj_list.append(t)
+        if not traj_list:
             raise ValueError("no trajectories in this space have that CV")
-        data = pd.concat(data).sort_values('time')
-        fes_data = self._reweight_traj_data(data, cvs, bins, self.temperature, conditions=conditions)
+
+        if method == 'kde':
+            fes_data = self._reweight_traj_kde(traj_list, cvs, bins, self.temperature, conditions=conditions,
+                                               bandwidth=bandwidth)
+        else:
+            fes_data = self._reweight_traj_stream(traj_list, cvs, bins, self.temperature, conditions=conditions,
+                                                  n_timestamps=n_timestamps)
         surface = FreeEnergySurface(fes_data, temperature=self.temperature, metadata=self._metadata)
         return surface
 
@@ -921,7 +3021,8 @@ class FreeEnergySpace:
                             verbosity: bool = False, conditions: str | list[str] = None, temperature: float = 298
                             ) -> (pd.DataFrame | dict[pd.DataFrame]):
         """
-        Function to reweight a list of trajectories.
+        Function to reweight a list of trajectories. If any of the trajectories are lazy, the trajectories are streamed
+        in chunks rather than loaded.
         :param traj_list: list of trajectories to reweight.
         :param cv: the cv in which to get the reweight.
         :param bins: number of bins, or a list of bin boundaries.
@@ -931,51 +3032,38 @@ class FreeEnergySpace:
         :param temperature: temperature to get the population.
         :return: reweighted trajectory data.
         """
-        # grab the data from the trajectories
-        data = []
         for t in traj_list:
-            if cv in t.cvs:
-                data.append(t.get_data())
-            else:
+            if cv not in t.cvs:
                 raise ValueError("no trajectories in this space have that CV")
-        data = pd.concat(data).sort_values('time')
-
-        # reweight the data
-        if n_timestamps is None:
-            fes_data = (FreeEnergySpace
-                        ._reweight_traj_data(data, cv, bins, temperature=temperature, conditions=conditions)
-                        .filter([cv, 'energy', 'population'])
-                        )
-        elif type(n_timestamps) == int:
-            fes_data = {}
-            max_time = data['time'].max()
-            for i in range(0, n_timestamps):
-                time = (i + 1) * max_time / n_timestamps
-                filtered_data = data.query('time <= @time')
-                fes_data[i+1] = (FreeEnergySpace
-                                 ._reweight_traj_data(filtered_data, cv, bins, temperature=temperature,
-                                                      conditions=conditions)
-                                 .filter([cv, 'energy', 'population'])
-                                 )
-                if verbosity:
-                    print(f"Made histogram for {i} timestamp")
-        else:
+        if n_timestamps is not None and type(n_timestamps) != int:
             raise ValueError("n_timestamps needs to be None or integer!")
 
-        return fes_data
+        # stream the trajectories into a running histogram
+        fes_data = FreeEnergySpace._reweight_traj_stream(traj_list, cv, bins, temperature=temperature,
+                                                         conditions=conditions, n_timestamps=n_timestamps)
+        if verbosity and n_timestamps is not None:
+            print(f"Made histograms for {n_timestamps} timestamps")
+
+        if n_timestamps is None:
+            return fes_data.filter([cv, 'energy', 'population'])
+        return {k: v.filter([cv, 'energy', 'population']) for k, v in fes_data.items()}
 
     def get_reweighted_line(self, cv: str, bins: int | list[int | float] = 200, n_timestamps: int = None,
-                            verbosity: bool = False, conditions: str | list[str] = None, adaptive_bins: bool = False
+                            verbosity: bool = False, conditions: str | list[str] = None, adaptive_bins: bool = False,
+                            method: str = 'histogram', bandwidth: float = None, executor: Executor = None
                             ) -> FreeEnergyLine:
         """
         Function to get a free energy line from a free energy space with meta trajectories in it, using weighted
         histogram analysis.
         :param cv: the cv in which to get the reweight
-        :param bins: number of bins, or a list with the bin boundaries
+        :param bins: number of bins, or a list with the bin boundaries. The number of grid points when using the kde
         :param n_timestamps: number of time stamps to have in the _time_data
         :param verbosity: print progress?
         :param conditions: some query style conditions to put on the histogram
         :param adaptive_bins: whether to use bins with equal number of points
+        :param method: 'histogram' for a weighted histogram, or 'kde' for a smooth weighted kernel density estimate
+        :param bandwidth: the bandwidth of the kde, defaults to Scott's rule
+        :param executor: thread pool to get the quantile sketches of the trajectories in when using adaptive bins
         :return:
         """
         # grab the trajectories and put them in a list
@@ -983,10 +3071,25 @@ class FreeEnergySpace:
         for w, t in self.trajectories.items():
             traj_list.append(t)
 
-        # if using adaptive bins then get the quantiles
+        if method == 'kde':
+            if n_timestamps is not None or adaptive_bins:
+                raise ValueError("Time stamps and adaptive bins are only supported with the histogram method")
+            for t in traj_list:
+                if cv not in t.cvs:
+                    raise ValueError("no trajectories in this space have that CV")
+            fes_data = (self
+                        ._reweight_traj_kde(traj_list, cv, bins, self.temperature, conditions, bandwidth)
+                        .filter([cv, 'energy', 'population'])
+                        )
+            return FreeEnergyLine(fes_data, temperature=self.temperature, metadata=self._metadata)
+        elif method != 'histogram':
+            raise ValueError("method needs to be 'histogram' or 'kde'")
+
+        # if using adaptive bins then get the quantiles from the sketches of the trajectories
         if adaptive_bins is True:
-            traj_list_data = [s.get_data() for s in traj_list]
-            bins = pd.qcut(pd.concat(traj_list_data)[cv], bins, retbins=True)[1]
+            bins = self._get_quantile_edges(traj_list, cv, bins, executor)
+            if np.any(np.diff(bins) == 0):
+                raise ValueError("The adaptive bin edges are not unique, use fewer bins")
 
         # reweight the trajectories
         fes_data = self._reweight_traj_list(traj_list, cv, bins, n_timestamps, verbosity, conditions, self.temperature)
@@ -996,7 +3099,8 @@ class FreeEnergySpace:
 
     def get_reweighted_line_with_walker_error(self, cv: str, bins: int | list[int | float] = 200,
                                               verbosity: bool = False, conditions: str | list[str] = None,
-                                              adaptive_bins: bool = False) -> FreeEnergyLine:
+                                              adaptive_bins: bool = False, executor: Executor = None
+                                              ) -> FreeEnergyLine:
         """
         Function to get a free energy line from a free energy space with meta trajectories in it, using weighted
         histogram
@@ -1006,6 +3110,7 @@ class FreeEnergySpace:
         :param verbosity: print progress?
         :param conditions: some query style conditions to put on the histogram
         :param adaptive_bins: whether to make bins on quartiles
+        :param executor: thread pool to get the quantile sketches of the trajectories in when using adaptive bins
         :return:
         """
         if self.n_walker == 1:
@@ -1013,47 +3118,239 @@ class FreeEnergySpace:
 
         # grab the trajectories and put them in a list to get the bins if using adaptive
         if adaptive_bins is True and type(bins) == int:
-            traj_data = [t.get_data() for t in self.trajectories.values()]
-            bins = pd.qcut(pd.concat(traj_data)[cv], bins, retbins=True, duplicates='drop')[1]
+            bins = np.unique(self._get_quantile_edges(list(self.trajectories.values()), cv, bins, executor))
         elif adaptive_bins is True and type(bins) == list:
             raise ValueError("If using adaptive bins then give bins an integer, not a list")
         elif adaptive_bins is False and type(bins) == int:
-            traj_data = [t.get_data() for t in self.trajectories.values()]
-            bins = pd.cut(pd.concat(traj_data)[cv], bins, retbins=True, duplicates='drop')[1]
+            mins, maxs, _ = self._get_ranges(list(self.trajectories.values()), [cv])
+            bins = self._get_cut_edges(mins, maxs, [bins])[0]
+
+        line = (self
+                ._reweight_with_walker_error(cv, bins, conditions, verbosity)
+                .pipe(FreeEnergyLine, temperature=self.temperature, metadata=self._metadata)
+                )
+
+        return line
+
+    def get_reweighted_surface_with_walker_error(self, cvs: list[str, str], bins: list[int, int],
+                                                 conditions: str | list[str] = None, verbosity: bool = False
+                                                 ) -> FreeEnergySurface:
+        """
+        Function to get a reweighted surface, with errors calculated from the standard deviation of the multiple
+        walkers.
+        :param cvs: list with the two cvs. The first will go on the x-axis, the second on the y-axis
+        :param bins: list with the number of bins or the bin boundaries for each cv
+        :param conditions: conditions to apply to the reweighting
+        :param verbosity: print progress?
+        :return: a free energy surface
+        """
+        if self.n_walker == 1:
+            raise ValueError("there is only data from one walker in this space!")
+
+        # make bins shared by all the walkers, in the same way as for lines
+        specs = self._get_bin_specs(cvs, bins)
+        if any(type(b) == int for b in specs):
+            mins, maxs, _ = self._get_ranges(list(self.trajectories.values()), cvs)
+            specs = [self._get_cut_edges(mins[i:i + 1], maxs[i:i + 1], [b])[0] if type(b) == int else b
+                     for i, b in enumerate(specs)]
+
+        surface = (self
+                   ._reweight_with_walker_error(cvs, specs, conditions, verbosity)
+                   .pipe(FreeEnergySurface, temperature=self.temperature, metadata=self._metadata)
+                   )
+
+        return surface
+
+    def _reweight_with_walker_error(self, cv: str | list[str], bins: int | list[int | float],
+                                    conditions: str | list[str] = None, verbosity: bool = False) -> pd.DataFrame:
+        """
+        Function to reweight each walker on the same bins, and get the mean and standard error of the energy and
+        population in each bin. The histograms of the walkers are stacked into (walker x bin) arrays, and the bins
+        where a walker has no population are left out of the mean and the deviation for that bin.
+        :param cv: the cv(s) to reweight over
+        :param bins: the bin boundaries, shared by all the walkers
+        :param conditions: conditions to apply to the reweighting
+        :param verbosity: print progress?
+        :return: data frame with the cv(s), energy, population, energy_err and population_err for each bin
+        """
+        cvs = [cv] if type(cv) == str else cv
+        for t in self.trajectories.values():
+            if not set(cvs).issubset(t.cvs):
+                raise ValueError("not all the trajectories in this space have that CV")
 
-        # reweight each trajectory individually
         fes_data = []
         for w, t in self.trajectories.items():
             if verbosity:
                 print(f"Getting reweighted data for walker {w}")
-            new_fes_data = (self
-                            ._reweight_traj_list([t], cv, bins, verbosity=verbosity, conditions=conditions,
-                                                 temperature=self.temperature)
-                            .assign(walker=w)
-                            )
-            fes_data.append(new_fes_data)
-
-        # get the mean and std for each value of the cv and turn it into a line
-        line = (pd
-                .concat(fes_data)
-                .replace([np.inf, -np.inf], np.nan)
-                .dropna()
-                .groupby([cv])
-                .apply(lambda df: (df
-                                   .assign(energy_err=lambda x: x['energy'].std()/np.sqrt(len(self.trajectories)))
-                                   .assign(population_err=lambda x: x['population'].std()/np.sqrt(len(self.trajectories)))
-                                   .assign(energy=lambda x: x['energy'].mean())
-                                   .assign(population=lambda x: x['population'].mean())
-                                   .drop(columns=["walker"])
-                                   .drop_duplicates()
-                                   )
-                       )
+            fes_data.append(self._reweight_traj_stream([t], cv, bins, self.temperature, conditions=conditions))
+
+        energy = np.stack([d['energy'].to_numpy() for d in fes_data])
+        population = np.stack([d['population'].to_numpy() for d in fes_data])
+        valid = np.isfinite(energy) & np.isfinite(population)
+        n_valid = valid.sum(axis=0)
+
+        def mean_and_error(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            total = np.where(valid, values, 0).sum(axis=0)
+            mean = np.divide(total, n_valid, out=np.full(n_valid.shape, np.nan), where=n_valid > 0)
+            squares = np.where(valid, values - mean, 0)**2
+            std = np.sqrt(np.divide(squares.sum(axis=0), n_valid - 1, out=np.full(n_valid.shape, np.nan),
+                                    where=n_valid > 1))
+            return mean, std / np.sqrt(len(self.trajectories))
+
+        energy, energy_err = mean_and_error(energy)
+        population, population_err = mean_and_error(population)
+
+        return (fes_data[0][cvs]
+                .assign(energy=energy, population=population, energy_err=energy_err, population_err=population_err)
+                .loc[n_valid > 0]
                 .reset_index(drop=True)
+                )
+
+    def get_reweighted_histogram(self, cvs: list[str], bins: int | list[int | float] = 50,
+                                 conditions: str | list[str] = None) -> FreeEnergyHistogram:
+        """
+        Function to reweight the trajectories over any number of cvs, keeping only the occupied bins, so that lines
+        and surfaces in any of the cvs can be got from the histogram without reweighting again
+        :param cvs: the cvs to reweight over
+        :param bins: number of bins, or a list of bin boundaries, or a list with one of these for each cv
+        :param conditions: conditions to apply to the reweighting
+        :return: the reweighted histogram
+        """
+        traj_list = list(self.trajectories.values())
+        for t in traj_list:
+            if t.lazy:
+                raise ValueError("Reweighting over many cvs needs loaded trajectories")
+            if not set(cvs).issubset(t.cvs):
+                raise ValueError("not all the trajectories in this space have those CVs")
+
+        edges = self._get_edges(cvs, bins, *self._get_ranges(traj_list, cvs, conditions)[:2])
+        if np.prod([float(len(e) - 1) for e in edges]) >= 2**62:
+            raise ValueError("too many bins to index them with 64 bit integers")
+
+        # add up the occupied bins of each trajectory, and then of all of them
+        keys, weight = [], []
+        for t in traj_list:
+            index = np.where(t.get_condition_mask(conditions), t.get_bin_index(cvs, edges), -1)
+            occupied = (index >= 0) & (t.get_column('weight') > 0)
+            trajectory_keys, inverse = np.unique(index[occupied], return_inverse=True)
+            keys.append(trajectory_keys)
+            weight.append(np.bincount(inverse, weights=t.get_column('weight')[occupied],
+                                      minlength=trajectory_keys.shape[0]))
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        log_weight = np.log(np.bincount(inverse, weights=np.concatenate(weight), minlength=keys.shape[0]))
+
+        return FreeEnergyHistogram(cvs, edges, keys, log_weight, temperature=self.temperature,
+                                   metadata=self._metadata)
+
+    def get_reweighted_line_with_error(self, cv: str, bins: int | list[int | float] = 200, error: str = 'bootstrap',
+                                       n_blocks: int = 10, n_bootstrap: int = 200, conditions: str | list[str] = None,
+                                       seed: int = None, executor: Executor = None) -> FreeEnergyLine:
+        """
+        Function to get a reweighted free energy line with errors from block averaging or a bootstrap. The
+        trajectories are split into time blocks. With block averaging the error is the standard error of the histograms
+        of the blocks, and with the bootstrap it is the spread of histograms made from the blocks of every walker
+        resampled with Poisson weights.
+        :param cv: the cv in which to get the reweight
+        :param bins: number of bins, or a list with the bin boundaries
+        :param error: 'block' or 'bootstrap'
+        :param n_blocks: number of time blocks to split the trajectories into
+        :param n_bootstrap: number of bootstrap resamples
+        :param conditions: some query style conditions to put on the histogram
+        :param seed: seed for the bootstrap resampling
+        :param executor: executor to share the bootstrap resamples between, for example a ProcessPoolExecutor
+        :return: a free energy line with energy_err and population_err columns
+        """
+        line = (self
+                ._reweight_with_resampling_error(cv, bins, error, n_blocks, n_bootstrap, conditions, seed, executor)
                 .pipe(FreeEnergyLine, temperature=self.temperature, metadata=self._metadata)
                 )
 
         return line
 
+    def get_reweighted_surface_with_error(self, cvs: list[str, str], bins: list[int, int], error: str = 'bootstrap',
+                                          n_blocks: int = 10, n_bootstrap: int = 200,
+                                          conditions: str | list[str] = None, seed: int = None,
+                                          executor: Executor = None) -> FreeEnergySurface:
+        """
+        Function to get a reweighted surface with errors from block averaging or a bootstrap, in the same way as
+        get_reweighted_line_with_error.
+        :param cvs: list with the two cvs. The first will go on the x-axis, the second on the y-axis
+        :param bins: list with the number of bins or the bin boundaries for each cv
+        :param error: 'block' or 'bootstrap'
+        :param n_blocks: number of time blocks to split the trajectories into
+        :param n_bootstrap: number of bootstrap resamples
+        :param conditions: conditions to apply to the reweighting
+        :param seed: seed for the bootstrap resampling
+        :param executor: executor to share the bootstrap resamples between, for example a ProcessPoolExecutor
+        :return: a free energy surface with energy_err and population_err columns
+        """
+        surface = (self
+                   ._reweight_with_resampling_error(cvs, bins, error, n_blocks, n_bootstrap, conditions, seed, executor)
+                   .pipe(FreeEnergySurface, temperature=self.temperature, metadata=self._metadata)
+                   )
+
+        return surface
+
+    def _reweight_with_resampling_error(self, cv: str | list[str], bins: int | list[int | float], error: str,
+                                        n_blocks: int, n_bootstrap: int, conditions: str | list[str] = None,
+                                        seed: int = None, executor: Executor = None, batch_size: int = 50
+                                        ) -> pd.DataFrame:
+        """
+        Function to reweight the trajectories and get the error of the fraction of the weight in each bin from the time
+        blocks of the trajectories. The energy error is kT times the relative error of the fraction.
+        :param cv: the cv(s) to reweight over
+        :param bins: number of bins, or a list of bin boundaries
+        :param error: 'block' or 'bootstrap'
+        :param n_blocks: number of time blocks to split the trajectories into
+        :param n_bootstrap: number of bootstrap resamples
+        :param conditions: conditions to apply to the reweighting
+        :param seed: seed for the bootstrap resampling
+        :param executor: executor to share the bootstrap resamples between
+        :param batch_size: number of bootstrap resamples made together
+        :return: data frame with the cv(s), energy, population, energy_err and population_err for each bin
+        """
+        cvs = [cv] if type(cv) == str else cv
+        traj_list = list(self.trajectories.values())
+        if not traj_list:
+            raise ValueError("there are no trajectories in this space")
+        for t in traj_list:
+            if not set(cvs).issubset(t.cvs):
+                raise ValueError("not all the trajectories in this space have that CV")
+
+        accumulators, edges = self._get_trajectory_counts(traj_list, cvs, bins, conditions, n_blocks)
+        counts = np.stack([a.counts for a in accumulators])
+        shape = counts.shape[2:]
+        counts = counts.reshape(counts.shape[0], n_blocks, -1)
+        total = counts.sum(axis=(0, 1))
+        fraction = total / total.sum()
+
+        if error == 'block':
+            block_counts = counts.sum(axis=0)
+            block_fractions = block_counts / block_counts.sum(axis=1, keepdims=True)
+            fraction_err = block_fractions.std(axis=0, ddof=1) / np.sqrt(n_blocks)
+        elif error == 'bootstrap':
+            batches = [min(batch_size, n_bootstrap - i) for i in range(0, n_bootstrap, batch_size)]
+            seeds = np.random.SeedSequence(seed).spawn(len(batches))
+            bootstrap = partial(_bootstrap_fractions, counts.reshape(-1, total.shape[0]))
+            results = list(map(bootstrap, batches, seeds) if executor is None
+                           else executor.map(bootstrap, batches, seeds))
+            mean = sum(r[0] for r in results) / n_bootstrap
+            variance = sum(r[1] for r in results) / n_bootstrap - mean**2
+            fraction_err = np.sqrt(np.maximum(variance, 0) * n_bootstrap / (n_bootstrap - 1))
+        else:
+            raise ValueError("error needs to be 'block' or 'bootstrap'")
+
+        # the data frames of surfaces have the first cv changing fastest
+        relative_err = np.divide(fraction_err, fraction, out=np.full(fraction.shape, np.nan), where=fraction > 0)
+        relative_err = relative_err.reshape(shape).ravel(order='F')
+        fes_data = self._time_block_counts_to_data(total.reshape((1,) + shape), edges, cv, bins, self.temperature)[1]
+
+        return (fes_data
+                .filter(cvs + ['energy', 'population'])
+                .assign(energy_err=Kb * self.temperature * relative_err)
+                .assign(population_err=lambda x: x['population'] * relative_err)
+                )
+
     def get_data(self, with_metadata: bool = False, trajectory_data: bool = False):
         """
         function to get the _data from a free energy shape
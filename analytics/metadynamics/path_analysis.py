@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from analytics.metadynamics.free_energy import FreeEnergySurface
 from analytics.metadynamics.free_energy import FreeEnergyShape
+from analytics.metadynamics.free_energy import NearestNeighbourIndex
 
 
 class Path:
@@ -73,6 +74,38 @@ class SurfacePath(Path):
         if self._cvs[0] not in shape.cvs or self._cvs[1] not in shape.cvs:
             raise ValueError("Check the path and surface cvs are the same!")
 
+        self._surface_forces = None
+        self.n_iterations = 0
+        self.converged = False
+
+    def _get_force_index(self) -> tuple[np.ndarray, NearestNeighbourIndex]:
+        """
+        Function to get the mean force on the grid of the surface, with a nearest neighbour index of the grid. They are
+        worked out from the cached grid and gradient of the surface, and again if the grid of the surface changes.
+        :return: array with the force along each cv of the path at each grid point, and the index of the grid points
+        """
+        grid = self._shape.get_grid()
+        if self._surface_forces is None or self._surface_forces[0] is not grid:
+            x, y, _ = grid
+            order = [self._shape.cvs.index(c) for c in self._cvs]
+            points = np.column_stack([np.tile(x, y.shape[0]), np.repeat(y, x.shape[0])]).astype(np.float64)
+            forces = np.column_stack([-g.ravel(order='F') for g in self._shape.get_gradient()])
+            self._surface_forces = (grid, forces[:, order], NearestNeighbourIndex(points[:, order]))
+
+        return self._surface_forces[1], self._surface_forces[2]
+
+    def _get_path_forces(self) -> np.ndarray:
+        """
+        Function to get the force from the free energy surface acting on every point of the path, in one lookup. The
+        end points of the path are fixed, so have no force on them.
+        :return: array with a row for each point of the path and a column for each cv
+        """
+        forces, index = self._get_force_index()
+        path_forces = forces[index.query(self._path[self._cvs].to_numpy(dtype=np.float64))]
+        path_forces[[0, -1]] = 0
+
+        return path_forces
+
     def _get_surface_forces(self, index: int):
         """
         Function to get the force from a free energy surface acting on the i'th point of the path
@@ -82,17 +115,103 @@ class SurfacePath(Path):
         if index < 0 or index > self._path.index.max():
             raise ValueError("The index needs to be between 0 and the max index")
 
-        surface_forces = self._shape.get_mean_force()
-        cv1 = self._cvs[0]
-        cv2 = self._cvs[1]
-
         if index == self._path.index.max() or index == 0:
-            fx = 0
-            fy = 0
-        else:
-            x = self._path[cv1].iloc[index]
-            y = self._path[cv2].iloc[index]
-            fx = FreeEnergyShape.get_nearest_value(surface_forces, {cv1: x}, val_col=f"{cv1}_grad")
-            fy = FreeEnergyShape.get_nearest_value(surface_forces, {cv2: y}, val_col=f"{cv2}_grad")
-
-        return np.array([fx, fy])
+            return np.array([0, 0])
+
+        forces, nearest = self._get_force_index()
+        return forces[nearest.query(self._path[self._cvs].iloc[index].to_numpy(dtype=np.float64))[0]]
+
+    def _get_energy_gradient(self, images: np.ndarray, method: str = 'cubic') -> np.ndarray:
+        """
+        Function to get the interpolated gradient of the free energy at every image of the path at once
+        :param images: array with a row for each image and a column for each cv of the path
+        :param method: 'linear' or 'cubic' interpolation of the surface
+        :return: array with the gradient along each cv of the path at each image
+        """
+        order = [self._cvs.index(c) for c in self._shape.cvs]
+        gradient = np.empty(images.shape)
+        gradient[:, order] = self._shape.evaluate_gradient(images[:, order], method=method)
+
+        return gradient
+
+    @staticmethod
+    def _reparametrise(images: np.ndarray) -> np.ndarray:
+        """
+        Function to spread the images of a path out evenly by arc length, keeping the end points
+        :param images: array with a row for each image and a column for each cv
+        :return: the images at even arc lengths along the path
+        """
+        arc_length = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(images, axis=0), axis=1))])
+        if arc_length[-1] == 0:
+            return images
+
+        even = np.linspace(0, arc_length[-1], images.shape[0])
+        return np.column_stack([np.interp(even, arc_length, images[:, i]) for i in range(0, images.shape[1])])
+
+    def optimise(self, n_iterations: int = 10000, step_size: float = None, tolerance: float = 1e-6,
+                 method: str = 'cubic', fixed_ends: bool = False):
+        """
+        Function to evolve the path into the minimum free energy path with the simplified string method. Each
+        iteration moves every image at once down the part of the interpolated free energy gradient that is
+        perpendicular to the path, and then spreads the images out evenly by arc length. The end points move down the
+        full gradient into their minima, unless they are fixed.
+        :param n_iterations: the largest number of iterations to take
+        :param step_size: the time step of each iteration. Defaults to a step that moves no image more than a tenth
+        of the grid spacing of the surface
+        :param tolerance: the largest move of any image in an iteration, in cv units, to stop at
+        :param method: 'linear' or 'cubic' interpolation of the surface
+        :param fixed_ends: keep the end points of the path where they are
+        :return: self
+        """
+        grid = self._shape.get_data()[self._cvs].to_numpy(dtype=np.float64)
+        lower, upper = grid.min(axis=0), grid.max(axis=0)
+        spacing = min(np.diff(np.unique(grid[:, i])).min() for i in range(0, grid.shape[1]))
+        if step_size is None:
+            max_gradient = np.linalg.norm(self._get_energy_gradient(grid, method), axis=1).max()
+            step_size = 0.1 * spacing / max_gradient if max_gradient > 0 else spacing
+
+        images = self._path[self._cvs].to_numpy(dtype=np.float64)
+        iteration, converged = 0, False
+        for iteration in range(1, n_iterations + 1):
+            gradient = self._get_energy_gradient(images, method)
+            tangent = np.gradient(images, axis=0)
+            tangent = tangent / np.maximum(np.linalg.norm(tangent, axis=1, keepdims=True), np.finfo(float).tiny)
+            step = gradient - (gradient * tangent).sum(axis=1, keepdims=True) * tangent
+            step[[0, -1]] = 0 if fixed_ends else gradient[[0, -1]]
+
+            new_images = self._reparametrise(np.clip(images - step_size * step, lower, upper))
+            change = np.abs(new_images - images).max()
+            images = new_images
+            if change < tolerance:
+                converged = True
+                break
+
+        self._path = pd.DataFrame(images, columns=self._cvs)
+        self.n_iterations = iteration
+        self.converged = converged
+
+        return self
+
+    def get_energy_profile(self, method: str = 'cubic') -> pd.DataFrame:
+        """
+        Function to get the free energy along the path, interpolated from the surface
+        :param method: 'linear' or 'cubic' interpolation of the surface
+        :return: data frame with the path, the arc length along it and the energy at each image
+        """
+        images = self._path[self._cvs].to_numpy(dtype=np.float64)
+        order = [self._cvs.index(c) for c in self._shape.cvs]
+        arc_length = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(images, axis=0), axis=1))])
+
+        return (self._path
+                .assign(arc_length=arc_length)
+                .assign(energy=self._shape.evaluate(images[:, order], method=method))
+                )
+
+    def get_barrier(self, method: str = 'cubic') -> float:
+        """
+        Function to get the free energy barrier along the path, from the first image to the highest point
+        :param method: 'linear' or 'cubic' interpolation of the surface
+        :return: the barrier
+        """
+        energy = self.get_energy_profile(method)['energy'].to_numpy()
+        return energy.max() - energy[0]
@@ -29,12 +29,9 @@ def main(colvar_file: str, condition: str, traj_file: str = None, sample_size: i
     :param ndx_file: index file with groups
     :return:
     """
-    data = MetaTrajectory(colvar_file=colvar_file, temperature=temperature).get_data()
-
-    for c in condition:
-        data = data.query(c)
-
-    sample = data.sample(sample_size)
+    traj = MetaTrajectory(colvar_file=colvar_file, temperature=temperature)
+    mask = traj.get_condition_mask(list(condition))
+    sample = traj.get_data()[mask].sample(sample_size)
 
     if output_structures:
         counter = 1
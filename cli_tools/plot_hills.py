@@ -1,29 +1,20 @@
 #!/usr/bin/env python3
 import click
+import time
 from datetime import datetime
 from analytics.metadynamics.free_energy import FreeEnergySpace
 from glob import glob
 
 
-@click.command()
-@click.option("--file", "-f", default="HILLS", help="Hills file to plot", type=str)
-@click.option("--output", "-o", default="Figures/", help="Output directory for figures", type=str)
-@click.option("--time_resolution", "-tr", default=6, help="Number of decimal places for time values", type=int)
-@click.option("--height_power", "-hp", default=1, help="Power to raise height of _hills for easier visualisation", type=float)
-@click.option("--bias_exchange", "-be", is_flag=True, default=False, help="Is this a bias-exchange simulation?")
-def main(file: str, output: str, time_resolution: int, height_power: float, bias_exchange: bool = False):
+def write_figures(landscape: FreeEnergySpace, output: str, time_resolution: int, height_power: float):
     """
-    cli tool to plot hill heights for all walkers, as well as the value of their CV. It also plots the average and max _hills deposited
-    :param file: the location of the HILLS file
+    Function to write the hills figures of a free energy space
+    :param landscape: the free energy space with the hills
     :param output: folder in which to put images
     :param time_resolution: how to bin the t axis for faster plotting
     :param height_power: power to raise _hills too for easier visualisation
-    :param bias_exchange: is this a bias-exchange simulation?
     :return: saved figures
     """
-    if bias_exchange is True:
-        file = [f for f in glob(file+"*")]
-    landscape = FreeEnergySpace(file)
     figures = landscape.get_hills_figures(time_resolution=time_resolution, height_power=height_power)
 
     for key, value in figures.items():
@@ -51,5 +42,44 @@ def main(file: str, output: str, time_resolution: int, height_power: float, bias
     click.echo(f"{current_time}: Made hills_max.pdf in {output}", err=True)
 
 
+@click.command()
+@click.option("--file", "-f", default="HILLS", help="Hills file to plot", type=str)
+@click.option("--output", "-o", default="Figures/", help="Output directory for figures", type=str)
+@click.option("--time_resolution", "-tr", default=6, help="Number of decimal places for time values", type=int)
+@click.option("--height_power", "-hp", default=1, help="Power to raise height of _hills for easier visualisation", type=float)
+@click.option("--bias_exchange", "-be", is_flag=True, default=False, help="Is this a bias-exchange simulation?")
+@click.option("--watch", "-w", is_flag=True, default=False, help="Keep following the hills file of a running simulation")
+@click.option("--interval", "-i", default=300, help="Seconds between refreshes when watching", type=float)
+def main(file: str, output: str, time_resolution: int, height_power: float, bias_exchange: bool = False,
+         watch: bool = False, interval: float = 300):
+    """
+    cli tool to plot hill heights for all walkers, as well as the value of their CV. It also plots the average and max _hills deposited
+    :param file: the location of the HILLS file
+    :param output: folder in which to put images
+    :param time_resolution: how to bin the t axis for faster plotting
+    :param height_power: power to raise _hills too for easier visualisation
+    :param bias_exchange: is this a bias-exchange simulation?
+    :param watch: keep reading the hills appended by a running simulation and remaking the figures, until interrupted
+    :param interval: seconds to wait between refreshes when watching
+    :return: saved figures
+    """
+    if bias_exchange is True:
+        file = [f for f in glob(file+"*")]
+    landscape = FreeEnergySpace(file)
+    write_figures(landscape, output, time_resolution, height_power)
+
+    while watch:
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+        n_timesteps = landscape.n_timesteps
+        landscape.refresh()
+        current_time = datetime.now().strftime("%H:%M:%S")
+        click.echo(f"{current_time}: Read {landscape.n_timesteps - n_timesteps} new time steps", err=True)
+        if landscape.n_timesteps != n_timesteps:
+            write_figures(landscape, output, time_resolution, height_power)
+
+
 if __name__ == "__main__":
     main()
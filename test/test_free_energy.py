@@ -1,12 +1,23 @@
 import unittest
 import tracemalloc
+import tempfile
+import shutil
+import bz2
+import gzip
+import lzma
+from unittest import mock
 import os
 import plotly.graph_objects as go
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import numpy as np
 import plumed as pl
 import matplotlib.pyplot as plt
-from analytics.metadynamics.free_energy import FreeEnergySpace, MetaTrajectory, FreeEnergyLine, FreeEnergySurface
+from analytics.metadynamics.free_energy import FreeEnergySpace, MetaTrajectory, FreeEnergyLine, FreeEnergySurface, \
+    HillsFile, OpesKernels, FreeEnergyHistogram, HistogramAccumulator, QuantileSketch, \
+    FreeEnergyTimeSeries, NearestNeighbourIndex
+from analytics.laws_and_constants import Kb
 tracemalloc.start()
 
 
@@ -36,6 +47,190 @@ class TestMetaTrajectory(unittest.TestCase):
         self.assertEqual(cv_traj.cvs, ['D1', 'CM1'])
         self.assertTrue(cv_traj._opes is True)
 
+    def test_colvar_read_cached(self):
+        """
+        checking that a cached read gives the same data as parsing the colvar file, and that appending to the colvar
+        file invalidates the cache
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            file = folder + "/COLVAR.0"
+            shutil.copy("./test_trajectories/ndi_na_binding/COLVAR.0", file)
+            cv_traj = MetaTrajectory(file, cache=True)
+            cached_traj = MetaTrajectory(file, cache=True)
+            self.assertEqual(len(glob(folder + "/.COLVAR.0.*.cache.npy")), 1)
+            pd.testing.assert_frame_equal(cached_traj._data, cv_traj._data)
+            pd.testing.assert_frame_equal(cached_traj._data, MetaTrajectory(file)._data)
+
+            with open(file, "a") as f:
+                f.write(" 1193.200000 1.000000 1.000000 1.000000 1.000000 1.000000\n")
+            appended_traj = MetaTrajectory(file, cache=True)
+            self.assertEqual(appended_traj._data.shape[0], cv_traj._data.shape[0] + 1)
+            self.assertEqual(len(glob(folder + "/.COLVAR.0.*.cache.npy")), 1)
+
+    def test_colvar_read_lazy(self):
+        """
+        checking that a lazy trajectory streams the same data as a loaded one, reading only the columns asked for
+        """
+        file = "./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0"
+        cv_traj = MetaTrajectory(file)
+        lazy_traj = MetaTrajectory(file, lazy=True, chunksize=500)
+        self.assertTrue(lazy_traj._data is None)
+        self.assertEqual(lazy_traj.cvs, cv_traj.cvs)
+        pd.testing.assert_frame_equal(lazy_traj.get_data(), cv_traj.get_data())
+        chunks = list(lazy_traj.iter_chunks(['time', 'CM2', 'weight']))
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(chunks[0].columns.to_list(), ['time', 'CM2', 'weight'])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                      cv_traj.get_data(columns=['time', 'CM2', 'weight']))
+
+    def test_colvar_refresh(self):
+        """
+        checking that refreshing a trajectory as plumed appends to the colvar file gives the same data as reading the
+        whole file
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            text = open("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0").read()
+            file = folder + "/COLVAR_REWEIGHT.0"
+            split = text.index("\n", len(text) // 3) + 20
+            with open(file, "w") as f:
+                f.write(text[:split])
+            cv_traj = MetaTrajectory(file)
+            with open(file, "a") as f:
+                f.write(text[split:])
+            cv_traj.refresh()
+            pd.testing.assert_frame_equal(cv_traj.get_data(), MetaTrajectory(file).get_data())
+
+            # a finished file without a newline at the end still has its last row read
+            with open(file, "w") as f:
+                f.write(text.rstrip("\n"))
+            cv_traj = MetaTrajectory(file)
+            full_traj = MetaTrajectory("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0")
+            pd.testing.assert_frame_equal(cv_traj.get_data(), full_traj.get_data())
+            with open(file, "a") as f:
+                f.write("\n")
+            cv_traj.refresh()
+            pd.testing.assert_frame_equal(cv_traj.get_data(), full_traj.get_data())
+
+            # rows plumed appends after the size is measured are left for refresh, with or without the sidecar
+            getsize = os.path.getsize
+
+            def append_after_measuring(path):
+                size = getsize(path)
+                if path == file and size == split:
+                    with open(file, "a") as f:
+                        f.write(text[split:])
+                return size
+
+            for cache in [False, True]:
+                with open(file, "w") as f:
+                    f.write(text[:split])
+                with mock.patch("os.path.getsize", side_effect=append_after_measuring):
+                    cv_traj = MetaTrajectory(file, cache=cache)
+                self.assertEqual(os.path.getsize(file), len(text))
+                cv_traj.refresh()
+                pd.testing.assert_frame_equal(cv_traj.get_data(), full_traj.get_data())
+
+    def test_colvar_read_restarted(self):
+        """
+        checking that a colvar file with a new header from a restart, with the columns in a different order, gives the
+        same data as the file without the restart, both when read in one go and when the restart is refreshed
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            lines = open("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0").read().splitlines(keepends=True)
+            header = "#! FIELDS time CM1 D1 CM2 CM3 metad.bias metad.rbias metad.rct\n#! SET min_D1 0\n"
+            restart = [" ".join([v[0], v[2], v[1]] + v[3:]) + "\n" for v in [l.split() for l in lines[1500:]]]
+            file = folder + "/COLVAR_REWEIGHT.0"
+            with open(file, "w") as f:
+                f.write("".join(lines[:1500]))
+            cv_traj = MetaTrajectory(file)
+            with open(file, "a") as f:
+                f.write(header + "".join(restart))
+            cv_traj.refresh()
+
+            compare = MetaTrajectory("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0").get_data()
+            pd.testing.assert_frame_equal(MetaTrajectory(file).get_data(), compare)
+            pd.testing.assert_frame_equal(cv_traj.get_data(), compare)
+
+    def test_colvar_bin_index_cache(self):
+        """
+        checking that the bin index of each frame is kept for the most recently used cvs and bin edges, and dropped
+        when new rows are read in
+        """
+        cv_traj = MetaTrajectory("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0")
+        edges = [np.linspace(0, 7, 8)]
+        index = cv_traj.get_bin_index(['D1'], edges)
+        expected = np.digitize(cv_traj.get_data()['D1'], edges[0]) - 1
+        np.testing.assert_array_equal(index, np.where((expected >= 0) & (expected < 7), expected, -1))
+        self.assertIs(cv_traj.get_bin_index(['D1'], [np.linspace(0, 7, 8)]), index)
+
+        for i in range(0, cv_traj._bin_index_cache_size):
+            cv_traj.get_bin_index(['CM1'], [np.linspace(0, i + 1, 5)])
+        self.assertIsNot(cv_traj.get_bin_index(['D1'], edges), index)
+
+        with tempfile.TemporaryDirectory() as folder:
+            text = open("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0").read()
+            file = folder + "/COLVAR_REWEIGHT.0"
+            split = text.index("\n", len(text) // 2) + 1
+            with open(file, "w") as f:
+                f.write(text[:split])
+            cv_traj = MetaTrajectory(file)
+            index = cv_traj.get_bin_index(['D1'], edges)
+            with open(file, "a") as f:
+                f.write(text[split:])
+            cv_traj.refresh()
+            self.assertEqual(cv_traj.get_bin_index(['D1'], edges).shape[0], cv_traj.get_data().shape[0])
+            self.assertGreater(cv_traj.get_data().shape[0], index.shape[0])
+
+    def test_colvar_condition_mask(self):
+        """
+        checking that the conditions are compiled into one mask that matches querying the data, and that the mask is
+        kept for the same conditions
+        """
+        cv_traj = MetaTrajectory("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0")
+        conditions = ['D1 < 5', 'CM1 > 1 and CM1 < 6']
+        mask = cv_traj.get_condition_mask(conditions)
+        expected = cv_traj.get_data().query(conditions[0]).query(conditions[1])
+        pd.testing.assert_frame_equal(cv_traj.get_data()[mask], expected)
+        self.assertIs(cv_traj.get_condition_mask(conditions), mask)
+        self.assertTrue(cv_traj.get_condition_mask(None).all())
+
+    def test_colvar_quantile_sketch(self):
+        """
+        checking that the quantile sketch of a trajectory is exact below its capacity, stays close to the exact
+        quantiles above it when sketches are merged, and takes in the new rows when the trajectory is refreshed
+        """
+        cv_traj = MetaTrajectory("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0")
+        quantiles = np.linspace(0, 1, 11)
+        values = cv_traj.get_data()['D1']
+        sketch = cv_traj.get_quantile_sketch('D1')
+        self.assertTrue(sketch.exact)
+        np.testing.assert_array_equal(sketch.get_quantiles(quantiles), pd.qcut(values, 10, retbins=True)[1])
+        self.assertIs(cv_traj.get_quantile_sketch('D1'), sketch)
+
+        merged = QuantileSketch(capacity=200)
+        for part in np.array_split(values.to_numpy(), 7):
+            merged.merge(QuantileSketch(capacity=200).update(part))
+        self.assertFalse(merged.exact)
+        self.assertEqual(merged.n, values.shape[0])
+        ranks = np.searchsorted(np.sort(values), merged.get_quantiles(quantiles)) / values.shape[0]
+        np.testing.assert_allclose(ranks, quantiles, atol=0.03)
+        self.assertEqual(merged.get_quantiles(0), values.min())
+        self.assertEqual(merged.get_quantiles(1), values.max())
+
+        with tempfile.TemporaryDirectory() as folder:
+            text = open("./test_trajectories/ndi_na_binding/COLVAR_REWEIGHT.0").read()
+            file = folder + "/COLVAR_REWEIGHT.0"
+            split = text.index("\n", len(text) // 2) + 1
+            with open(file, "w") as f:
+                f.write(text[:split])
+            cv_traj = MetaTrajectory(file)
+            sketch = cv_traj.get_quantile_sketch('D1')
+            with open(file, "a") as f:
+                f.write(text[split:])
+            cv_traj.refresh()
+            self.assertEqual(sketch.n, cv_traj.get_data().shape[0])
+            np.testing.assert_array_equal(sketch.get_quantiles(quantiles), np.quantile(values, quantiles))
+
 
 class TestFreeEnergyLine(unittest.TestCase):
 
@@ -156,6 +351,36 @@ class TestFreeEnergyLine(unittest.TestCase):
         figure.add_trace(trace)
         # figure.show()
 
+    def test_time_series_store(self):
+        """
+        checking that the time data is held on one grid, that shifting the datum shifts every time stamp like
+        shifting each data frame, and that getting the time data does not change it
+        """
+        folder = "./test_trajectories/ndi_na_binding/FES_CM1/"
+        all_fes_files = glob(os.path.join(folder, "FES*dat"))
+        frames = {int(''.join(x for x in f.split("/")[-1] if x.isdigit())): FreeEnergyLine._read_file(f)
+                  for f in all_fes_files}
+        line = FreeEnergyLine.from_plumed(all_fes_files)
+        self.assertEqual(type(line._time_data), FreeEnergyTimeSeries)
+        self.assertEqual(line._time_data.get_values('energy').shape, (len(frames), frames[0].shape[0]))
+        self.assertEqual(list(line._time_data), sorted(frames))
+
+        line.set_datum({'CM1': (2.0, 4.0)})
+        for time_stamp in [0, 5, max(frames)]:
+            frame = frames[time_stamp]
+            expected = frame['energy'] - frame.loc[frame['CM1'].between(2.0, 4.0), 'energy'].mean()
+            np.testing.assert_allclose(line._time_data[time_stamp]['energy'], expected, atol=1e-10)
+        pd.testing.assert_frame_equal(line._time_data[max(frames)], line._data)
+
+        time_data = line.get_data(with_timedata=True)
+        self.assertEqual(time_data.shape[0], len(frames) * frames[0].shape[0])
+        self.assertFalse('timestamp' in line._time_data[0].columns)
+        difference = line.get_time_difference(1.0, (2.0, 4.0))
+        self.assertEqual(difference['time_stamp'].to_list(), sorted(frames))
+        np.testing.assert_allclose(difference['energy_difference'], -np.array(
+            [line._time_data[t].loc[(line._time_data[t]['CM1'] - 1.0).abs().idxmin(), 'energy'] for t in sorted(frames)]
+        ), atol=1e-10)
+
     def test_get_change_over_time(self):
         """
         testing that the normalise function works with a range
@@ -326,6 +551,87 @@ class TestFreeEnergySurface(unittest.TestCase):
         # plt.show()
         self.assertTrue(type(force) == pd.DataFrame)
 
+    def test_nearest_values(self):
+        """
+        checking that the nearest values of a plumed surface are found with index arithmetic, and match a brute
+        force search and the KD-tree used for points off a grid
+        """
+        file = "./test_trajectories/ndi_na_binding/FES_CM1_D1/FES"
+        surface = FreeEnergySurface.from_plumed(file)
+        grid = surface._data[surface.cvs].to_numpy()
+        points = np.random.default_rng(0).uniform(grid.min(axis=0) - 0.5, grid.max(axis=0) + 0.5, size=(2000, 2))
+
+        values = surface.get_nearest_values(points)
+        self.assertTrue(surface._get_nearest_neighbour_index().regular)
+        distance = ((points[:, None, :] - grid[None, :, :])**2).sum(axis=2)
+        nearest = np.take_along_axis(distance, surface._get_nearest_neighbour_index().query(points)[:, None], 1)[:, 0]
+        np.testing.assert_allclose(nearest, distance.min(axis=1))
+        self.assertEqual(values.shape, (2000,))
+
+        tree = NearestNeighbourIndex(grid[1:])
+        self.assertFalse(tree.regular)
+        np.testing.assert_array_equal(tree.query(points), distance[:, 1:].argmin(axis=1))
+
+        point = {surface.cvs[0]: grid[7, 0], surface.cvs[1]: grid[7, 1]}
+        self.assertEqual(surface.get_nearest_values(point, ['energy', 'population']).tolist(),
+                         [surface._data[['energy', 'population']].iloc[7].tolist()])
+
+        negative = (points < 0).any(axis=1)
+        self.assertGreater(negative.sum(), 0)
+        for point, value in zip(points[negative], values[negative]):
+            self.assertEqual(surface.get_nearest_value(surface._data, dict(zip(surface.cvs, point)), 'energy'), value)
+
+    def test_evaluate(self):
+        """
+        checking that the interpolated energies and gradients of a surface match a smooth function on its grid, that
+        linear interpolation goes through the grid points, and that the splines follow the datum
+        """
+        x, y = np.meshgrid(np.linspace(0, 3, 31), np.linspace(-1, 1, 21), indexing='ij')
+        data = pd.DataFrame({'CM1': x.ravel(), 'CM2': y.ravel(), 'energy': (np.sin(x) * np.cos(y)).ravel()})
+        surface = FreeEnergySurface(data)
+        points = np.random.default_rng(0).uniform([0, -1], [3, 1], size=(5000, 2))
+
+        energy = surface.evaluate(points, method='cubic')
+        np.testing.assert_allclose(energy, np.sin(points[:, 0]) * np.cos(points[:, 1]), atol=1e-4)
+        gradient = surface.evaluate_gradient(points, method='cubic')
+        np.testing.assert_allclose(gradient[:, 0], np.cos(points[:, 0]) * np.cos(points[:, 1]), atol=1e-3)
+        np.testing.assert_allclose(gradient[:, 1], -np.sin(points[:, 0]) * np.sin(points[:, 1]), atol=1e-3)
+        self.assertEqual(gradient.shape, (5000, 2))
+
+        np.testing.assert_allclose(surface.evaluate(data[['CM1', 'CM2']]), data['energy'], atol=1e-12)
+        self.assertIs(surface._get_spline('linear'), surface._get_spline('linear'))
+        np.testing.assert_allclose(surface.evaluate([[10, 0]]), surface.evaluate([[3, 0]]))
+
+        surface.set_datum({'CM1': 3, 'CM2': 0})
+        self.assertAlmostEqual(surface.evaluate([[3, 0]], method='cubic')[0], 0)
+
+    def test_cached_grid(self):
+        """
+        checking that the grid view and gradient of a surface are kept until the data changes, and that the long form
+        of a symmetrised surface is only built when it is asked for
+        """
+        space = FreeEnergySpace.from_standard_directory("./test_trajectories/ndi_na_binding/")
+        surface = space.get_reweighted_surface(cvs=["CM2", "CM3"], bins=[-0.5, 0.5, 1.5, 2.5, 3.5])
+        grid = surface.get_grid()
+        self.assertIs(surface.get_grid(), grid)
+        self.assertIsNone(surface._gradient)
+        force = surface.get_mean_force()
+        self.assertIs(surface.get_gradient(), surface._gradient)
+        np.testing.assert_allclose(force['CM2_grad'].to_numpy().reshape(4, 4, order='F'),
+                                   -np.gradient(grid[2]['energy'], grid[0], grid[1])[0])
+
+        surface.set_datum({'CM2': 1.0, 'CM3': 1.0})
+        self.assertIsNone(surface._gradient)
+        self.assertIsNot(surface.get_grid(), grid)
+
+        surface.set_as_symmetric('y=x')
+        self.assertIsNone(surface._long_data)
+        energy = surface.get_grid()[2]['energy']
+        np.testing.assert_allclose(energy, energy.T)
+        data = surface.get_data()
+        self.assertEqual(data.columns.to_list(), ['CM2', 'CM3', 'energy', 'symmetry_error'])
+        np.testing.assert_allclose(data['energy'].to_numpy().reshape(4, 4, order='F'), energy)
+
 
 class TestFreeEnergySpace(unittest.TestCase):
 
@@ -518,7 +824,7 @@ class TestFreeEnergySpace(unittest.TestCase):
         """
         fes = self.landscape.get_reweighted_line('D1', bins=[0, 3, 7], n_timestamps=5).set_datum({'D1': 0})
         self.assertEqual(fes._data[fes._data['D1'] == 1.5]['energy'].values[0], 0)
-        self.assertTrue(type(fes._time_data) == dict)
+        self.assertTrue(type(fes._time_data) == FreeEnergyTimeSeries)
         self.assertTrue(type(fes._time_data[1]) == pd.DataFrame)
         self.assertTrue(type(fes._time_data[3]) == pd.DataFrame)
         self.assertTrue(type(fes._time_data[5]) == pd.DataFrame)
@@ -530,11 +836,45 @@ class TestFreeEnergySpace(unittest.TestCase):
         """
         fes = self.landscape_opes.get_reweighted_line('D1', bins=[0, 0.9, 7], n_timestamps=5).set_datum({'D1': 0})
         self.assertEqual(fes._data[fes._data['D1'] == 0.45]['energy'].values[0], 0)
-        self.assertTrue(type(fes._time_data) == dict)
+        self.assertTrue(type(fes._time_data) == FreeEnergyTimeSeries)
         self.assertTrue(type(fes._time_data[1]) == pd.DataFrame)
         self.assertTrue(type(fes._time_data[3]) == pd.DataFrame)
         self.assertTrue(type(fes._time_data[5]) == pd.DataFrame)
 
+    def test_time_resolved_line_matches_filtered_reweighting(self):
+        """
+        checking that the histograms built up from the time blocks match reweighting the frames up to each time stamp
+        """
+        bins = [0, 1, 2, 3, 5, 7]
+        fes = self.landscape.get_reweighted_line('D1', bins=bins, n_timestamps=4)
+        data = pd.concat([t.get_data() for t in self.landscape.trajectories.values()])
+        for i in range(1, 5):
+            time = i * data['time'].max() / 4
+            expected = FreeEnergySpace._reweight_traj_data(data.query('time <= @time'), 'D1', bins)
+            np.testing.assert_allclose(fes._time_data[i]['population'], expected['population'])
+
+    def test_indexed_reweighting_with_conditions(self):
+        """
+        checking that reweighting from the bin index tables of the trajectories with conditions gives the same surface
+        as filtering and histogramming the data
+        """
+        conditions = ['D1 < 5', 'CM1 > 1']
+        surface = self.landscape.get_reweighted_surface(['D1', 'CM1'], bins=[20, 30], conditions=conditions)
+        data = pd.concat([t.get_data() for t in self.landscape.trajectories.values()])
+        expected = FreeEnergySpace._reweight_traj_data(data, ['D1', 'CM1'], [20, 30], conditions=conditions)
+        np.testing.assert_allclose(surface._data['population'], expected['population'])
+        np.testing.assert_allclose(surface._data['D1'], expected['D1'])
+
+    def test_time_resolved_surface(self):
+        """
+        checking that the last time stamp of a time resolved surface is the surface from all the data
+        """
+        surface = self.landscape.get_reweighted_surface(['D1', 'CM1'], bins=[20, 30], n_timestamps=3)
+        full_surface = self.landscape.get_reweighted_surface(['D1', 'CM1'], bins=[20, 30])
+        self.assertEqual(sorted(surface._time_data.keys()), [1, 2, 3])
+        np.testing.assert_allclose(surface._time_data[3]['population'], full_surface._data['population'])
+        self.assertEqual(surface._time_data[1].shape[0], 20 * 30)
+
     def test_temperature_parsed_to_traj(self):
         """
         Function to test that it is normalising properly when using two bins
@@ -670,6 +1010,156 @@ class TestFreeEnergySpace(unittest.TestCase):
         ).trajectories[0].get_data(with_metadata=True)
         self.assertTrue('unit' in shape.columns)
 
+    def test_lazy_reweighting_matches_loaded(self):
+        """
+        checking that reweighting streamed trajectories gives the same lines and surfaces as loaded trajectories
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        lazy_space = FreeEnergySpace.from_standard_directory(here_dir, lazy=True)
+        for t in lazy_space.trajectories.values():
+            t.chunksize = 1000
+        space = FreeEnergySpace.from_standard_directory(here_dir)
+
+        for bins in [[0, 3, 7], 20]:
+            lazy_line = lazy_space.get_reweighted_line('D1', bins=bins, conditions='CM1 < 8')
+            line = space.get_reweighted_line('D1', bins=bins, conditions='CM1 < 8')
+            pd.testing.assert_frame_equal(lazy_line.get_data(), line.get_data())
+
+        lazy_line = lazy_space.get_reweighted_line('D1', bins=[0, 3, 7], n_timestamps=5)
+        line = space.get_reweighted_line('D1', bins=[0, 3, 7], n_timestamps=5)
+        pd.testing.assert_frame_equal(lazy_line._time_data[3], line._time_data[3])
+
+        lazy_surface = lazy_space.get_reweighted_surface(cvs=["CM2", "CM3"], bins=[-0.5, 0.5, 1.5, 2.5, 3.5])
+        surface = space.get_reweighted_surface(cvs=["CM2", "CM3"], bins=[-0.5, 0.5, 1.5, 2.5, 3.5])
+        pd.testing.assert_frame_equal(lazy_surface.get_data(), surface.get_data())
+
+    def test_histogram_accumulator_streams_trajectories(self):
+        """
+        checking that accumulating trajectories one at a time, loaded or chunk by chunk, gives the histogram of all
+        the data together, and that the streamed bin edges match pd.cut
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        lazy_space = FreeEnergySpace.from_standard_directory(here_dir, lazy=True)
+        for t in lazy_space.trajectories.values():
+            t.chunksize = 700
+        space = FreeEnergySpace.from_standard_directory(here_dir)
+
+        edges = [np.linspace(0, 8, 17), np.linspace(0, 9, 10)]
+        loaded = HistogramAccumulator(['D1', 'CM1'], edges)
+        lazy = HistogramAccumulator(['D1', 'CM1'], edges)
+        for t, lazy_t in zip(space.trajectories.values(), lazy_space.trajectories.values()):
+            loaded.add_trajectory(t, conditions='CM2 < 2')
+            lazy.add_trajectory(lazy_t, conditions='CM2 < 2')
+
+        data = pd.concat([t.get_data() for t in space.trajectories.values()]).query('CM2 < 2')
+        expected = np.histogram2d(data['D1'], data['CM1'], bins=edges, weights=data['weight'])[0]
+        np.testing.assert_allclose(loaded.counts[0], expected)
+        np.testing.assert_allclose(lazy.counts[0], expected)
+
+        mins, maxs, _ = FreeEnergySpace._get_ranges(list(lazy_space.trajectories.values()), ['D1'])
+        cut_edges = pd.cut(pd.concat([t.get_data() for t in space.trajectories.values()])['D1'], 20, retbins=True)[1]
+        np.testing.assert_allclose(FreeEnergySpace._get_cut_edges(mins, maxs, [20])[0], cut_edges)
+
+    def test_parallel_standard_directory(self):
+        """
+        checking that reading a standard directory with thread and process pools gives the same space as reading it
+        serially
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        space = FreeEnergySpace.from_standard_directory(here_dir)
+
+        for processes in [False, True]:
+            parallel_space = FreeEnergySpace.from_standard_directory(here_dir, workers=4, processes=processes)
+            self.assertEqual(list(parallel_space.lines.keys()), list(space.lines.keys()))
+            for cv, line in space.lines.items():
+                pd.testing.assert_frame_equal(parallel_space.lines[cv].get_data(), line.get_data())
+                self.assertEqual(list(parallel_space.lines[cv]._time_data.keys()), list(line._time_data.keys()))
+            for parallel_surface, surface in zip(parallel_space.surfaces, space.surfaces):
+                pd.testing.assert_frame_equal(parallel_surface.get_data(), surface.get_data())
+            self.assertEqual(list(parallel_space.trajectories.keys()), list(space.trajectories.keys()))
+            for walker, traj in space.trajectories.items():
+                pd.testing.assert_frame_equal(parallel_space.trajectories[walker].get_data(), traj.get_data())
+
+    def test_fes_from_hills(self):
+        """
+        checking that summing the hills gives the same free energy snapshots as plumed sum_hills, which made the
+        FES_CM1 files with --stride 1000 and the FES_CM1_D1 file, both with a kT of 2.47
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        landscape = FreeEnergySpace(here_dir + "HILLS", temperature=2.47 / Kb)
+
+        line = landscape.get_fes_from_hills('CM1', stride=1000)
+        plumed_line = FreeEnergyLine.from_plumed(glob(here_dir + "FES_CM1/FES*"), temperature=2.47 / Kb)
+        self.assertEqual(sorted(line._time_data.keys()), sorted(plumed_line._time_data.keys()))
+        for timestamp, data in plumed_line._time_data.items():
+            np.testing.assert_allclose(line._time_data[timestamp]['CM1'], data['CM1'], atol=1e-5)
+            np.testing.assert_allclose(line._time_data[timestamp]['energy'], data['energy'], atol=0.02)
+
+        surface = landscape.get_fes_from_hills(['D1', 'CM1'], chunksize=5000)
+        plumed_surface = FreeEnergySurface.from_plumed(here_dir + "FES_CM1_D1/FES", temperature=2.47 / Kb)
+        self.assertTrue(surface._time_data is None)
+        np.testing.assert_allclose(surface.get_data()['D1'], plumed_surface.get_data()['D1'], atol=1e-5)
+        np.testing.assert_allclose(surface.get_data()['energy'], plumed_surface.get_data()['energy'], rtol=1e-3,
+                                   atol=0.005)
+
+    def test_reweight_from_hills(self):
+        """
+        checking that the final bias and c(t) worked out from the hills match the COLVAR_REWEIGHT files that plumed
+        driver made by restarting from the hills file with the metad grid of the run
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        space = FreeEnergySpace.from_standard_directory(here_dir, colvar_string_matcher="COLVAR.",
+                                                        hills_file=here_dir + "HILLS")
+        space.reweight_from_hills(ranges={'D1': (-0.5, 18), 'CM1': (-0.5, 20)})
+
+        for walker, traj in space.trajectories.items():
+            driver_traj = MetaTrajectory(here_dir + f"COLVAR_REWEIGHT.{walker}")
+            data, driver_data = traj.get_data(), driver_traj.get_data()
+            self.assertEqual(data.shape[0], driver_data.shape[0])
+            np.testing.assert_allclose(data['reweight_factor'], driver_data['reweight_factor'], atol=1e-4)
+            np.testing.assert_allclose(data['bias'], driver_data['bias'], atol=0.5)
+            self.assertLess((data['bias'] - driver_data['bias']).abs().mean(), 0.02)
+            np.testing.assert_allclose(data['reweight_bias'], driver_data['reweight_bias'], atol=0.5)
+
+        with self.assertRaises(ValueError):
+            FreeEnergySpace("./test_trajectories/ndi_single_opes/Kernels.data").get_reweight_factor_from_hills()
+
+        with tempfile.TemporaryDirectory() as folder:
+            lines = open(here_dir + "HILLS").read().splitlines()
+            with open(folder + "/HILLS", "w") as f:
+                f.write(lines[0].replace(" biasf", "") + "\n")
+                f.write("\n".join(lines[1:3] + [line.rsplit(maxsplit=1)[0] for line in lines[3:]]) + "\n")
+            plain_space = FreeEnergySpace(folder + "/HILLS")
+            self.assertIsNone(plain_space._hills_files[0].biasfactor)
+            with self.assertRaises(ValueError):
+                plain_space.get_reweight_factor_from_hills()
+
+    def test_compressed_standard_directory(self):
+        """
+        checking that a standard directory with gzip, bz2 or xz compressed files gives the same space as the plain files
+        """
+        here_dir = "./test_trajectories/ndi_na_binding/"
+        space = FreeEnergySpace.from_standard_directory(here_dir, hills_file=here_dir + "HILLS")
+
+        for compress in [gzip.compress, bz2.compress, lzma.compress]:
+            with tempfile.TemporaryDirectory() as folder:
+                for file in (["HILLS"] + [f for f in os.listdir(here_dir) if "COLVAR_REWEIGHT." in f]
+                             + [os.path.relpath(f, here_dir) for f in glob(here_dir + "FES_*/*")]):
+                    os.makedirs(os.path.dirname(folder + "/" + file), exist_ok=True)
+                    with open(here_dir + file, "rb") as f, open(folder + "/" + file, "wb") as compressed:
+                        compressed.write(compress(f.read()))
+
+                compressed_space = FreeEnergySpace.from_standard_directory(folder, hills_file=folder + "/HILLS")
+                pd.testing.assert_frame_equal(compressed_space.get_data(), space.get_data())
+                for cv, line in space.lines.items():
+                    pd.testing.assert_frame_equal(compressed_space.lines[cv].get_data(), line.get_data())
+                pd.testing.assert_frame_equal(compressed_space.surfaces[0].get_data(), space.surfaces[0].get_data())
+                for walker, traj in space.trajectories.items():
+                    pd.testing.assert_frame_equal(compressed_space.trajectories[walker].get_data(), traj.get_data())
+
+                lazy_traj = MetaTrajectory(folder + "/COLVAR_REWEIGHT.0", lazy=True)
+                pd.testing.assert_frame_equal(lazy_traj.get_data(), space.trajectories[0].get_data())
+
     def test_one_walker_reweighted_with_walker_error(self):
         """
         Function to test that it returns error when only one walker is present.
@@ -719,6 +1209,116 @@ class TestFreeEnergySpace(unittest.TestCase):
         self.assertTrue(data['energy'].iloc[6] == -7.3849)
         self.assertTrue(data['energy_err'].iloc[1] == 0.7667)
 
+    def test_reweighted_surface_with_walker_error(self):
+        """
+        checking that the surface with walker errors has the mean and standard error of the walker surfaces in each bin
+        """
+        surface = self.landscape.get_reweighted_surface_with_walker_error(['D1', 'CM1'], bins=[10, 12])
+        data = surface.get_data()
+        self.assertEqual(data.columns.to_list()[:2], ['D1', 'CM1'])
+        self.assertTrue({'energy', 'population', 'energy_err', 'population_err'}.issubset(data.columns))
+
+        all_data = pd.concat([t.get_data() for t in self.landscape.trajectories.values()])
+        bins = [pd.cut(all_data['D1'], 10, retbins=True)[1], pd.cut(all_data['CM1'], 12, retbins=True)[1]]
+        populations = np.stack([FreeEnergySpace._reweight_traj_stream([t], ['D1', 'CM1'], bins)['population']
+                                for t in self.landscape.trajectories.values()])
+        populations[populations == 0] = np.nan
+        kept = ~np.isnan(populations).all(axis=0)
+        np.testing.assert_allclose(data['population'], np.nanmean(populations, axis=0)[kept])
+        self.assertEqual(data.shape[0], kept.sum())
+
+    def test_reweighted_line_with_block_error(self):
+        """
+        checking that the block error is the standard error of the fraction of the weight in each bin over the time
+        blocks, and the line is the same as without errors
+        """
+        bins = [0, 1, 2, 3, 5, 7]
+        fes = self.landscape.get_reweighted_line_with_error('D1', bins=bins, error='block', n_blocks=4)
+        line = self.landscape.get_reweighted_line('D1', bins=bins)
+        np.testing.assert_allclose(fes.get_data()['energy'], line.get_data()['energy'])
+
+        data = pd.concat([t.get_data() for t in self.landscape.trajectories.values()])
+        stamps = [0] + [i * data['time'].max() / 4 for i in range(1, 5)]
+        fractions = []
+        for start, end in zip(stamps[:-1], stamps[1:]):
+            block = data.query('time > @start and time <= @end') if start else data.query('time <= @end')
+            counts = np.histogram(block['D1'], bins=bins, weights=block['weight'])[0]
+            fractions.append(counts / counts.sum())
+        fraction = np.histogram(data['D1'], bins=bins, weights=data['weight'])[0]
+        fraction = fraction / fraction.sum()
+        relative_err = np.std(fractions, axis=0, ddof=1) / 2 / fraction
+        np.testing.assert_allclose(fes.get_data()['energy_err'], Kb * 298 * relative_err)
+
+    def test_reweighted_surface_with_bootstrap_error(self):
+        """
+        checking that the bootstrap errors are reproducible with a seed, are the same when the resamples are shared
+        between workers
+        """
+        surface = self.landscape.get_reweighted_surface_with_error(['D1', 'CM1'], bins=[10, 12], seed=1)
+        data = surface.get_data()
+        self.assertEqual(data.shape[0], 120)
+        self.assertTrue((data.loc[np.isfinite(data['energy']), 'energy_err'] >= 0).all())
+        pd.testing.assert_frame_equal(
+            self.landscape.get_reweighted_surface_with_error(['D1', 'CM1'], bins=[10, 12], seed=1).get_data(), data)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            shared = self.landscape.get_reweighted_surface_with_error(['D1', 'CM1'], bins=[10, 12], seed=1,
+                                                                      executor=executor)
+        pd.testing.assert_frame_equal(shared.get_data(), data)
+
+        with self.assertRaises(ValueError):
+            self.landscape.get_reweighted_line_with_error('D1', bins=10, error='jackknife')
+
+    def test_reweighted_histogram_projections(self):
+        """
+        checking that the lines and surfaces projected out of a reweighted histogram over four cvs are the same as
+        reweighting over those cvs directly
+        """
+        cvs = ['D1', 'CM1', 'CM2', 'CM3']
+        histogram = self.landscape.get_reweighted_histogram(cvs, bins=12, conditions='D1 < 6')
+        self.assertEqual(type(histogram), FreeEnergyHistogram)
+        self.assertLess(histogram.n_occupied, 12**4)
+        self.assertEqual(histogram.get_data().shape[0], histogram.n_occupied)
+
+        surface = histogram.get_surface(['D1', 'CM2'])
+        expected = self.landscape.get_reweighted_surface(['D1', 'CM2'], bins=[histogram.edges[0], histogram.edges[2]],
+                                                         conditions='D1 < 6')
+        np.testing.assert_allclose(surface.get_data()['population'], expected.get_data()['population'], atol=1e-12)
+
+        line = histogram.get_line('CM3')
+        expected = self.landscape.get_reweighted_line('CM3', bins=histogram.edges[3], conditions='D1 < 6')
+        np.testing.assert_allclose(line.get_data()['population'], expected.get_data()['population'], atol=1e-12)
+
+    def test_reweighted_line_kde(self):
+        """
+        checking that the binned FFT kde matches a weighted gaussian kde summed directly over the frames
+        """
+        line = self.landscape.get_reweighted_line('CM1', bins=300, method='kde', bandwidth=0.1).get_data()
+        data = pd.concat([t.get_data() for t in self.landscape.trajectories.values()])
+        grid = line['CM1'].to_numpy()
+        direct = (np.exp(-0.5 * ((grid[:, None] - data['CM1'].to_numpy()[None, :]) / 0.1)**2)
+                  @ data['weight'].to_numpy())
+        direct = direct / direct.sum() / (grid[1] - grid[0])
+        kept = direct > 1e-3 * direct.max()
+        np.testing.assert_allclose(line['population'][kept], direct[kept], rtol=0.02)
+
+        with self.assertRaises(ValueError):
+            self.landscape.get_reweighted_line('CM1', bins=[0, 1, 2], method='kde')
+        with self.assertRaises(ValueError):
+            self.landscape.get_reweighted_line('CM1', bins=1, method='kde')
+        with self.assertRaises(ValueError):
+            self.landscape.get_reweighted_line('CM1', bins=300, method='kde', conditions='CM1 == 0')
+
+    def test_reweighted_surface_kde(self):
+        """
+        checking that the kde surface is on the grid asked for and is a normalised density
+        """
+        surface = self.landscape.get_reweighted_surface(['D1', 'CM1'], bins=[50, 80], method='kde').get_data()
+        self.assertEqual(surface.shape[0], 50 * 80)
+        self.assertEqual(surface.columns.to_list()[:2], ['D1', 'CM1'])
+        spacing = np.diff(np.sort(surface['D1'].unique()))[0] * np.diff(np.sort(surface['CM1'].unique()))[0]
+        self.assertAlmostEqual(surface['population'].sum() * spacing, 1)
+
     def test_bulk_add_trajectories_alternate_constructor_opes_walker_err(self):
         """
         testing bulk adding trajectories to a free energy line
@@ -730,6 +1330,137 @@ class TestFreeEnergySpace(unittest.TestCase):
         self.assertTrue(shape.n_walker == 8)
 
 
+class TestHillsFile(unittest.TestCase):
+
+    def test_hills_file_attributes(self):
+        """
+        checking that the hills file attributes match the ones given to the free energy space
+        """
+        hills = HillsFile("./test_trajectories/ndi_na_binding/HILLS")
+        self.assertEqual(hills.cvs, ['D1', 'CM1'])
+        self.assertEqual(hills.n_walker, 8)
+        self.assertEqual(hills.n_timesteps, 2979)
+        self.assertEqual(hills.sigmas, {'D1': 0.2, 'CM1': 0.2})
+        self.assertTrue(hills.opes is False)
+        self.assertTrue(HillsFile("./test_trajectories/ndi_single_opes/Kernels.data").opes is True)
+
+    def test_bias_exchange_parses_each_file_once(self):
+        """
+        checking that each hills file of a bias-exchange simulation is only parsed once
+        """
+        hills = glob("./test_trajectories/ndi_bias_exchange/HILLS.*")
+        with mock.patch.object(HillsFile, '_read_file', side_effect=HillsFile._read_file) as read_file:
+            landscape = FreeEnergySpace(hills)
+        self.assertEqual(read_file.call_count, 4)
+        self.assertTrue(landscape.opes is False)
+        self.assertEqual(sorted(landscape.cvs), ['CM1', 'CM2', 'CM3', 'D1'])
+
+    def test_hills_read_restarted(self):
+        """
+        checking that a hills file with a new header from a restart gives the same hills as the file without it
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            lines = open("./test_trajectories/ndi_na_binding/HILLS").read().splitlines(keepends=True)
+            file = folder + "/HILLS"
+            with open(file, "w") as f:
+                f.write("".join(lines[:4003] + lines[:3] + lines[4003:]))
+            pd.testing.assert_frame_equal(HillsFile(file).get_data(),
+                                          HillsFile("./test_trajectories/ndi_na_binding/HILLS").get_data())
+
+    def test_hills_refresh(self):
+        """
+        checking that refreshing a space as plumed appends to the hills file gives the same attributes as reading the
+        whole file
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            text = open("./test_trajectories/ndi_na_binding/HILLS").read()
+            file = folder + "/HILLS"
+            split = text.index("\n", len(text) // 2) + 20
+            with open(file, "w") as f:
+                f.write(text[:split])
+            landscape = FreeEnergySpace(file)
+            with open(file, "a") as f:
+                f.write(text[split:])
+            landscape.refresh()
+            full_landscape = FreeEnergySpace(file)
+            pd.testing.assert_frame_equal(landscape.get_data(), full_landscape.get_data())
+            self.assertEqual(landscape.n_walker, 8)
+            self.assertEqual(landscape.n_timesteps, 2979)
+            self.assertEqual(landscape.max_time, full_landscape.max_time)
+            self.assertEqual(landscape.dt, full_landscape.dt)
+
+            with open(file, "w") as f:
+                f.write(text.rstrip("\n"))
+            self.assertEqual(HillsFile(file).get_data().shape[0], full_landscape.get_data().shape[0])
+
+            # hills plumed appends after the size is measured are left for refresh
+            getsize = os.path.getsize
+
+            def append_after_measuring(path):
+                size = getsize(path)
+                if path == file and size == split:
+                    with open(file, "a") as f:
+                        f.write(text[split:])
+                return size
+
+            with open(file, "w") as f:
+                f.write(text[:split])
+            with mock.patch("os.path.getsize", side_effect=append_after_measuring):
+                hills_file = HillsFile(file)
+            self.assertEqual(os.path.getsize(file), len(text))
+            hills_file.refresh()
+            pd.testing.assert_frame_equal(hills_file.get_data(), HillsFile(file).get_data())
+
+
+class TestOpesKernels(unittest.TestCase):
+
+    kernels = OpesKernels("./test_trajectories/ndi_single_opes/Kernels.data")
+    colvar = pd.DataFrame(pl.read_as_pandas("./test_trajectories/ndi_single_opes/COLVAR.0"))
+
+    def test_kernels_attributes(self):
+        """
+        checking that the SET lines are read, and that compressing the kernels gives the number of kernels and zed that
+        opes printed to the colvar file at the end of the run
+        """
+        self.assertEqual(self.kernels.cvs, ['D1', 'CM1'])
+        self.assertEqual(self.kernels.biasfactor, 5)
+        self.assertEqual(self.kernels.epsilon, 7.144204020042234e-14)
+        self.assertEqual(self.kernels.kernel_cutoff, 7.780731315308816)
+        self.assertEqual(self.kernels.n_kernels, self.colvar['opes.nker'].iloc[-1])
+        self.assertAlmostEqual(self.kernels.zed, self.colvar['opes.zed'].iloc[-1], places=6)
+
+    def test_kernels_bias(self):
+        """
+        checking that the bias from the kernels deposited before a step is the bias opes printed at that step
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            lines = open("./test_trajectories/ndi_single_opes/Kernels.data").readlines()
+            file = folder + "/Kernels.data"
+            with open(file, "w") as f:
+                f.write("".join(lines[:6 + 1924]))
+            bias = OpesKernels(file).get_bias(self.colvar[self.colvar['time'] == 1925])
+            self.assertAlmostEqual(bias[0], self.colvar.loc[self.colvar['time'] == 1925, 'opes.bias'].iloc[0], places=3)
+
+    def test_opes_fes(self):
+        """
+        checking that the fes on a grid, which only evaluates the kernels near each grid point, is the same as
+        evaluating the bias at each point, and that the space gives it as a surface
+        """
+        fes = self.kernels.get_fes(bins=[40, 60], ranges={'D1': (0, 2.5)})
+        self.assertEqual(fes.shape[0], 2400)
+        self.assertEqual(fes['D1'].min(), 0)
+        self.assertEqual(fes['energy'].min(), 0)
+        np.testing.assert_allclose(fes['bias'], self.kernels.get_bias(fes))
+
+        landscape = FreeEnergySpace("./test_trajectories/ndi_single_opes/Kernels.data")
+        surface = landscape.get_opes_fes(bins=[40, 60], ranges={'D1': (0, 2.5)})
+        self.assertTrue(type(surface) == FreeEnergySurface)
+        self.assertEqual(surface.cvs, ['D1', 'CM1'])
+        np.testing.assert_allclose(surface.get_data()['energy'], fes['energy'])
+        with self.assertRaises(ValueError):
+            FreeEnergySpace("./test_trajectories/ndi_na_binding/HILLS").get_opes_fes()
+
+
 class TestFreeEnergySpaceBiasExchange(unittest.TestCase):
 
     hills = ['./test_trajectories/ndi_bias_exchange/HILLS.0',
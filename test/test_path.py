@@ -2,7 +2,7 @@ import unittest
 import numpy as np
 import pandas as pd
 from analytics.metadynamics.path_analysis import Path
-from analytics.metadynamics.free_energy import FreeEnergySpace
+from analytics.metadynamics.free_energy import FreeEnergySpace, FreeEnergySurface
 from analytics.metadynamics.path_analysis import SurfacePath
 
 
@@ -43,3 +43,30 @@ class TestPath(unittest.TestCase):
         forces = path._get_surface_forces(index=5)
 
         self.assertTrue(type(forces) == np.ndarray)
+        path_forces = path._get_path_forces()
+        self.assertEqual(path_forces.shape, (path.get_data().shape[0], 2))
+        for i in range(0, path_forces.shape[0]):
+            np.testing.assert_array_equal(path_forces[i], path._get_surface_forces(index=i))
+
+    def test_optimise_string(self):
+
+        x, y = np.meshgrid(np.linspace(-1.5, 1.5, 61), np.linspace(-1, 1.5, 51), indexing='ij')
+        data = pd.DataFrame({'CM2': x.ravel(), 'CM3': y.ravel(), 'energy': ((x**2 - 1)**2 + 2 * y**2).ravel()})
+        surface = FreeEnergySurface(data)
+
+        path = SurfacePath.from_points([[-1.2, 0.3], [0, 1], [1.1, -0.2]], n_steps=30, cvs=['CM2', 'CM3'],
+                                       shape=surface)
+        self.assertEqual(path.n_iterations, 0)
+        self.assertFalse(path.converged)
+        path.optimise()
+        self.assertTrue(path.converged)
+        self.assertGreater(path.n_iterations, 0)
+        profile = path.get_energy_profile()
+        self.assertLess(profile['CM3'].abs().max(), 0.01)
+        np.testing.assert_allclose(profile[['CM2', 'CM3']].iloc[[0, -1]], [[-1, 0], [1, 0]], atol=0.01)
+        self.assertAlmostEqual(path.get_barrier(), 1, places=2)
+        np.testing.assert_allclose(np.diff(profile['arc_length']), profile['arc_length'].iloc[-1] / 30, rtol=1e-6)
+
+        swapped = SurfacePath.from_points([[0.3, -1.2], [1, 0], [-0.2, 1.1]], n_steps=30, cvs=['CM3', 'CM2'],
+                                          shape=surface).optimise()
+        np.testing.assert_allclose(swapped.get_energy_profile()[['CM2', 'CM3']], profile[['CM2', 'CM3']], atol=1e-3)
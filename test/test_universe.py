@@ -1,7 +1,10 @@
 import unittest
 import tracemalloc
+import tempfile
+import numpy as np
 from analytics.core.universe import Universe
-from analytics.metadynamics.free_energy import FreeEnergySpace
+from analytics.metadynamics.free_energy import FreeEnergySpace, MetaTrajectory
+from analytics.laws_and_constants import Kb
 tracemalloc.start()
 
 
@@ -24,3 +27,53 @@ class TestUniverse(unittest.TestCase):
         my_universe = Universe(fes=landscape)
         self.assertTrue(my_universe._fes == [landscape])
 
+    def test_combined_line_matches_single_space(self):
+        """
+        testing that combining a single space gives the same line as reweighting it
+        :return:
+        """
+        landscape = FreeEnergySpace.from_standard_directory("./test_trajectories/ndi_na_binding/",
+                                                            colvar_string_matcher="COLVAR_REWEIGHT.")
+        my_universe = Universe(fes=landscape)
+        line = my_universe.get_combined_line('D1', bins=[0, 1, 2, 3, 5, 7])
+        expected = landscape.get_reweighted_line('D1', bins=[0, 1, 2, 3, 5, 7])
+        np.testing.assert_allclose(line.get_data()['population'], expected.get_data()['population'])
+        with self.assertRaises(ValueError):
+            my_universe.get_combined_line('D1', temperature=320)
+
+    def test_multi_temperature_mbar(self):
+        """
+        testing that harmonic oscillators sampled at two temperatures are combined into the right free energies, and
+        that solving again starts from the last solution
+        :return:
+        """
+        rng = np.random.default_rng(0)
+        force_constant = 10
+        with tempfile.TemporaryDirectory() as folder:
+            spaces = []
+            for walker, temperature in enumerate([300, 400]):
+                x = rng.normal(0, np.sqrt(Kb * temperature / force_constant), 20000)
+                file = f"{folder}/COLVAR.{walker}"
+                with open(file, "w") as f:
+                    f.write("#! FIELDS time x ene metad.bias metad.rct metad.rbias\n")
+                    f.writelines(f"{i} {v} {0.5 * force_constant * v**2} 0 0 0\n" for i, v in enumerate(x))
+                space = FreeEnergySpace(temperature=temperature)
+                space.add_metad_trajectory(MetaTrajectory(file, temperature=temperature))
+                spaces.append(space)
+
+            my_universe = Universe(fes=spaces)
+            free_energies = my_universe.get_state_free_energies(energy_column='ene')
+            self.assertAlmostEqual(free_energies[1], -0.5 * np.log(400 / 300), places=2)
+            my_universe.get_state_free_energies(energy_column='ene')
+            self.assertEqual(my_universe._mbar_iterations, 0)
+
+            replaced = FreeEnergySpace(temperature=400)
+            replaced.add_metad_trajectory(MetaTrajectory(f"{folder}/COLVAR.1", temperature=400))
+            my_universe._fes[1] = replaced
+            np.testing.assert_allclose(my_universe.get_state_free_energies(energy_column='ene'), free_energies)
+            self.assertGreater(my_universe._mbar_iterations, 0)
+
+            line = my_universe.get_combined_line('x', bins=40, temperature=350, energy_column='ene').get_data()
+            std = np.sqrt(Kb * 350 / force_constant)
+            density = np.exp(-0.5 * (line['x'] / std)**2) / np.sqrt(2 * np.pi) / std
+            np.testing.assert_allclose(line['population'], density, atol=0.03)